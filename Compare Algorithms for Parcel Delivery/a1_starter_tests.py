@@ -1,10 +1,21 @@
 import pytest
 from typing import Dict
 from distance_map import DistanceMap
-from domain import Truck, Parcel, Fleet
-from scheduler import GreedyScheduler
+from domain import Truck, Parcel, Fleet, ParcelTable, TruckTable
+from scheduler import GreedyScheduler, RandomScheduler, DistanceScheduler, \
+    BinPackingScheduler, LNSScheduler
 from container import PriorityQueue, _shorter
-from experiment import SchedulingExperiment
+from experiment import SchedulingExperiment, read_parcels, iter_parcels, \
+    read_trucks, read_distance_map
+from truck_index import TruckIndex
+from route_optimizer import optimize_routes, improve_route, _two_opt, \
+    _or_opt, _tour_length
+from partition import PartitionedScheduler
+from online import OnlineScheduler
+from ingest import IngestPipeline, serve_socket, tail_file
+from generator import generate
+from instrument import Profiler
+from benchmark import benchmark_pipeline, find_regressions
 
 # This variable is used in the special pytest test case defined by function
 # test_experiment below.  The variable defines a single scheduling experiment
@@ -31,6 +42,27 @@ test_arguments = [
          'avg_fullness': 100,
          'unscheduled': 0
      }),
+    ('1-small-compact',
+     {
+         'depot_location': 'Toronto',
+         'parcel_file': 'data/parcel-data-small.txt',
+         'truck_file': 'data/truck-data-small.txt',
+         'map_file': 'data/map-data.txt',
+         'algorithm': 'greedy',
+         'parcel_priority': 'volume',
+         'parcel_order': 'non-decreasing',
+         'truck_order': 'non-decreasing',
+         'verbose': 'false',
+         'compact': True
+     },
+     {
+         'fleet': 3,
+         'unused_trucks': 0,
+         'unused_space': 0,
+         'avg_distance': 192.7,
+         'avg_fullness': 100,
+         'unscheduled': 0
+     }),
     # You can add additional test cases here!
     # Write these in the format:
     # (<test_id>, <config dictionary>, <expected_stats dictionary>)
@@ -47,6 +79,25 @@ def test_distance_map_basic() -> None:
     assert m.distance('Montreal', 'Toronto') == 4
 
 
+def test_distance_map_freeze() -> None:
+    """Test that a frozen DistanceMap gives the same distances as before it
+    was frozen, and is unfrozen by adding another distance."""
+    m = DistanceMap()
+    m.add_distance('Toronto', 'Hamilton', 9)
+    m.add_distance('Hamilton', 'Toronto', 7)
+    m.add_distance('Toronto', 'Beijing', 10, 11)
+    pairs = [(a, b) for a in ['Toronto', 'Hamilton', 'Beijing', 'Paris']
+             for b in ['Toronto', 'Hamilton', 'Beijing', 'Paris']]
+    before = [m.distance(a, b) for a, b in pairs]
+    m.freeze()
+    assert m.is_frozen()
+    assert [m.distance(a, b) for a, b in pairs] == before
+    assert m.route_distance(['Toronto', 'Hamilton', 'Toronto']) == 16
+    m.add_distance('Paris', 'Toronto', 5)
+    assert not m.is_frozen()
+    assert m.distance('Toronto', 'Paris') == 5
+
+
 def test_num_trucks_doctest() -> None:
     """Test the doctest provided for Fleet.num_trucks"""
     f = Fleet()
@@ -155,6 +206,53 @@ def test_average_distance_travelled_doctest() -> None:
     assert f.average_distance_travelled(m) == 18.0
 
 
+def test_fleet_stats_matches_methods() -> None:
+    """Test that Fleet.stats agrees with the individual Fleet methods."""
+    f = Fleet()
+    t1 = Truck(1, 10, 'Toronto')
+    t2 = Truck(2, 20, 'Toronto')
+    t3 = Truck(3, 30, 'Toronto')
+    for t in [t1, t2, t3]:
+        f.add_truck(t)
+    assert t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton')) is True
+    assert t2.pack(Parcel(2, 7, 'Toronto', 'Hamilton')) is True
+    assert t2.pack(Parcel(3, 3, 'Toronto', 'Beijing')) is True
+    m = DistanceMap()
+    m.add_distance('Toronto', 'Hamilton', 9)
+    m.add_distance('Toronto', 'Beijing', 10, 11)
+    m.add_distance('Hamilton', 'Beijing', 4)
+    stats = f.stats(m)
+    assert stats['fleet'] == f.num_trucks()
+    assert stats['nonempty_trucks'] == f.num_nonempty_trucks()
+    assert stats['unused_space'] == f.total_unused_space()
+    assert stats['avg_fullness'] == pytest.approx(f.average_fullness())
+    assert stats['total_distance'] == f.total_distance_travelled(m)
+    assert stats['avg_distance'] == pytest.approx(
+        f.average_distance_travelled(m))
+
+
+def test_fleet_snapshot_restore() -> None:
+    """Test that restoring a fleet snapshot undoes scheduling, for fleets of
+    Truck objects and fleets backed by a TruckTable."""
+    table = TruckTable()
+    for i in range(3):
+        table.add(i, 10, 'York')
+    trucks = Fleet()
+    for i in range(3):
+        trucks.add_truck(Truck(i, 10, 'York'))
+    for f in [trucks, Fleet(table)]:
+        assert f.trucks[0].pack(Parcel(1, 4, 'York', 'London')) is True
+        snapshot = f.snapshot()
+        assert f.trucks[0].pack(Parcel(2, 3, 'York', 'Guelph')) is True
+        assert f.trucks[2].pack(Parcel(3, 3, 'York', 'Guelph')) is True
+        f.restore(snapshot)
+        assert [t.left_capacity for t in f.trucks] == [6, 10, 10]
+        assert [t.route for t in f.trucks] == [['York', 'London', 'York'],
+                                               ['York', 'York'],
+                                               ['York', 'York']]
+        assert f.parcel_allocations() == {0: [1], 1: [], 2: []}
+
+
 def test_priority_queue_is_empty_doctest() -> None:
     """Test the doctest provided for PriorityQueue.is_empty"""
     pq = PriorityQueue(str.__lt__)
@@ -178,6 +276,70 @@ def test_priority_queue_add_remove_doctest() -> None:
     assert pq.remove() == 'monalisa'
 
 
+def test_priority_queue_key_fifo_ties() -> None:
+    """Test that a PriorityQueue with a key function removes items in the
+    same order as one without, including FIFO order among ties."""
+    words = ['fred', 'arju', 'monalisa', 'hat', 'bob', 'lisa', 'jo']
+    pq1 = PriorityQueue(_shorter)
+    pq2 = PriorityQueue(_shorter, len)
+    for word in words:
+        pq1.add(word)
+    pq2.add_all(words)
+    order1 = [pq1.remove() for _ in words]
+    order2 = [pq2.remove() for _ in words]
+    assert order1 == order2 == ['jo', 'hat', 'bob', 'fred', 'arju', 'lisa',
+                                'monalisa']
+
+
+def test_truck_index_prefers_destination() -> None:
+    """Test that TruckIndex prefers a truck already going to the parcel's
+    destination, and otherwise the truck with the least space that fits."""
+    t1 = Truck(1, 30, 'York')
+    t2 = Truck(2, 20, 'York')
+    t3 = Truck(3, 50, 'York')
+    index = TruckIndex([t1, t2, t3])
+    assert index.pack(t3, Parcel(1, 10, 'York', 'London')) is True
+    assert index.best_truck(Parcel(2, 5, 'York', 'London')) is t3
+    assert index.best_truck(Parcel(3, 5, 'York', 'Hamilton')) is t2
+    assert index.best_truck(Parcel(4, 45, 'York', 'Hamilton')) is None
+
+    index = TruckIndex([t1, t2], largest_first=True)
+    assert index.best_truck(Parcel(5, 5, 'York', 'Hamilton')) is t1
+
+
+def test_random_scheduler_seeded() -> None:
+    """Test that RandomScheduler with the same seed makes the same choices,
+    and leaves the list of parcels unchanged."""
+    parcels = [Parcel(i, i % 5 + 1, 'York', 'London') for i in range(30)]
+    original = list(parcels)
+    allocations = []
+    for _ in range(2):
+        f = Fleet()
+        for i in range(6):
+            f.add_truck(Truck(i, 15, 'York'))
+        RandomScheduler('42-0').schedule(parcels, f.trucks)
+        allocations.append(f.parcel_allocations())
+    assert allocations[0] == allocations[1]
+    assert parcels == original
+
+
+def test_random_scheduler_when_trucks_run_out() -> None:
+    """Test that RandomScheduler leaves a parcel unscheduled only if it fits
+    on no truck, when there is far too little room for every parcel."""
+    parcels = [Parcel(i, i % 7 + 1, 'York', 'London') for i in range(500)]
+    by_id = {p.parcel_id: p for p in parcels}
+    f = Fleet()
+    for i in range(10):
+        f.add_truck(Truck(i, 10 + i, 'York'))
+    left = RandomScheduler(3).schedule(parcels, f.trucks)
+    ids = [i for t in f.trucks for i in t.parcels_id]
+    assert sorted(ids + [p.parcel_id for p in left]) == sorted(by_id)
+    for t in f.trucks:
+        assert t.left_capacity == t.total_capacity - \
+            sum(by_id[i].volume for i in t.parcels_id)
+        assert all(p.volume > t.left_capacity for p in left)
+
+
 def test_greedy_scheduler_example() -> None:
     """Test GreedyScheduler on the example provided."""
     p17 = Parcel(17, 25, 'York', 'Toronto')
@@ -222,6 +384,679 @@ def test_greedy_scheduler_example() -> None:
     assert truck_parcels[3] == [21, 13]
 
 
+def test_rows_have_no_dict() -> None:
+    """Test that parcels, trucks and the row views of tables have no
+    per-object __dict__."""
+    table = ParcelTable()
+    table.add(1, 5, 'York', 'London')
+    fleet = read_trucks('data/demo-truck-data.txt', 'Toronto', True)
+    for obj in [Parcel(1, 5, 'York', 'London'), Truck(1, 10, 'York'),
+                table[0], fleet.trucks[0]]:
+        assert not hasattr(obj, '__dict__')
+
+
+def test_greedy_scheduler_tables_match_lists() -> None:
+    """Test that GreedyScheduler packs a ParcelTable onto a TruckTable
+    exactly as it packs the same parcels onto Truck objects."""
+    cities = ['London', 'Hamilton', 'Guelph', 'York']
+    parcels = [Parcel(i, (i * 7) % 13 + 1, 'York', cities[i % 4])
+               for i in range(40)]
+    table = ParcelTable()
+    for p in parcels:
+        table.add(p.parcel_id, p.volume, p.source, p.destination)
+    for priority in ['volume', 'destination']:
+        for order in ['non-decreasing', 'non-increasing']:
+            config = {'parcel_priority': priority, 'parcel_order': order,
+                      'truck_order': 'non-decreasing'}
+            trucks = [Truck(i, 20 + i, 'York') for i in range(8)]
+            truck_table = TruckTable()
+            for i in range(8):
+                truck_table.add(i, 20 + i, 'York')
+            left1 = GreedyScheduler(config).schedule(parcels, trucks)
+            left2 = GreedyScheduler(config).schedule(table, list(truck_table))
+            assert [p.parcel_id for p in left1] == \
+                [p.parcel_id for p in left2]
+            assert [t.route for t in trucks] == truck_table.routes
+            assert [t.parcels_id for t in trucks] == truck_table.parcels_ids
+
+
+def test_distance_scheduler_shortens_routes() -> None:
+    """Test that DistanceScheduler schedules the same parcels as
+    GreedyScheduler on the demo data, with less total distance."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing'}
+    fleets = []
+    for scheduler in [GreedyScheduler(config),
+                      DistanceScheduler(config, dmap)]:
+        fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+        left = scheduler.schedule(parcels, fleet.trucks)
+        fleets.append((fleet, sorted(p.parcel_id for p in left)))
+    (greedy, left1), (distance, left2) = fleets
+    assert left1 == left2
+    assert distance.total_distance_travelled(dmap) < \
+        greedy.total_distance_travelled(dmap)
+    for t in distance.trucks:
+        assert t.left_capacity >= 0
+        assert t.route[0] == t.route[-1] == 'Toronto'
+
+
+def test_lns_scheduler_improves_distance() -> None:
+    """Test that LNSScheduler keeps every parcel it started with, keeps
+    the trucks consistent, and travels no further than DistanceScheduler."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing'}
+    start = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    DistanceScheduler(config, dmap).schedule(parcels, start.trucks)
+    fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    scheduler = LNSScheduler(config, dmap, seed=0, max_rounds=50)
+    left = scheduler.schedule(parcels, fleet.trucks)
+    assert fleet.total_distance_travelled(dmap) <= \
+        start.total_distance_travelled(dmap)
+    volumes = {p.parcel_id: p for p in parcels}
+    ids = [i for t in fleet.trucks for i in t.parcels_id]
+    assert sorted(ids + [p.parcel_id for p in left]) == sorted(volumes)
+    for t in fleet.trucks:
+        assert t.left_capacity == t.total_capacity - \
+            sum(volumes[i].volume for i in t.parcels_id) >= 0
+        assert set(t.route[1:-1]) == \
+            {volumes[i].destination for i in t.parcels_id} - {'Toronto'}
+
+
+def test_bound_fleet_tracks_distance() -> None:
+    """Test that a fleet bound to a distance map keeps the same distances as
+    measuring every route, whichever scheduler packs it, in both storage
+    layouts, and after restoring a snapshot."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    config = {'parcel_priority': 'destination',
+              'parcel_order': 'non-decreasing',
+              'truck_order': 'non-increasing'}
+    schedulers = [RandomScheduler(0), GreedyScheduler(config),
+                  DistanceScheduler(config, dmap),
+                  LNSScheduler(config, dmap, seed=0, max_rounds=20)]
+    for compact in (False, True):
+        for scheduler in schedulers:
+            fleet = read_trucks('data/demo-truck-data.txt', 'Toronto', compact)
+            fleet.bind(dmap)
+            snapshot = fleet.snapshot()
+            scheduler.schedule(parcels, fleet.trucks)
+            optimize_routes(fleet, dmap)
+            expected = sum(dmap.route_distance(t.route) for t in fleet.trucks
+                           if t.route[0] != t.route[1])
+            assert fleet.total_distance_travelled(dmap) == expected
+            assert fleet.stats(dmap)['total_distance'] == expected
+            assert [t.route_length() for t in fleet.trucks] == \
+                [dmap.route_distance(t.route) if t.route[0] != t.route[1]
+                 else 0 for t in fleet.trucks]
+            fleet.restore(snapshot)
+            assert fleet.total_distance_travelled(dmap) == 0
+
+        # Two trucks with the same cities get their routes from one memoized
+        # exact route; packing one of them must not change the other.
+        fleet = read_trucks('data/demo-truck-data.txt', 'Toronto', compact)
+        fleet.bind(dmap)
+        for t in fleet.trucks[:2]:
+            for i, city in enumerate(['Hamilton', 'Ottawa', 'Guelph']):
+                t.pack(Parcel(i, 1, 'Toronto', city))
+        optimize_routes(fleet, dmap)
+        assert fleet.trucks[0].route == fleet.trucks[1].route
+        fleet.trucks[0].pack(Parcel(3, 1, 'Toronto', 'Belleville'))
+        assert 'Belleville' not in fleet.trucks[1].route
+        assert fleet.total_distance_travelled(dmap) == \
+            sum(dmap.route_distance(t.route) for t in fleet.trucks
+                if t.route[0] != t.route[1])
+
+
+def test_partitioned_scheduler_workers_agree() -> None:
+    """Test that PartitionedScheduler accounts for every parcel, and that it
+    schedules the same way in worker processes as in this process."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    fleets = []
+    for workers in [1, 2]:
+        fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+        scheduler = PartitionedScheduler(GreedyScheduler(config), dmap, 3,
+                                         workers)
+        left = scheduler.schedule(parcels, fleet.trucks)
+        ids = [i for t in fleet.trucks for i in t.parcels_id]
+        assert sorted(ids + [p.parcel_id for p in left]) == \
+            sorted(p.parcel_id for p in parcels)
+        fleets.append([(t.route, t.left_capacity, t.parcels_id)
+                       for t in fleet.trucks])
+    assert fleets[0] == fleets[1]
+
+
+def test_partitioned_random_scheduler_workers_agree() -> None:
+    """Test that a seeded PartitionedScheduler around a RandomScheduler makes
+    the same random choices in worker processes as in this process."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    fleets = []
+    for workers in [1, 2, 1]:
+        fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+        scheduler = PartitionedScheduler(RandomScheduler(), dmap, 3,
+                                         workers, seed=5)
+        scheduler.schedule(parcels, fleet.trucks)
+        fleets.append([(t.route, t.left_capacity, t.parcels_id)
+                       for t in fleet.trucks])
+    assert fleets[0] == fleets[1] == fleets[2]
+
+
+def test_online_scheduler_matches_greedy() -> None:
+    """Test that submitting parcels in priority order to an OnlineScheduler
+    packs them as GreedyScheduler does, and that a closed scheduler refuses
+    parcels."""
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    greedy = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    left = GreedyScheduler(config).schedule(parcels, greedy.trucks)
+    fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    online = OnlineScheduler(fleet)
+    ordered = sorted(parcels, key=lambda p: -p.volume)
+    assert online.submit_many(ordered[:10]) + \
+        [p for p in ordered[10:] if online.submit(p) is None] == left
+    assert fleet.parcel_allocations() == greedy.parcel_allocations()
+    assert [t.route for t in fleet.trucks] == [t.route for t in greedy.trucks]
+    assert online.close() == left
+    with pytest.raises(ValueError):
+        online.submit(parcels[0])
+
+
+def test_ingest_pipeline_matches_batches() -> None:
+    """Test that the ingestion pipeline schedules a parcel file in batches
+    exactly as scheduling the same batches directly does."""
+    import asyncio
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    direct = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    scheduler = GreedyScheduler(config)
+    left = []
+    for batch in iter_parcels('data/demo-parcel-data.txt', 4):
+        left.extend(scheduler.schedule(batch, direct.trucks))
+    fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    pipeline = IngestPipeline(GreedyScheduler(config), fleet.trucks,
+                              queue_size=2, batch_size=4, window=1.0)
+    stats = asyncio.run(pipeline.run(tail_file('data/demo-parcel-data.txt')))
+    assert stats['parcels'] == len(read_parcels('data/demo-parcel-data.txt'))
+    assert stats['unscheduled'] == len(left)
+    assert stats['latency_p50'] <= stats['latency_p99']
+    assert fleet.parcel_allocations() == direct.parcel_allocations()
+
+
+def test_serve_socket_skips_bad_lines() -> None:
+    """Test that serve_socket skips lines that are not parcel data or not
+    UTF-8, and still ends when the client disconnects."""
+    import asyncio
+    import socket
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    async def send() -> None:
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+                break
+            except ConnectionError:
+                await asyncio.sleep(0.01)
+        writer.write(b'1, Toronto, Guelph, 5\nabc, 5, Toronto, Guelph\n'
+                     b'\xff\xfe\n\n2, Toronto, London, 3\n')
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def receive(rejected):
+        client = asyncio.create_task(send())
+        parcels = [p async for p in serve_socket('127.0.0.1', port,
+                                                 rejected=rejected)]
+        await client
+        return parcels
+
+    rejected = []
+    parcels = asyncio.run(asyncio.wait_for(receive(rejected), 10))
+    assert [p.parcel_id for p in parcels] == [1, 2]
+    assert rejected == [b'abc, 5, Toronto, Guelph\n', b'\xff\xfe\n']
+
+
+def test_ingest_pipeline_raises_scheduler_error() -> None:
+    """Test that the ingestion pipeline raises the exception of a failing
+    scheduler instead of waiting forever on a full queue, and that each run
+    reports only its own statistics."""
+    import asyncio
+
+    class Failing(GreedyScheduler):
+        def schedule(self, parcels, trucks, verbose=False):
+            raise RuntimeError('scheduler failed')
+
+    async def many_parcels():
+        for i in range(1000):
+            yield Parcel(i, 1, 'Toronto', 'London')
+
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    fleet = read_trucks('data/demo-truck-data.txt', 'Toronto')
+    pipeline = IngestPipeline(Failing(config), fleet.trucks, queue_size=2,
+                              batch_size=2, window=0.01)
+    with pytest.raises(RuntimeError, match='scheduler failed'):
+        asyncio.run(asyncio.wait_for(pipeline.run(many_parcels()), 10))
+
+    pipeline = IngestPipeline(GreedyScheduler(config), fleet.trucks,
+                              queue_size=2, batch_size=4, window=1.0)
+    first = asyncio.run(pipeline.run(tail_file('data/demo-parcel-data.txt')))
+    second = asyncio.run(pipeline.run(tail_file('data/demo-parcel-data.txt')))
+    assert second['parcels'] == first['parcels']
+    assert second['batches'] == first['batches']
+    assert len(pipeline.unscheduled()) == second['unscheduled']
+
+
+def test_distance_scheduler_matches_scan() -> None:
+    """Test that DistanceScheduler picks the same trucks and places as
+    trying every place in every truck that can hold each parcel would, on a
+    map with shortcuts through other cities."""
+    from random import Random
+    rng = Random(5)
+    cities = ['York'] + [f'City{i}' for i in range(6)]
+    dmap = DistanceMap()
+    for i, a in enumerate(cities):
+        for b in cities[i + 1:]:
+            dmap.add_distance(a, b, rng.randint(1, 30), rng.randint(1, 30))
+    parcels = [Parcel(i, rng.randint(1, 9), 'York', rng.choice(cities[1:]))
+               for i in range(80)]
+    for truck_order in ('non-decreasing', 'non-increasing'):
+        config = {'parcel_priority': 'volume',
+                  'parcel_order': 'non-increasing',
+                  'truck_order': truck_order}
+        sign = -1 if truck_order == 'non-increasing' else 1
+        trucks = [Truck(i, rng.randint(10, 40), 'York') for i in range(12)]
+        expected = [Truck(t.truck_id, t.total_capacity, 'York')
+                    for t in trucks]
+        left = DistanceScheduler(config, dmap).schedule(parcels, trucks)
+        expected_left = []
+        for p in sorted(parcels, key=lambda q: -q.volume):
+            options = []
+            for i, t in enumerate(expected):
+                if t.left_capacity < p.volume:
+                    continue
+                key = (sign * t.left_capacity, i)
+                if p.destination in t.route[1:-1]:
+                    k = t.route.index(p.destination, 1) + 1
+                    options.append((0, key, k))
+                    continue
+                for k in range(1, len(t.route)):
+                    route = t.route[:k] + [p.destination] + t.route[k:]
+                    added = sum(dmap.distance(a, b) if a != b else 0
+                                for a, b in zip(route, route[1:])) - \
+                        sum(dmap.distance(a, b) if a != b else 0
+                            for a, b in zip(t.route, t.route[1:]))
+                    options.append((added, key, k))
+            if options:
+                _, (_, i), k = min(options)
+                expected[i].pack(p, k)
+            else:
+                expected_left.append(p)
+        assert left == expected_left
+        assert [t.route for t in trucks] == [t.route for t in expected]
+        assert [t.parcels_id for t in trucks] == \
+            [t.parcels_id for t in expected]
+
+
+def test_bin_packing_scheduler_matches_scan() -> None:
+    """Test that first fit and best fit decreasing pick the same trucks as a
+    linear scan over the trucks would."""
+    parcels = [Parcel(i, (i * 37) % 23 + 1, 'York', 'London')
+               for i in range(60)]
+    for best_fit in [False, True]:
+        trucks = [Truck(i, 30 + (i * 11) % 17, 'York') for i in range(12)]
+        expected = [Truck(i, 30 + (i * 11) % 17, 'York') for i in range(12)]
+        left = BinPackingScheduler(best_fit).schedule(parcels, trucks)
+        expected_left = []
+        for p in sorted(parcels, key=lambda q: -q.volume):
+            fits = [t for t in expected if t.left_capacity >= p.volume]
+            if best_fit:
+                fits.sort(key=lambda t: t.left_capacity)
+            if fits:
+                fits[0].pack(p)
+            else:
+                expected_left.append(p)
+        assert left == expected_left
+        assert [t.parcels_id for t in trucks] == \
+            [t.parcels_id for t in expected]
+
+
+def test_experiment_profile() -> None:
+    """Test that a profiled experiment records every stage and the work of
+    its scheduler without changing its results, and that an experiment
+    without profiling records nothing."""
+    config = dict(test_arguments[0][1])
+    plain = SchedulingExperiment(config)
+    stats = plain.run()
+    assert plain.profile() == {}
+    profiled = SchedulingExperiment(dict(config, profile=True,
+                                         profile_memory=True))
+    assert profiled.run() == stats
+    profile = profiled.profile()
+    for stage in ('read', 'schedule', 'schedule.order', 'schedule.select',
+                  'stats'):
+        assert profile[f'{stage}_seconds'] >= 0
+        assert profile[f'{stage}_peak_bytes'] > 0
+    assert profile['parcels_placed'] + profile['parcels_unscheduled'] == \
+        profile['index_lookups'] == len(profiled.parcels)
+    assert profile['parcels_unscheduled'] == stats['unscheduled']
+
+
+def test_profiler_accumulates_nested_phases() -> None:
+    """Test that Profiler adds up repeated phases and counters, and names
+    nested phases after the phases they are in."""
+    profiler = Profiler()
+    for _ in range(3):
+        with profiler.phase('schedule'):
+            with profiler.phase('select'):
+                profiler.count('parcels_placed', 2)
+    report = profiler.report()
+    assert report['parcels_placed'] == 6
+    assert report['schedule_seconds'] >= report['schedule.select_seconds']
+    profiler.reset()
+    assert profiler.report() == {}
+
+
+def test_benchmark_pipeline_stages(tmp_path) -> None:
+    """Test that benchmark_pipeline times every stage at every size, and that
+    a run is not flagged as a regression against itself."""
+    rows = benchmark_pipeline([100, 200], str(tmp_path), memory=True)
+    stages = {(row['size'], row['stage']) for row in rows}
+    for n in (100, 200):
+        for stage in ('read_parcels', 'read_trucks', 'read_distance_map',
+                      'schedule:random', 'schedule:greedy',
+                      'schedule:distance', 'schedule:lns', 'schedule:ffd',
+                      'schedule:bfd', 'schedule:partitioned', 'stats',
+                      'compare_algorithms'):
+            assert (n, stage) in stages
+    assert all(row['seconds'] >= 0 and row['peak_bytes'] >= 0
+               for row in rows)
+    assert find_regressions(rows, rows, 0.0, 0.0) == []
+    slower = [dict(row, seconds=row['seconds'] * 2 + 1) for row in rows]
+    assert len(find_regressions(slower, rows, min_seconds=0.0)) == len(rows)
+
+
+def test_compare_algorithms_shares_streamed_parcels(tmp_path,
+                                                   monkeypatch) -> None:
+    """Test that compare_algorithms reads the parcels once, and does not
+    stream them again for each algorithm, when the configuration sets a
+    batch size."""
+    import json
+    import experiment
+    from explore import compare_algorithms
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({
+        'depot_location': 'Toronto',
+        'parcel_file': 'data/demo-parcel-data.txt',
+        'truck_file': 'data/demo-truck-data.txt',
+        'map_file': 'data/map-data.txt', 'batch_size': 4, 'verbose': False}))
+
+    def no_streaming(*args, **kwargs):
+        raise AssertionError('parcels were streamed again')
+
+    monkeypatch.setattr(experiment, 'iter_parcels', no_streaming)
+    results_file = tmp_path / 'results.csv'
+    compare_algorithms(str(config_file), results_file=str(results_file))
+    assert len(results_file.read_text().splitlines()) > 1
+
+
+def test_monte_carlo_random_writes_summary_file(tmp_path) -> None:
+    """Test that monte_carlo_random writes its summary next to the results
+    table by default, or to the given summary file, and that the same base
+    seed gives the same summary."""
+    import json
+    from explore import monte_carlo_random
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({
+        'depot_location': 'Toronto',
+        'parcel_file': 'data/demo-parcel-data.txt',
+        'truck_file': 'data/demo-truck-data.txt',
+        'map_file': 'data/map-data.txt', 'verbose': False}))
+    summary = monte_carlo_random(
+        str(config_file), 3, results_file=str(tmp_path / 'results.csv'))
+    default = tmp_path / 'random-summary.csv'
+    assert default.read_text().startswith('Stat (3 replicates)')
+    summary_file = tmp_path / 'other.csv'
+    assert monte_carlo_random(str(config_file), 3,
+                              summary_file=str(summary_file)) == summary
+    assert summary_file.read_text() == default.read_text()
+
+
+def test_greedy_batch_packing_is_consistent() -> None:
+    """Test that GreedyScheduler in batch packing mode accounts for every
+    parcel, keeps the trucks consistent, and keeps a bound fleet's distance
+    up to date, in both storage layouts."""
+    dmap = read_distance_map('data/map-data.txt')
+    parcels = read_parcels('data/demo-parcel-data.txt')
+    by_id = {p.parcel_id: p for p in parcels}
+    for truck_order in ('non-decreasing', 'non-increasing'):
+        for compact in (False, True):
+            config = {'parcel_priority': 'destination',
+                      'parcel_order': 'non-decreasing',
+                      'truck_order': truck_order, 'batch_packing': True}
+            fleet = read_trucks('data/demo-truck-data.txt', 'Toronto', compact)
+            fleet.bind(dmap)
+            left = GreedyScheduler(config).schedule(parcels, fleet.trucks)
+            ids = [i for t in fleet.trucks for i in t.parcels_id]
+            assert sorted(ids + [p.parcel_id for p in left]) == sorted(by_id)
+            for t in fleet.trucks:
+                assert t.left_capacity == t.total_capacity - \
+                    sum(by_id[i].volume for i in t.parcels_id) >= 0
+                assert set(t.route[1:-1]) == \
+                    {by_id[i].destination for i in t.parcels_id} - {'Toronto'}
+                assert all(a != b for a, b in zip(t.route, t.route[1:]))
+            assert fleet.total_distance_travelled(dmap) == \
+                sum(dmap.route_distance(t.route) for t in fleet.trucks
+                    if t.route[0] != t.route[1])
+
+
+def test_iter_parcels_batches() -> None:
+    """Test that iter_parcels yields the same parcels as read_parcels, in
+    batches of the given size."""
+    parcels = read_parcels('data/parcel-data-small.txt')
+    batches = list(iter_parcels('data/parcel-data-small.txt', 2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    streamed = [p for batch in batches for p in batch]
+    assert [(p.parcel_id, p.volume, p.source, p.destination)
+            for p in streamed] == \
+        [(p.parcel_id, p.volume, p.source, p.destination) for p in parcels]
+    assert parcels[0].source == 'Woodstock'
+
+
+def test_read_parcels_cache(tmp_path) -> None:
+    """Test that parcels and trucks loaded from the cache match the ones
+    parsed from text, and that editing the text file refreshes the cache."""
+    parcel_file = tmp_path / 'parcels.txt'
+    parcel_file.write_text('1, Toronto, Guelph, 10\n2, Ottawa, London, 4\n')
+    truck_file = tmp_path / 'trucks.txt'
+    truck_file.write_text('7, 30\n8, 20\n')
+    for _ in range(2):
+        parcels = read_parcels(str(parcel_file), cache=True)
+        assert [(p.parcel_id, p.volume, p.source, p.destination)
+                for p in parcels] == [(1, 10, 'Toronto', 'Guelph'),
+                                      (2, 4, 'Ottawa', 'London')]
+        fleet = read_trucks(str(truck_file), 'Toronto', cache=True)
+        assert [(t.truck_id, t.total_capacity) for t in fleet.trucks] == \
+            [(7, 30), (8, 20)]
+    parcel_file.write_text('3, Toronto, Guelph, 5\n')
+    parcels = read_parcels(str(parcel_file), cache=True)
+    assert [p.parcel_id for p in parcels] == [3]
+    assert len(list((tmp_path / '.cache').glob('parcels.txt.*'))) == 1
+
+
+def test_optimize_routes_keeps_stops() -> None:
+    """Test that optimizing routes never makes the fleet travel further, and
+    that every truck still visits each of its cities once."""
+    dmap = DistanceMap()
+    cities = ['York', 'London', 'Hamilton', 'Guelph', 'Ottawa', 'Barrie']
+    for i, a in enumerate(cities):
+        for j, b in enumerate(cities):
+            if i < j:
+                dmap.add_distance(a, b, (i * 31 + j * 17) % 23 + 1,
+                                  (j * 13 + i * 7) % 19 + 1)
+    fleet = Fleet()
+    for i in range(3):
+        fleet.add_truck(Truck(i, 100, 'York'))
+    for i in range(30):
+        fleet.trucks[i % 3].pack(Parcel(i, 1, 'York', cities[i * 7 % 6]))
+    before = fleet.total_distance_travelled(dmap)
+    stops = [set(t.route) for t in fleet.trucks]
+    saved = optimize_routes(fleet, dmap)
+    assert fleet.total_distance_travelled(dmap) == before - saved
+    assert saved >= 0
+    for t, cities_visited in zip(fleet.trucks, stops):
+        assert set(t.route) == cities_visited
+        assert t.route[0] == t.route[-1] == 'York'
+        assert len(t.route[1:-1]) == len(set(t.route[1:-1]))
+
+
+def test_improve_route_exact_is_shortest() -> None:
+    """Test that exact routes are no longer than every ordering of their
+    cities, and that trucks with the same cities get equal memoized routes."""
+    from itertools import permutations
+    dmap = DistanceMap()
+    cities = ['York', 'London', 'Hamilton', 'Guelph', 'Ottawa', 'Barrie']
+    for i, a in enumerate(cities):
+        for j, b in enumerate(cities):
+            if i < j:
+                dmap.add_distance(a, b, (i * 31 + j * 17) % 23 + 1,
+                                  (j * 13 + i * 7) % 19 + 1)
+    memo = {}
+    route = improve_route(['York'] + cities[1:] + ['York'], dmap, memo=memo)
+    shortest = min(dmap.route_distance(['York'] + list(p) + ['York'])
+                   for p in permutations(cities[1:]))
+    assert dmap.route_distance(route) == shortest
+    assert improve_route(['York'] + cities[:0:-1] + ['York'], dmap,
+                         memo=memo) == route
+    assert len(memo) == 1
+
+
+def test_improve_route_keeps_route_with_missing_distance() -> None:
+    """Test that a route whose cities are missing a distance is kept as it
+    is, by both the exact and the heuristic solver, rather than reordered to
+    take the missing leg as if it were free."""
+    dmap = DistanceMap()
+    cities = ['T', 'A', 'B', 'C']
+    for i, a in enumerate(cities):
+        for b in cities[i + 1:]:
+            if {a, b} != {'A', 'C'}:
+                dmap.add_distance(a, b, 10)
+    route = ['T', 'A', 'B', 'C', 'T']
+    assert improve_route(route, dmap) == route
+    assert improve_route(route, dmap, exact_threshold=0) == route
+
+
+def test_local_search_measures_moves() -> None:
+    """Test that 2-opt and Or-opt on an asymmetric map return the length of
+    the tour they return, and that no reversal or move of a segment improves
+    the tour they stop at."""
+    from random import Random
+    from time import perf_counter
+    rng = Random(11)
+    n = 25
+    dist = [[0 if a == b else rng.randint(1, 100) for b in range(n)]
+            for a in range(n)]
+    tour = [0] + rng.sample(range(1, n), n - 1) + [0]
+    length = _tour_length(tour, dist)
+    deadline = perf_counter() + 60
+    two, two_length = _two_opt(tour, dist, length, deadline)
+    assert two_length == _tour_length(two, dist) <= length
+    assert sorted(two) == sorted(tour)
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            reversed_tour = two[:i] + two[i:j + 1][::-1] + two[j + 1:]
+            assert _tour_length(reversed_tour, dist) >= two_length
+    moved, moved_length = _or_opt(two, dist, two_length, deadline)
+    assert moved_length == _tour_length(moved, dist) <= two_length
+    assert sorted(moved) == sorted(tour)
+    for size in (1, 2, 3):
+        for i in range(1, n - size + 1):
+            rest = moved[:i] + moved[i + size:]
+            for j in range(1, len(rest)):
+                candidate = rest[:j] + moved[i:i + size] + rest[j:]
+                assert _tour_length(candidate, dist) >= moved_length
+
+
+def test_readers_skip_blank_lines_and_reject_malformed(tmp_path) -> None:
+    """Test that every input reader skips blank lines, and raises a
+    ValueError naming the line number of a malformed line."""
+    parcel_file = tmp_path / 'parcels.txt'
+    parcel_file.write_text('1, A, B, 5\n\n  \n2, A, C, 3\n')
+    assert [p.volume for p in read_parcels(str(parcel_file))] == [5, 3]
+    map_file = tmp_path / 'map.txt'
+    map_file.write_text('\nA, B, 4, 2\n\nA, C, 3\n')
+    assert read_distance_map(str(map_file)).distance('C', 'A') == 3
+    truck_file = tmp_path / 'trucks.txt'
+    truck_file.write_text('1, 10\n\n2, 20\n \n')
+    assert len(read_trucks(str(truck_file), 'A').trucks) == 2
+    parcel_file.write_text('1, A, B, 5\n\n2, A, C, 3\n3, A, C\n')
+    with pytest.raises(ValueError, match='line 4'):
+        read_parcels(str(parcel_file), compact=True)
+    with pytest.raises(ValueError, match='line 4'):
+        list(iter_parcels(str(parcel_file), 2))
+    map_file.write_text('A, B, 4, 2\n\nA, C, three\n')
+    with pytest.raises(ValueError, match='line 3'):
+        read_distance_map(str(map_file))
+    truck_file.write_text('1, 10\n2\n')
+    with pytest.raises(ValueError, match='line 2'):
+        read_trucks(str(truck_file), 'A')
+
+
+def test_read_distance_map_shortest_paths(tmp_path) -> None:
+    """Test that a sparse map is closed under shortest paths, and that the
+    closed map loaded from the cache matches the computed one."""
+    map_file = tmp_path / 'map.txt'
+    map_file.write_text('A, B, 4, 2\nB, C, 3\nC, D, 1\nA, D, 20\n')
+    computed = read_distance_map(str(map_file), shortest_paths=True)
+    assert computed.distance('A', 'D') == 8
+    assert computed.distance('D', 'A') == 6
+    assert read_distance_map(str(map_file)).distance('A', 'C') == -1
+    for _ in range(2):
+        cached = read_distance_map(str(map_file), True, True)
+        assert cached.matrix() == computed.matrix()
+    assert read_distance_map(str(map_file), True).distance('A', 'D') == 20
+    # A closed map keeps its distances only in the matrix, but adding one
+    # more distance keeps the others.
+    computed.add_distance('D', 'E', 7)
+    assert not computed.is_frozen()
+    assert computed.distance('A', 'D') == 8
+    assert computed.distance('E', 'D') == 7
+    computed.freeze()
+    assert computed.route_distance(['A', 'D', 'E']) == 15
+
+
+def test_generate_is_seeded_and_valid(tmp_path) -> None:
+    """Test that generated files are the same for the same seed, that IDs
+    are distinct, and that the generated map covers every parcel route."""
+    files = []
+    for name in ['a', 'b']:
+        paths = [tmp_path / f'{name}-{kind}.txt'
+                 for kind in ['parcels', 'trucks', 'map']]
+        generate(str(paths[0]), str(paths[1]), 500, 20, num_cities=12,
+                 seed=3, map_filename=str(paths[2]), hot_skew=1.5)
+        files.append([path.read_text() for path in paths])
+    assert files[0] == files[1]
+    parcels = read_parcels(str(tmp_path / 'a-parcels.txt'))
+    fleet = read_trucks(str(tmp_path / 'a-trucks.txt'), 'Toronto')
+    dmap = read_distance_map(str(tmp_path / 'a-map.txt'))
+    assert len({p.parcel_id for p in parcels}) == len(parcels) == 500
+    assert len({t.truck_id for t in fleet.trucks}) == 20
+    for p in parcels:
+        assert p.source != p.destination
+        assert p.source == 'Toronto' or p.destination != 'Toronto'
+        assert 5 <= p.volume <= 25
+        assert dmap.distance(p.source, p.destination) > 0
+
+
 ################################################################################
 # The test below uses pytest.mark.parametrize.
 #
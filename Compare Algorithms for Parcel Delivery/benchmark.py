@@ -0,0 +1,370 @@
+from typing import Any, Callable, List, Dict, Optional, Tuple, Union
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+from random import Random
+from time import perf_counter
+from container import PriorityQueue
+from domain import Parcel, Fleet, ParcelTable
+from distance_map import DistanceMap
+from experiment import SchedulingExperiment, read_parcels, read_trucks, \
+    read_distance_map
+from explore import compare_algorithms
+from generator import generate
+from instrument import Profiler, write_json
+from scheduler import _smaller_v, _volume_key
+
+# One measurement of benchmark_pipeline: the number of parcels 'size', the
+# 'stage' measured, its 'seconds', its 'throughput' in parcels per second
+# and, if memory was traced, its 'peak_bytes'.
+Row = Dict[str, Union[int, float, str]]
+
+# The greedy configuration that the other algorithms share.
+_GREEDY = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+           'truck_order': 'non-decreasing'}
+
+# The algorithm configurations timed by benchmark_pipeline, by name, with the
+# largest number of parcels each one runs on.  The LNS scheduler improves its
+# schedule for as long as its time budget allows, so only its construction
+# is timed, with a budget of 0.
+PIPELINE_ALGORITHMS = {
+    'random': ({'algorithm': 'random', 'seed': 0}, 10 ** 6),
+    'greedy': (dict(_GREEDY, algorithm='greedy'), 10 ** 6),
+    'greedy_batch': (dict(_GREEDY, algorithm='greedy',
+                          parcel_priority='destination', batch_packing=True),
+                     10 ** 6),
+    'distance': (dict(_GREEDY, algorithm='distance'), 10 ** 6),
+    'lns': (dict(_GREEDY, algorithm='lns', seed=0, time_budget=0.0),
+            10 ** 6),
+    'ffd': (dict(_GREEDY, algorithm='ffd'), 10 ** 6),
+    'bfd': (dict(_GREEDY, algorithm='bfd'), 10 ** 6),
+    'partitioned': (dict(_GREEDY, algorithm='greedy', partitions=4),
+                    10 ** 6),
+}
+
+
+class _ListPriorityQueue:
+    """The original list-based PriorityQueue, kept only as a baseline for
+    the benchmarks below.
+
+    Adding an item scans the list and inserts into it, so building a queue
+    of n items takes O(n^2) time.
+
+    === Private Attributes ===
+    _queue:
+      The end of the list represents the *front* of the queue, that is,
+      the next item to be removed.
+    _higher_priority:
+      A function that compares two items by their priority.
+    """
+    _queue: List[Any]
+    _higher_priority: Callable[[Any, Any], bool]
+
+    def __init__(self, higher_priority: Callable[[Any, Any], bool]) -> None:
+        """Initialize this to an empty queue ordered by <higher_priority>.
+        """
+        self._queue = []
+        self._higher_priority = higher_priority
+
+    def add(self, item: Any) -> None:
+        """Add <item> to this queue.
+        """
+        if not self._queue:
+            self._queue.append(item)
+            return
+        if self._higher_priority(item, self._queue[-1]):
+            self._queue.append(item)
+            return
+        for i in range(len(self._queue)):
+            if self._higher_priority(self._queue[0], item):
+                self._queue.insert(0, item)
+                return
+            if not self._higher_priority(self._queue[i], item) and not \
+                    self._higher_priority(item, self._queue[i]):
+                self._queue.insert(i, item)
+                return
+            if self._higher_priority(self._queue[i], item) and \
+                    self._higher_priority(item, self._queue[i - 1]):
+                self._queue.insert(i, item)
+                return
+
+    def remove(self) -> Any:
+        """Remove and return the next item from this queue.
+        """
+        return self._queue.pop()
+
+    def is_empty(self) -> bool:
+        """Return True iff this queue is empty.
+        """
+        return not self._queue
+
+
+def _random_parcels(n: int, seed: int = 0) -> List[Parcel]:
+    """Return <n> parcels with random volumes, generated from <seed>.
+    """
+    rng = Random(seed)
+    return [Parcel(i, rng.randint(1, 100), 'Toronto', 'Hamilton')
+            for i in range(n)]
+
+
+def _drain(queue: Any, parcels: List[Parcel]) -> List[Parcel]:
+    """Add every parcel in <parcels> to <queue> one by one, then remove them
+    all and return them in the order they were removed.
+    """
+    for p in parcels:
+        queue.add(p)
+    result = []
+    while not queue.is_empty():
+        result.append(queue.remove())
+    return result
+
+
+def benchmark_priority_queue(sizes: List[int] = None) -> List[Dict]:
+    """Time filling and draining the list-based queue, the heap-based
+    PriorityQueue with a priority function, and the heap-based PriorityQueue
+    with a key function, on random parcels of each size in <sizes>.
+
+    Return one dictionary of timings (in seconds) per size, and check along
+    the way that all three queues remove parcels in the same order.
+    """
+    if sizes is None:
+        sizes = [1000, 5000, 10000]
+    results = []
+    for n in sizes:
+        parcels = _random_parcels(n)
+        row = {'size': n}
+        orders = []
+        for name, queue in [('list', _ListPriorityQueue(_smaller_v)),
+                            ('heap', PriorityQueue(_smaller_v)),
+                            ('heap_key', PriorityQueue(_smaller_v,
+                                                       _volume_key))]:
+            start = perf_counter()
+            orders.append(_drain(queue, parcels))
+            row[name] = perf_counter() - start
+        assert orders[0] == orders[1] == orders[2]
+        results.append(row)
+    return results
+
+
+def _pipeline_config(directory: str, n: int, seed: int,
+                     compact: bool) -> Dict[str, Union[str, bool]]:
+    """Return the configuration of an experiment on <n> random parcels,
+    generated from <seed> in <directory> unless they already are there.
+
+    There is one truck for every 20 parcels, and 50 cities.
+    """
+    stem = os.path.join(directory, f'{n}-{seed}')
+    config = {'depot_location': 'Toronto',
+              'parcel_file': f'{stem}-parcels.txt',
+              'truck_file': f'{stem}-trucks.txt',
+              'map_file': f'{stem}-map.txt',
+              'verbose': False,
+              'compact': compact}
+    if not all(os.path.exists(config[key])
+               for key in ('parcel_file', 'truck_file', 'map_file')):
+        generate(config['parcel_file'], config['truck_file'], n,
+                 max(n // 20, 1), 50, truck_volumes=(200, 500), seed=seed,
+                 map_filename=config['map_file'])
+    return config
+
+
+def _row(n: int, stage: str, seconds: float,
+         peak: Optional[int] = None) -> Row:
+    """Return the row for <stage> on <n> parcels, which took <seconds> and
+    allocated at most <peak> bytes, if <peak> is not None.
+    """
+    row = {'size': n, 'stage': stage, 'seconds': seconds,
+           'throughput': n / seconds if seconds > 0 else 0.0}
+    if peak is not None:
+        row['peak_bytes'] = peak
+    return row
+
+
+def _time_stage(rows: List[Row], n: int, stage: str, memory: bool,
+                function: Callable, *args: Any) -> Any:
+    """Call <function> on <args>, add the row for it as <stage> on <n>
+    parcels to <rows>, tracing memory if <memory>, and return its result.
+    """
+    profiler = Profiler(trace_memory=memory)
+    with profiler.phase(stage):
+        result = function(*args)
+    report = profiler.report()
+    rows.append(_row(n, stage, report[f'{stage}_seconds'],
+                     report.get(f'{stage}_peak_bytes')))
+    return result
+
+
+def _time_algorithms(rows: List[Row], n: int, config: Dict,
+                     inputs: Tuple[Union[List[Parcel], ParcelTable], Fleet,
+                                   DistanceMap],
+                     memory: bool) -> None:
+    """Run every algorithm in PIPELINE_ALGORITHMS that runs on <n> parcels
+    on <inputs>, with <config>, and add a row for its scheduling to
+    <rows>, as well as one for computing statistics after the greedy
+    algorithm.
+    """
+    snapshot = inputs[1].snapshot()
+    for name, (algorithm, limit) in PIPELINE_ALGORITHMS.items():
+        if n > limit:
+            continue
+        inputs[1].restore(snapshot)
+        experiment = SchedulingExperiment(
+            dict(config, profile=True, profile_memory=memory, **algorithm),
+            inputs)
+        experiment.run()
+        profile = experiment.profile()
+        rows.append(_row(n, f'schedule:{name}', profile['schedule_seconds'],
+                         profile.get('schedule_peak_bytes')))
+        if name == 'greedy':
+            rows.append(_row(n, 'stats', profile['stats_seconds'],
+                             profile.get('stats_peak_bytes')))
+    inputs[1].restore(snapshot)
+
+
+def benchmark_pipeline(sizes: Optional[List[int]] = None,
+                       directory: Optional[str] = None, seed: int = 0,
+                       memory: bool = False, compact: bool = False,
+                       end_to_end_limit: int = 10 ** 4) -> List[Row]:
+    """Time each stage of scheduling random problems of each number of
+    parcels in <sizes>, and return one row per stage and size.
+
+    The stages are reading the parcel, truck and map files, scheduling with
+    each algorithm in PIPELINE_ALGORITHMS that runs on that many parcels,
+    computing statistics, and, for at most <end_to_end_limit> parcels,
+    compare_algorithms from start to end.  The inputs are generated from
+    <seed> into <directory>, or into a directory of temporary files, and
+    reused by later runs.  Parcels and trucks are stored in tables if
+    <compact>.
+
+    If <memory> is True, the peak memory allocated in each stage is traced
+    too, which makes every stage several times slower.
+    """
+    if sizes is None:
+        sizes = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(), 'parcel-benchmark')
+    os.makedirs(directory, exist_ok=True)
+    rows = []
+    for n in sizes:
+        config = _pipeline_config(directory, n, seed, compact)
+        parcels = _time_stage(rows, n, 'read_parcels', memory, read_parcels,
+                              config['parcel_file'], compact)
+        fleet = _time_stage(rows, n, 'read_trucks', memory, read_trucks,
+                            config['truck_file'], config['depot_location'],
+                            compact)
+        dmap = _time_stage(rows, n, 'read_distance_map', memory,
+                           read_distance_map, config['map_file'])
+        _time_algorithms(rows, n, config, (parcels, fleet, dmap), memory)
+        if n <= end_to_end_limit:
+            config_file = os.path.join(directory, f'{n}-{seed}.json')
+            with open(config_file, 'w') as file:
+                json.dump(dict(config, **PIPELINE_ALGORITHMS['greedy'][0]),
+                          file)
+            _time_stage(rows, n, 'compare_algorithms', memory,
+                        compare_algorithms, config_file, 1,
+                        os.path.join(directory, f'{n}-{seed}-results.csv'))
+    return rows
+
+
+def append_history(path: str, rows: List[Row]) -> None:
+    """Append <rows> to the history file <path> as one line of JSON, with
+    the time and the Python version and machine they were measured on.
+    """
+    entry = {'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+             'python': platform.python_version(),
+             'machine': platform.machine(),
+             'rows': rows}
+    with open(path, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+
+
+def find_regressions(rows: List[Row], baseline: List[Row],
+                     tolerance: float = 0.25,
+                     min_seconds: float = 0.01) -> List[str]:
+    """Return a description of every stage and size in <rows> that took
+    more than <tolerance> times longer, or allocated more than <tolerance>
+    times more memory, than in <baseline>.
+
+    Stages that took less than <min_seconds> in <baseline> are too noisy to
+    compare times, and stages or sizes missing from <baseline> are skipped.
+
+    >>> base = [{'size': 10, 'stage': 'stats', 'seconds': 1.0}]
+    >>> find_regressions([{'size': 10, 'stage': 'stats', 'seconds': 1.2}],
+    ...                  base)
+    []
+    >>> find_regressions([{'size': 10, 'stage': 'stats', 'seconds': 1.5}],
+    ...                  base)
+    ['stats on 10 parcels: 1.500s, 50% slower than 1.000s']
+    """
+    before = {(row['size'], row['stage']): row for row in baseline}
+    regressions = []
+    for row in rows:
+        old = before.get((row['size'], row['stage']))
+        if old is None:
+            continue
+        if old['seconds'] >= min_seconds and \
+                row['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append(
+                f'{row["stage"]} on {row["size"]} parcels: '
+                f'{row["seconds"]:.3f}s, '
+                f'{row["seconds"] / old["seconds"] - 1:.0%} slower than '
+                f'{old["seconds"]:.3f}s')
+        if 'peak_bytes' in row and old.get('peak_bytes') and \
+                row['peak_bytes'] > old['peak_bytes'] * (1 + tolerance):
+            regressions.append(
+                f'{row["stage"]} on {row["size"]} parcels: '
+                f'{row["peak_bytes"]} bytes, '
+                f'{row["peak_bytes"] / old["peak_bytes"] - 1:.0%} more than '
+                f'{old["peak_bytes"]} bytes')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time each stage of parcel scheduling at several scales.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory', default=None,
+                        help='where generated inputs are kept')
+    parser.add_argument('--memory', action='store_true',
+                        help='also trace the peak memory of each stage')
+    parser.add_argument('--compact', action='store_true',
+                        help='store parcels and trucks in tables')
+    parser.add_argument('--end-to-end-limit', type=int, default=10 ** 4,
+                        help='largest size to run compare_algorithms on')
+    parser.add_argument('--history', default='data/benchmark-history.jsonl')
+    parser.add_argument('--baseline', default='data/benchmark-baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='make these results the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown that counts as a regression')
+    parser.add_argument('--priority-queue', action='store_true',
+                        help='only compare the priority queues')
+    args = parser.parse_args()
+    if args.priority_queue:
+        for r in benchmark_priority_queue():
+            print(f'{r["size"]:>8} parcels: list {r["list"]:.4f}s, '
+                  f'heap {r["heap"]:.4f}s, heap with key {r["heap_key"]:.4f}s')
+        sys.exit(0)
+    results = benchmark_pipeline(args.sizes, args.directory, args.seed,
+                                 args.memory, args.compact,
+                                 args.end_to_end_limit)
+    for r in results:
+        peak = f', {r["peak_bytes"]:>12} bytes' if 'peak_bytes' in r else ''
+        print(f'{r["size"]:>8} parcels {r["stage"]:<22} {r["seconds"]:9.4f}s '
+              f'{r["throughput"]:>12.0f} parcels/s{peak}')
+    append_history(args.history, results)
+    if args.save_baseline:
+        write_json(args.baseline, results)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            found = find_regressions(results, json.load(baseline_file),
+                                     args.tolerance)
+        for regression in found:
+            print(f'REGRESSION: {regression}')
+        sys.exit(1 if found else 0)
@@ -0,0 +1,108 @@
+from typing import Dict, List, Tuple
+from array import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+# Parsed input data can be cached as typed binary columns in a file next to the
+# input file, and loaded back with mmap instead of being parsed again.
+#
+# A cache file starts with this magic string and the length of a JSON header.
+# The header lists the columns (name, typecode, length) and any other data,
+# such as city names. The raw bytes of the columns follow, each one starting
+# at a multiple of 8 bytes.
+_MAGIC = b'PDCOLS1\n'
+_HEADER = struct.Struct('<8sQ')
+_CACHE_DIR = '.cache'
+
+
+def _digest(path: str) -> str:
+    """Return a hex digest of the contents of the file at <path>.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path: str, kind: str) -> str:
+    """Return the path of the cache file for the <kind> of data parsed from
+    the file at <path>, given the current contents of that file.
+
+    The cache file is in a '.cache' directory next to <path>, and its name
+    includes a digest of the contents of <path>, so editing the file makes
+    any older cache file for it stale.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, _CACHE_DIR,
+                        f'{name}.{kind}.{_digest(path)}.cols')
+
+
+def write_columns(path: str, meta: Dict,
+                  columns: List[Tuple[str, array]]) -> None:
+    """Write the JSON-serializable dictionary <meta> and the named arrays
+    <columns> to a cache file at <path>, replacing any older cache files for
+    the same source file.
+
+    Precondition: <path> was returned by cache_path.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    meta = dict(meta, columns=[[name, column.typecode, len(column)]
+                               for name, column in columns])
+    header = json.dumps(meta).encode('utf-8')
+    header = header + b' ' * (-(_HEADER.size + len(header)) % 8)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, len(header)))
+        file.write(header)
+        for _, column in columns:
+            data = column.tobytes()
+            file.write(data)
+            file.write(b'\0' * (-len(data) % 8))
+    os.replace(temp, path)
+    prefix = os.path.basename(path).rsplit('.', 2)[0] + '.'
+    for name in os.listdir(directory):
+        other = os.path.join(directory, name)
+        if name.startswith(prefix) and name.endswith('.cols') and \
+                other != path:
+            os.remove(other)
+
+
+def read_columns(path: str) -> Tuple[Dict, Dict[str, memoryview]]:
+    """Map the cache file at <path> into memory and return the dictionary
+    and the columns, by name, that were written to it by write_columns.
+
+    The columns are views of a private copy-on-write mapping of the file:
+    they can be changed in place, but changes are never written back.
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, size = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC:
+        raise ValueError(f'{path} is not a cache file')
+    offset = _HEADER.size
+    meta = json.loads(bytes(buffer[offset:offset + size]))
+    offset = offset + size
+    view = memoryview(buffer)
+    columns = {}
+    for name, typecode, length in meta.pop('columns'):
+        nbytes = length * array(typecode).itemsize
+        columns[name] = view[offset:offset + nbytes].cast(typecode)
+        offset = offset + nbytes + (-nbytes % 8)
+    return meta, columns
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['_digest', 'write_columns', 'read_columns'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'array',
+                                   'hashlib', 'json', 'mmap', 'os',
+                                   'struct'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
@@ -1,4 +1,5 @@
-from typing import Any, List, Callable
+from typing import Any, List, Callable, Iterable, Optional, Tuple
+from heapq import heapify, heappop, heappush
 
 
 class Container:
@@ -31,6 +32,28 @@ def _shorter(a: str, b: str) -> bool:
     return len(a) < len(b)
 
 
+class _Ranked:
+    """Wrap an item so that heap comparisons go through a <higher_priority>
+    function. Only used by PriorityQueue when no key function is given.
+
+    Two wrapped items compare equal when neither has higher priority than the
+    other, which lets the insertion counter in the heap entry break the tie.
+    """
+    __slots__ = ('item', 'higher_priority')
+
+    def __init__(self, item: Any,
+                 higher_priority: Callable[[Any, Any], bool]) -> None:
+        self.item = item
+        self.higher_priority = higher_priority
+
+    def __lt__(self, other: '_Ranked') -> bool:
+        return self.higher_priority(self.item, other.item)
+
+    def __eq__(self, other: '_Ranked') -> bool:
+        return not self.higher_priority(self.item, other.item) and \
+            not self.higher_priority(other.item, self.item)
+
+
 class PriorityQueue(Container):
     """A queue of items that operates in FIFO-priority order.
 
@@ -40,40 +63,59 @@ class PriorityQueue(Container):
     to be removed.
 
     Priority is defined by the <higher_priority> function that is provided at
-    time of initialization.
+    time of initialization.  If a <key> function is also provided, it is used
+    instead of <higher_priority> to order the items, so that comparisons are
+    done on plain values (numbers, strings, tuples) rather than through a
+    Python function call.
 
     All objects in the container must be of the same type.
 
     === Private Attributes ===
     _queue:
-      The end of the list represents the *front* of the queue, that is,
-      the next item to be removed.
+      A binary min-heap of entries (rank, insertion number, item).  The
+      first entry is the *front* of the queue, that is, the next item to be
+      removed.
     _higher_priority:
       A function that compares two items by their priority.
       If <_higher_priority>(x, y) is true, then x has higher priority than y
       and should be removed from the queue before y.
+    _key:
+      A function that maps an item to its rank, or None.  A smaller rank
+      means a higher priority.
+    _count:
+      The number of items added to this queue so far.  Used to break ties
+      in FIFO order.
 
     === Representation Invariants ===
     - all elements of <_queue> are of the same type.
     - the elements of <_queue> are appropriate arguments for the
       function <_higher_priority>.
-    - the elements of <_queue> are in order according to the
-      function <_higher_priority>.
+    - <_queue> satisfies the heap property.
+    - if <_key> is not None, then for any two items x and y,
+      <_key>(x) < <_key>(y) iff <_higher_priority>(x, y).
     """
-    _queue: List[Any]
+    _queue: List[Tuple[Any, int, Any]]
     _higher_priority: Callable[[Any, Any], bool]
+    _key: Optional[Callable[[Any], Any]]
+    _count: int
 
-    def __init__(self, higher_priority: Callable[[Any, Any], bool]) -> None:
+    def __init__(self, higher_priority: Callable[[Any, Any], bool],
+                 key: Optional[Callable[[Any], Any]] = None) -> None:
         """Initialize this to an empty PriorityQueue. For any two elements x
         and y of the queue, if <higher_priority>(x, y) is true, then x has
         higher priority than y.
 
+        If <key> is given, it must agree with <higher_priority>: <key>(x) <
+        <key>(y) iff <higher_priority>(x, y).
+
         >>> pq = PriorityQueue(str.__lt__)
         >>> pq.is_empty()
         True
         """
         self._queue = []
         self._higher_priority = higher_priority
+        self._key = key
+        self._count = 0
 
     def add(self, item: Any) -> None:
         """Add <item> to this PriorityQueue.
@@ -87,31 +129,48 @@ class PriorityQueue(Container):
         >>> pq.add('hat')
         >>> # 'arju' and fred have the same priority, but 'arju' is behind
         >>> # 'fred' in the queue because it was added later.
-        >>> pq._queue
-        ['monalisa', 'arju', 'fred', 'hat']
+        >>> len(pq)
+        4
+        >>> pq.remove()
+        'hat'
+        >>> pq.remove()
+        'fred'
+        >>> pq = PriorityQueue(_shorter, len)
+        >>> pq.add('fred')
+        >>> pq.add('hat')
         >>> pq.remove()
         'hat'
-        >>> pq._queue
-        ['monalisa', 'arju', 'fred']
         """
-        if not self._queue:
-            self._queue.append(item)
-            return
-        if self._higher_priority(item, self._queue[-1]):
-            self._queue.append(item)
-            return
-        for i in range(len(self._queue)):
-            if self._higher_priority(self._queue[0], item):
-                self._queue.insert(0, item)
-                return
-            if not self._higher_priority(self._queue[i], item) and not \
-                    self._higher_priority(item, self._queue[i]):
-                self._queue.insert(i, item)
-                return
-            if self._higher_priority(self._queue[i], item) and \
-                    self._higher_priority(item, self._queue[i - 1]):
-                self._queue.insert(i, item)
-                return
+        if self._key is None:
+            rank = _Ranked(item, self._higher_priority)
+        else:
+            rank = self._key(item)
+        heappush(self._queue, (rank, self._count, item))
+        self._count += 1
+
+    def add_all(self, items: Iterable[Any]) -> None:
+        """Add every item in <items> to this PriorityQueue, in order.
+
+        This has the same effect as calling add on each item, but builds the
+        heap in linear time.
+
+        >>> pq = PriorityQueue(_shorter, len)
+        >>> pq.add_all(['fred', 'arju', 'monalisa', 'hat'])
+        >>> [pq.remove() for _ in range(4)]
+        ['hat', 'fred', 'arju', 'monalisa']
+        """
+        key = self._key
+        count = self._count
+        if key is None:
+            higher = self._higher_priority
+            entries = [(_Ranked(item, higher), count + i, item)
+                       for i, item in enumerate(items)]
+        else:
+            entries = [(key(item), count + i, item)
+                       for i, item in enumerate(items)]
+        self._count = count + len(entries)
+        self._queue.extend(entries)
+        heapify(self._queue)
 
     def remove(self) -> Any:
         """Remove and return the next item from this PriorityQueue.
@@ -134,7 +193,7 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'monalisa'
         """
-        return self._queue.pop()
+        return heappop(self._queue)[2]
 
     def is_empty(self) -> bool:
         """Return True iff this PriorityQueue is empty.
@@ -148,11 +207,21 @@ class PriorityQueue(Container):
         """
         return not self._queue
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue(str.__lt__)
+        >>> len(pq)
+        0
+        """
+        return len(self._queue)
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'heapq'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
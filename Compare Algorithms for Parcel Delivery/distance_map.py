@@ -1,21 +1,41 @@
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
+from array import array
+from heapq import heappop, heappush
 
 
 class DistanceMap:
     """A distance map used for storing and looking up the distance between
     any two cities.
 
+    Distances are added to a dictionary.  Once all distances are added,
+    freeze() compiles them into a dense matrix indexed by integer city IDs,
+    which makes looking up a distance, or the length of a whole route, much
+    cheaper.  Adding another distance afterwards drops the matrix until the
+    next call to freeze().  A map filled by load_matrix, or closed by
+    close(), keeps its distances only in the matrix, and builds the
+    dictionary from it if another distance is added.
+
     === Private Attributes ===
     _distance_map: A dictionary used to store the distance between two cities.
     Each key is a list of two cities in order of the first city and the second
     city (A and B). The value of each key is the distance from A to B and the
-    distance from B to A.
+    distance from B to A.  None if the distances are only stored in
+    <_matrix>.
+    _city_ids: The integer ID of each city in <_distance_map>, numbered from 0
+    in the order the cities were first added.
+    _matrix: None, or the distances in row-major order: the distance from the
+    city with ID i to the city with ID j is _matrix[i * n + j], where n is the
+    number of cities. Missing distances are stored as -1.
 
     === Representation Invariants ===
     - The distance is a positive integer.
     - The distance from city B to city A, might be the same or different.
+    - If <_matrix> is not None, it agrees with <_distance_map>.
+    - <_distance_map> and <_matrix> are not both None.
     """
-    _distance_map: Dict[Tuple, List]
+    _distance_map: Optional[Dict[Tuple, List]]
+    _city_ids: Dict[str, int]
+    _matrix: Optional[array]
 
     def __init__(self) -> None:
         """Initialize a _distance_map with no data in it.
@@ -25,6 +45,8 @@ class DistanceMap:
         0
         """
         self._distance_map = {}
+        self._city_ids = {}
+        self._matrix = None
 
     def add_distance(self, first: str, second: str, dist1: int,
                      dist2: int = None) -> None:
@@ -41,12 +63,18 @@ class DistanceMap:
         >>> M._distance_map[('Toronto', 'Beijing')]
         [10, 11]
         """
+        if self._distance_map is None:
+            self._distance_map = self._pairs()
         key = (first, second)
         if key not in self._distance_map:
             if dist2 is None:
                 self._distance_map[key] = [dist1, dist1]
             else:
                 self._distance_map[key] = [dist1, dist2]
+            for city in key:
+                if city not in self._city_ids:
+                    self._city_ids[city] = len(self._city_ids)
+            self._matrix = None
 
     def distance(self, city1: str, city2: str) -> int:
         """
@@ -63,19 +91,197 @@ class DistanceMap:
         >>> M.distance('Beijing', 'Toronto')
         11
         """
+        if self._matrix is not None:
+            i = self._city_ids.get(city1)
+            j = self._city_ids.get(city2)
+            if i is None or j is None:
+                return -1
+            return self._matrix[i * len(self._city_ids) + j]
         cities1 = (city1, city2)
         cities2 = (city2, city1)
-        if cities1 in self._distance_map.keys():
+        if cities1 in self._distance_map:
             return self._distance_map[cities1][0]
-        if cities2 in self._distance_map.keys():
+        if cities2 in self._distance_map:
             return self._distance_map[cities2][1]
         return -1
 
+    def freeze(self) -> None:
+        """Compile the distances in this map into a dense matrix, so that
+        later lookups do not go through the dictionary.
+
+        >>> M = DistanceMap()
+        >>> M.add_distance('Toronto', 'Beijing', 10, 11)
+        >>> M.freeze()
+        >>> M.is_frozen()
+        True
+        >>> M.distance('Beijing', 'Toronto')
+        11
+        >>> M.distance('Toronto', 'Toronto')
+        -1
+        >>> M.add_distance('Toronto', 'Hamilton', 9)
+        >>> M.is_frozen()
+        False
+        """
+        if self._matrix is not None:
+            return
+        n = len(self._city_ids)
+        matrix = array('q', [-1]) * (n * n)
+        for (first, second), (dist1, dist2) in self._distance_map.items():
+            i = self._city_ids[first]
+            j = self._city_ids[second]
+            matrix[i * n + j] = dist1
+            if matrix[j * n + i] == -1:
+                matrix[j * n + i] = dist2
+        self._matrix = matrix
+
+    def close(self) -> None:
+        """Replace the distance between every two cities in this map by the
+        length of the shortest path between them through the distances in
+        this map, adding the distances between cities that were only
+        connected through other cities, and freeze this map.
+
+        The shortest paths come from Dijkstra's algorithm, run from every
+        city over the distances stored for it, which takes
+        O(n * e log n) time for n cities and e stored distances.
+
+        >>> M = DistanceMap()
+        >>> M.add_distance('Toronto', 'Hamilton', 9, 8)
+        >>> M.add_distance('Hamilton', 'London', 5)
+        >>> M.add_distance('Toronto', 'London', 20)
+        >>> M.add_distance('Ottawa', 'Kingston', 3)
+        >>> M.close()
+        >>> M.distance('Toronto', 'London'), M.distance('London', 'Toronto')
+        (14, 13)
+        >>> M.distance('Toronto', 'Ottawa')
+        -1
+        """
+        if self._matrix is None:
+            self.freeze()
+        n = len(self._city_ids)
+        matrix = self._matrix
+        neighbours = [[(j, matrix[i * n + j]) for j in range(n)
+                       if j != i and matrix[i * n + j] >= 0]
+                      for i in range(n)]
+        closed = array('q', [-1]) * (n * n)
+        for source in range(n):
+            row = source * n
+            heap = [(0, source)]
+            while heap:
+                dist, i = heappop(heap)
+                if closed[row + i] != -1:
+                    continue
+                closed[row + i] = dist
+                for j, step in neighbours[i]:
+                    if closed[row + j] == -1:
+                        heappush(heap, (dist + step, j))
+            closed[row + source] = matrix[row + source]
+        self.load_matrix(list(self._city_ids), closed)
+
+    def is_frozen(self) -> bool:
+        """Return True iff this map has been frozen since the last distance
+        was added.
+        """
+        return self._matrix is not None
+
+    def matrix(self) -> Tuple[List[str], array]:
+        """Return the names of the cities in this map, in order of ID, and a
+        copy of the distance matrix.
+
+        Precondition: this map is frozen.
+
+        >>> M = DistanceMap()
+        >>> M.add_distance('Toronto', 'Beijing', 10, 11)
+        >>> M.freeze()
+        >>> M.matrix()
+        (['Toronto', 'Beijing'], array('q', [-1, 10, 11, -1]))
+        """
+        return list(self._city_ids), array('q', self._matrix)
+
+    def load_matrix(self, cities: List[str], matrix: array) -> None:
+        """Replace the distances in this map with the distances in <matrix>
+        between the <cities>, as returned by matrix(), and freeze it.  The
+        distances are only stored in the matrix.
+
+        >>> M = DistanceMap()
+        >>> M.load_matrix(['Toronto', 'Beijing'],
+        ...               array('q', [-1, 10, 11, -1]))
+        >>> M.is_frozen()
+        True
+        >>> M.distance('Beijing', 'Toronto')
+        11
+        >>> M._distance_map is None
+        True
+        >>> M.add_distance('Toronto', 'Hamilton', 9)
+        >>> M._distance_map[('Toronto', 'Beijing')]
+        [10, 11]
+        """
+        self._city_ids = {city: i for i, city in enumerate(cities)}
+        self._distance_map = None
+        self._matrix = array('q', matrix)
+
+    def _pairs(self) -> Dict[Tuple, List]:
+        """Return the distances in the matrix of this map, keyed as in
+        <self>._distance_map.
+
+        Precondition: this map is frozen.
+        """
+        cities = list(self._city_ids)
+        n = len(cities)
+        matrix = self._matrix
+        pairs = {}
+        for i in range(n):
+            if matrix[i * n + i] != -1:
+                pairs[(cities[i], cities[i])] = [matrix[i * n + i]] * 2
+            for j in range(i + 1, n):
+                d1 = matrix[i * n + j]
+                d2 = matrix[j * n + i]
+                if d1 != -1:
+                    pairs[(cities[i], cities[j])] = [d1, d2]
+                elif d2 != -1:
+                    pairs[(cities[j], cities[i])] = [d2, d1]
+        return pairs
+
+    def city_id(self, city: str) -> int:
+        """Return the integer ID of <city>, or -1 if <city> is not in this map.
+
+        >>> M = DistanceMap()
+        >>> M.add_distance('Toronto', 'Hamilton', 9)
+        >>> M.city_id('Hamilton')
+        1
+        >>> M.city_id('Beijing')
+        -1
+        """
+        return self._city_ids.get(city, -1)
+
+    def route_distance(self, route: List[str]) -> int:
+        """Return the total distance of travelling through the cities in
+        <route> in order.
+
+        Precondition: this map contains the distance of every hop in <route>.
+
+        >>> M = DistanceMap()
+        >>> M.add_distance('Toronto', 'Hamilton', 9)
+        >>> M.add_distance('Toronto', 'Beijing', 10, 11)
+        >>> M.route_distance(['Toronto', 'Hamilton', 'Toronto', 'Beijing'])
+        28
+        >>> M.freeze()
+        >>> M.route_distance(['Toronto', 'Hamilton', 'Toronto', 'Beijing'])
+        28
+        """
+        if self._matrix is None:
+            return sum(self.distance(route[i], route[i + 1])
+                       for i in range(len(route) - 1))
+        n = len(self._city_ids)
+        ids = [self._city_ids[city] for city in route]
+        matrix = self._matrix
+        return sum(matrix[a * n + b] for a, b in zip(ids, ids[1:]))
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'heapq'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
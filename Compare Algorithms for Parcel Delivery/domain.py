@@ -1,4 +1,7 @@
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Sequence, Tuple, Union
+from array import array
+from itertools import compress
+from operator import sub, truediv
 from distance_map import DistanceMap
 
 
@@ -16,6 +19,8 @@ class Parcel:
     - No two parcel can have the same ID.
     - The volume is a positive integer.
     """
+    # Slots keep parcels, and the ParcelRow views of a ParcelTable, small.
+    __slots__ = ('parcel_id', 'volume', 'source', 'destination')
     parcel_id: int
     volume: int
     source: str
@@ -38,6 +43,15 @@ class Parcel:
         self.destination = destination
 
 
+def _travelled(route: List[str], dmap: DistanceMap) -> int:
+    """Return the distance travelled along <route> according to <dmap>, or 0
+    if its second stop is the depot <route>[0], as Fleet counts it.
+    """
+    if route[0] == route[1]:
+        return 0
+    return dmap.route_distance(route)
+
+
 class Truck:
     """The information of a single truck.
 
@@ -56,13 +70,31 @@ class Truck:
     capacity. (The range of the current capacity would be zero to the total
     capacity.
     - The volume capacity is a positive integer.
+    - While this truck is bound to a distance map, <_length> is the distance
+      travelled along <route>.  So its route list is changed only by pack,
+      pack_many or assigning to <route>, and is never shared with another
+      truck, since changes made through one truck would not be counted by
+      the other.
 
+    === Private Attributes ===
+    _route: The route of this truck.
+    _dmap: The distance map this truck is bound to, or None.
+    _total: The one-element array that the distance travelled by this truck
+      is added to, or None.
+    _length: The distance travelled by this truck according to <_dmap>, if
+      <_dmap> is not None.
     """
+    # Slots keep trucks, and the TruckRow views of a TruckTable, small.
+    __slots__ = ('truck_id', 'total_capacity', 'left_capacity', 'parcels_id',
+                 '_route', '_dmap', '_total', '_length')
     truck_id: int
     total_capacity: int
     left_capacity: int
-    route: List[str]
     parcels_id: List[int]
+    _route: List[str]
+    _dmap: Optional[DistanceMap]
+    _total: Optional[array]
+    _length: int
 
     def __init__(self, unique_id: int, total: int, depot: str) -> None:
         """Initialize an empty truck with its <unique_id>, <total> capacity and
@@ -75,17 +107,116 @@ class Truck:
         >>> t.route
         ['Toronto', 'Toronto']
         """
+        self._dmap = None
+        self._total = None
+        self._length = 0
         self.truck_id = unique_id
         self.total_capacity = total
         self.left_capacity = total
         self.route = [depot, depot]
         self.parcels_id = []
 
-    def pack(self, parcel: Parcel) -> bool:
+    @property
+    def route(self) -> List[str]:
+        """The cities this truck travels through, in order."""
+        return self._route
+
+    @route.setter
+    def route(self, value: List[str]) -> None:
+        self._route = value
+        if self._dmap is not None:
+            self._set_length(_travelled(value, self._dmap))
+
+    def bind(self, dmap: Optional[DistanceMap],
+             total: Optional[array] = None) -> None:
+        """Keep the distance travelled by this truck according to <dmap> up
+        to date from now on (see route_length), or stop if <dmap> is None.
+
+        If <total> is not None, it is a one-element array that the distance
+        travelled is added to now, and kept up to date in as it changes.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> total = array('q', [0])
+        >>> t.bind(m, total)
+        >>> t.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t.route_length(), total[0]
+        (18, 18)
+        """
+        self._total = None
+        self._dmap = dmap
+        self._length = 0 if dmap is None else _travelled(self.route, dmap)
+        self._total = total
+        if total is not None:
+            total[0] = total[0] + self._length
+
+    def route_length(self) -> int:
+        """Return the distance travelled by this truck along its route,
+        according to the distance map it is bound to, or 0 if it never leaves
+        the depot.  This takes constant time.
+
+        Raise a ValueError if this truck is not bound to a distance map.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> m.add_distance('Toronto', 'London', 5)
+        >>> m.add_distance('Hamilton', 'London', 3)
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> t.bind(m)
+        >>> t.route_length()
+        0
+        >>> t.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t.pack(Parcel(2, 1, 'Toronto', 'London'), 1)
+        True
+        >>> t.route_length() == m.route_distance(t.route)
+        True
+        """
+        if self._dmap is None:
+            raise ValueError('truck is not bound to a distance map')
+        return self._length
+
+    def _set_length(self, length: int) -> None:
+        """Record <length> as the distance travelled by this truck, and update
+        the total it is added to.
+        """
+        if self._total is not None:
+            self._total[0] = self._total[0] + length - self._length
+        self._length = length
+
+    def _inserted(self, i: int, k: int = 1) -> None:
+        """Update the distance travelled by this truck after <k> cities were
+        inserted at index <i> of its route.
+
+        Only the leg that was replaced and the new legs are measured, unless
+        the truck starts or stops leaving the depot.
+        """
+        dmap = self._dmap
+        route = self.route
+        was_travelling = (route[1 + k] if i == 1 else route[1]) != route[0]
+        if not was_travelling or route[1] == route[0]:
+            self._set_length(_travelled(route, dmap))
+        else:
+            added = dmap.route_distance(route[i - 1:i + k + 1])
+            self._set_length(self._length + added -
+                             dmap.distance(route[i - 1], route[i + k]))
+
+    def pack(self, parcel: Parcel, position: Optional[int] = None) -> bool:
         """Pack the <parcel> onto the truck. Return True if the truck still have
         enough volume left for the parcel and False if there's not enough volume
         left for the parcel.
 
+        The parcel's destination is added to the route just before the return
+        to the depot, unless it is already the last stop.  If <position> is
+        not None, the destination is inserted at index <position> of the route
+        instead, unless it is already the stop just before or at that index.
+        If this truck is bound to a distance map (see bind), the distance it
+        travels is updated in constant time.
+
+        Precondition: 0 < <position> < len(<self>.route)
+
         >>> t = Truck(1423, 10, 'Toronto')
         >>> p = Parcel(2, 4, 'Toronto', 'Montreal')
         >>> t.pack(p)
@@ -95,16 +226,71 @@ class Truck:
         >>> p2 = Parcel(5, 50, 'Toronto', 'Montreal')
         >>> t.pack(p2)
         False
+        >>> t.pack(Parcel(6, 1, 'Toronto', 'London'), 1)
+        True
+        >>> t.route
+        ['Toronto', 'London', 'Montreal', 'Toronto']
+        >>> t.pack(Parcel(7, 1, 'Toronto', 'London'), 2)
+        True
+        >>> t.route
+        ['Toronto', 'London', 'Montreal', 'Toronto']
         """
         result = False
         if parcel.volume <= self.left_capacity:
             self.left_capacity = self.left_capacity - parcel.volume
             self.parcels_id.append(parcel.parcel_id)
             result = True
-            if parcel.destination != self.route[-2]:
-                self.route.insert(-1, parcel.destination)
+            route = self.route
+            inserted = None
+            if position is None:
+                if parcel.destination != route[-2]:
+                    route.insert(-1, parcel.destination)
+                    inserted = len(route) - 2
+            elif parcel.destination != route[position - 1] and \
+                    parcel.destination != route[position]:
+                route.insert(position, parcel.destination)
+                inserted = position
+            if inserted is not None and self._dmap is not None:
+                self._inserted(inserted)
         return result
 
+    def pack_many(self, parcels: List[Parcel]) -> bool:
+        """Pack all of <parcels> onto the truck, in order, and return True if
+        the truck has enough volume left for all of them together.  Otherwise
+        pack none of them and return False.
+
+        The truck ends up as if each parcel had been packed with pack, but
+        the route is updated once, with all the new stops inserted together.
+
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> t.pack_many([Parcel(1, 2, 'Toronto', 'London'),
+        ...              Parcel(2, 3, 'Toronto', 'London'),
+        ...              Parcel(3, 4, 'Toronto', 'Guelph')])
+        True
+        >>> t.route, t.left_capacity, t.parcels_id
+        (['Toronto', 'London', 'Guelph', 'Toronto'], 1, [1, 2, 3])
+        >>> t.pack_many([Parcel(4, 2, 'Toronto', 'Guelph')])
+        False
+        """
+        volume = sum(p.volume for p in parcels)
+        if volume > self.left_capacity:
+            return False
+        self.left_capacity = self.left_capacity - volume
+        self.parcels_id.extend(p.parcel_id for p in parcels)
+        route = self.route
+        last = route[-2]
+        stops = []
+        for p in parcels:
+            if p.destination != last:
+                last = p.destination
+                stops.append(last)
+        if stops:
+            i = len(route) - 1
+            route[i:i] = stops
+            if self._dmap is not None:
+                self._inserted(i, len(stops))
+        return True
+
     def fullness(self) -> float:
         """Return the percentage fullness of the track which will be the
         volume used divided by the total volume.
@@ -123,23 +309,389 @@ class Truck:
         return (used / self.total_capacity) * 100
 
 
+class ParcelTable:
+    """Parcels stored column by column, for large inputs.
+
+    Each column is a typed array, and city names are stored once and referred
+    to by integer codes, so a parcel takes a few dozen bytes instead of a
+    whole Parcel object.  Indexing or iterating over the table gives
+    ParcelRow views that behave like Parcel objects.
+
+    The columns may also be memoryviews of a mapped cache file (see
+    experiment.read_parcels), in which case no more parcels can be added.
+
+    === Public Attributes ===
+    parcel_ids: The ID of each parcel.
+    volumes: The volume of each parcel.
+    sources: The code of the source city of each parcel.
+    destinations: The code of the destination city of each parcel.
+    cities: The name of each city, by code.
+
+    === Private Attributes ===
+    _codes: The code of each city, by name.
+
+    === Representation Invariants ===
+    - <parcel_ids>, <volumes>, <sources> and <destinations> have the same
+      length.
+    - <_codes>[<cities>[c]] == c for every code c.
+    """
+    parcel_ids: array
+    volumes: array
+    sources: array
+    destinations: array
+    cities: List[str]
+    _codes: Dict[str, int]
+
+    def __init__(self) -> None:
+        """Initialize an empty ParcelTable.
+
+        >>> len(ParcelTable())
+        0
+        """
+        self.parcel_ids = array('q')
+        self.volumes = array('q')
+        self.sources = array('i')
+        self.destinations = array('i')
+        self.cities = []
+        self._codes = {}
+
+    def city_code(self, city: str) -> int:
+        """Return the code of <city>, giving it a new code if it has none.
+
+        >>> table = ParcelTable()
+        >>> table.city_code('Toronto')
+        0
+        >>> table.city_code('Montreal')
+        1
+        >>> table.city_code('Toronto')
+        0
+        """
+        code = self._codes.get(city)
+        if code is None:
+            code = len(self.cities)
+            self._codes[city] = code
+            self.cities.append(city)
+        return code
+
+    def add(self, unique_id: int, volume: int, source: str,
+            destination: str) -> None:
+        """Add a parcel with <unique_id>, <volume>, <source> and <destination>
+        to the end of this table.
+
+        >>> table = ParcelTable()
+        >>> table.add(2, 4, 'Toronto', 'Montreal')
+        >>> table[0].destination
+        'Montreal'
+        """
+        self.parcel_ids.append(unique_id)
+        self.volumes.append(volume)
+        self.sources.append(self.city_code(source))
+        self.destinations.append(self.city_code(destination))
+
+    def __len__(self) -> int:
+        """Return the number of parcels in this table.
+        """
+        return len(self.parcel_ids)
+
+    def __getitem__(self, i: int) -> 'ParcelRow':
+        """Return a view of the parcel in row <i> of this table.
+        """
+        if i < 0:
+            i = i + len(self.parcel_ids)
+        if not 0 <= i < len(self.parcel_ids):
+            raise IndexError('parcel table index out of range')
+        return ParcelRow(self, i)
+
+    def __iter__(self) -> Iterator['ParcelRow']:
+        """Return an iterator over views of the parcels in this table.
+        """
+        return (ParcelRow(self, i) for i in range(len(self.parcel_ids)))
+
+    def argsort(self, column: str, reverse: bool = False) -> List[int]:
+        """Return the row numbers of this table, stably sorted by <column>,
+        which is either 'volume' or 'destination'.  Destinations are sorted
+        alphabetically by city name.
+
+        >>> table = ParcelTable()
+        >>> table.add(1, 5, 'Toronto', 'Ottawa')
+        >>> table.add(2, 3, 'Toronto', 'London')
+        >>> table.add(3, 5, 'Toronto', 'Guelph')
+        >>> table.argsort('volume')
+        [1, 0, 2]
+        >>> table.argsort('volume', reverse=True)
+        [0, 2, 1]
+        >>> table.argsort('destination')
+        [2, 1, 0]
+        """
+        if column == 'volume':
+            keys = self.volumes
+        else:
+            ranks = [0] * len(self.cities)
+            for rank, code in enumerate(sorted(range(len(self.cities)),
+                                               key=self.cities.__getitem__)):
+                ranks[code] = rank
+            keys = [ranks[code] for code in self.destinations]
+        return sorted(range(len(keys)), key=keys.__getitem__,
+                      reverse=reverse)
+
+
+class ParcelRow(Parcel):
+    """A view of one row of a ParcelTable, with the attributes of a Parcel.
+
+    Two views are equal iff they are views of the same row of the same table.
+    """
+    __slots__ = ('_table', '_row')
+    _table: ParcelTable
+    _row: int
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, table: ParcelTable, row: int) -> None:
+        """Initialize a view of row <row> of <table>.
+        """
+        self._table = table
+        self._row = row
+
+    @property
+    def parcel_id(self) -> int:
+        """The unique ID of this parcel."""
+        return self._table.parcel_ids[self._row]
+
+    @property
+    def volume(self) -> int:
+        """The volume of this parcel."""
+        return self._table.volumes[self._row]
+
+    @property
+    def source(self) -> str:
+        """The name of the city this parcel came from."""
+        return self._table.cities[self._table.sources[self._row]]
+
+    @property
+    def destination(self) -> str:
+        """The name of the city where this parcel must be delivered."""
+        return self._table.cities[self._table.destinations[self._row]]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ParcelRow) and \
+            self._table is other._table and self._row == other._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._table), self._row))
+
+    def __repr__(self) -> str:
+        return f'ParcelRow({self.parcel_id}, {self.volume}, ' \
+               f'{self.source!r}, {self.destination!r})'
+
+
+class TruckTable:
+    """Trucks stored column by column.
+
+    The IDs and capacities of the trucks are typed arrays; the route and
+    parcel IDs of each truck are lists.  The table keeps one TruckRow view
+    per truck, which behaves like a Truck object and reads and writes the
+    columns.
+
+    === Public Attributes ===
+    truck_ids: The ID of each truck.
+    total_capacities: The total capacity of each truck.
+    left_capacities: The capacity left on each truck.
+    routes: The route of each truck.
+    parcels_ids: The IDs of the parcels packed onto each truck.
+
+    === Private Attributes ===
+    _rows: The view of each truck, by row.
+
+    === Representation Invariants ===
+    - All the columns and <_rows> have the same length.
+    """
+    truck_ids: array
+    total_capacities: array
+    left_capacities: array
+    routes: List[List[str]]
+    parcels_ids: List[List[int]]
+    _rows: List['TruckRow']
+
+    def __init__(self) -> None:
+        """Initialize an empty TruckTable.
+
+        >>> len(TruckTable())
+        0
+        """
+        self.truck_ids = array('q')
+        self.total_capacities = array('q')
+        self.left_capacities = array('q')
+        self.routes = []
+        self.parcels_ids = []
+        self._rows = []
+
+    def add(self, unique_id: int, total: int, depot: str) -> 'TruckRow':
+        """Add an empty truck with <unique_id>, <total> capacity and <depot>
+        to the end of this table, and return its view.
+
+        >>> table = TruckTable()
+        >>> t = table.add(1423, 10, 'Toronto')
+        >>> t.pack(Parcel(2, 4, 'Toronto', 'Montreal'))
+        True
+        >>> table.left_capacities[0]
+        6
+        >>> t.route
+        ['Toronto', 'Montreal', 'Toronto']
+        """
+        self.truck_ids.append(unique_id)
+        self.total_capacities.append(total)
+        self.left_capacities.append(total)
+        self.routes.append([depot, depot])
+        self.parcels_ids.append([])
+        row = TruckRow(self, len(self._rows))
+        self._rows.append(row)
+        return row
+
+    def __len__(self) -> int:
+        """Return the number of trucks in this table.
+        """
+        return len(self._rows)
+
+    def __getitem__(self, i: int) -> 'TruckRow':
+        """Return the view of the truck in row <i> of this table.
+        """
+        return self._rows[i]
+
+    def __iter__(self) -> Iterator['TruckRow']:
+        """Return an iterator over the views of the trucks in this table.
+        """
+        return iter(self._rows)
+
+
+class TruckRow(Truck):
+    """A view of one row of a TruckTable, with the attributes and methods of
+    a Truck.
+    """
+    __slots__ = ('_table', '_row')
+    _table: TruckTable
+    _row: int
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, table: TruckTable, row: int) -> None:
+        """Initialize a view of row <row> of <table>.
+        """
+        self._table = table
+        self._row = row
+        self._dmap = None
+        self._total = None
+        self._length = 0
+
+    @property
+    def truck_id(self) -> int:
+        """The unique ID of this truck."""
+        return self._table.truck_ids[self._row]
+
+    @property
+    def total_capacity(self) -> int:
+        """The total volume capacity of this truck."""
+        return self._table.total_capacities[self._row]
+
+    @property
+    def left_capacity(self) -> int:
+        """The capacity left on this truck."""
+        return self._table.left_capacities[self._row]
+
+    @left_capacity.setter
+    def left_capacity(self, value: int) -> None:
+        self._table.left_capacities[self._row] = value
+
+    @property
+    def route(self) -> List[str]:
+        """The cities this truck travels through, in order."""
+        return self._table.routes[self._row]
+
+    @route.setter
+    def route(self, value: List[str]) -> None:
+        self._table.routes[self._row] = value
+        if self._dmap is not None:
+            self._set_length(_travelled(value, self._dmap))
+
+    @property
+    def parcels_id(self) -> List[int]:
+        """The IDs of the parcels packed onto this truck."""
+        return self._table.parcels_ids[self._row]
+
+    @parcels_id.setter
+    def parcels_id(self, value: List[int]) -> None:
+        self._table.parcels_ids[self._row] = value
+
+
+# The left capacities, routes and packed parcel IDs of the trucks in a fleet,
+# as returned by Fleet.snapshot.
+FleetSnapshot = Tuple[Sequence[int], List[Tuple[str, ...]],
+                      List[Tuple[int, ...]]]
+
+
 class Fleet:
     """ A fleet of trucks for making deliveries.
 
     ===== Public Attributes =====
     trucks:
       List of all Truck objects in this fleet.
+
+    ===== Private Attributes =====
+    _table:
+      The TruckTable holding every truck of this fleet, or None.  When it is
+      not None, statistics are computed from its columns.
+    _dmap:
+      The distance map every truck of this fleet is bound to, or None.
+    _distance:
+      A one-element array holding the total distance travelled by the trucks
+      of this fleet according to <_dmap>, if <_dmap> is not None.
+
+    === Representation Invariants ===
+    - if <_table> is not None, <trucks> is exactly the rows of <_table>.
+    - if <_dmap> is not None, every truck in <trucks> is bound to <_dmap>
+      and <_distance>.
     """
     trucks: List[Truck]
+    _table: Optional[TruckTable]
+    _dmap: Optional[DistanceMap]
+    _distance: array
 
-    def __init__(self) -> None:
-        """Create a Fleet with no trucks.
+    def __init__(self, table: Optional[TruckTable] = None) -> None:
+        """Create a Fleet with the trucks in <table>, or with no trucks if
+        <table> is None.
 
         >>> f = Fleet()
         >>> f.num_trucks()
         0
+        >>> table = TruckTable()
+        >>> t = table.add(1423, 10, 'Toronto')
+        >>> Fleet(table).num_trucks()
+        1
+        """
+        self._table = table
+        self.trucks = [] if table is None else list(table)
+        self._dmap = None
+        self._distance = array('q', [0])
+
+    def bind(self, dmap: DistanceMap) -> None:
+        """Keep the total distance travelled by the trucks in this fleet
+        according to <dmap> up to date from now on, as trucks are packed or
+        added, so that total_distance_travelled with <dmap> takes constant
+        time.
+
+        >>> from distance_map import DistanceMap
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> f = Fleet()
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> f.add_truck(t)
+        >>> f.bind(m)
+        >>> t.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.total_distance_travelled(m)
+        18
         """
-        self.trucks = []
+        self._dmap = dmap
+        self._distance = array('q', [0])
+        for truck in self.trucks:
+            truck.bind(dmap, self._distance)
 
     def add_truck(self, truck: Truck) -> None:
         """Add <truck> to this fleet.
@@ -154,6 +706,9 @@ class Fleet:
         1
         """
         self.trucks.append(truck)
+        self._table = None
+        if self._dmap is not None:
+            truck.bind(self._dmap, self._distance)
 
     # We will not test the format of the string that you return -- it is up
     # to you.
@@ -212,6 +767,55 @@ class Fleet:
                 n = n + 1
         return n
 
+    def snapshot(self) -> FleetSnapshot:
+        """Return a snapshot of the left capacity, route and packed parcel IDs
+        of every truck in this fleet, which restore can reset the trucks to.
+
+        >>> f = Fleet()
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> f.add_truck(t)
+        >>> snapshot = f.snapshot()
+        >>> t.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.restore(snapshot)
+        >>> t.left_capacity, t.route, t.parcels_id
+        (10, ['Toronto', 'Toronto'], [])
+        """
+        if self._table is not None:
+            return (array('q', self._table.left_capacities),
+                    [tuple(route) for route in self._table.routes],
+                    [tuple(ids) for ids in self._table.parcels_ids])
+        return ([truck.left_capacity for truck in self.trucks],
+                [tuple(truck.route) for truck in self.trucks],
+                [tuple(truck.parcels_id) for truck in self.trucks])
+
+    def restore(self, snapshot: FleetSnapshot) -> None:
+        """Reset every truck in this fleet to its state in <snapshot>.
+
+        This takes time proportional to the number of trucks plus the length
+        of their routes and parcel lists in <snapshot>, and does not copy or
+        create any Truck objects.
+
+        Precondition: <snapshot> was returned by <self>.snapshot(), and no
+        trucks have been added to this fleet since.
+        """
+        lefts, routes, parcels_ids = snapshot
+        if len(lefts) != len(self.trucks):
+            raise ValueError('snapshot is of a fleet with a different number '
+                             'of trucks')
+        if self._table is not None:
+            self._table.left_capacities[:] = array('q', lefts)
+            self._table.routes[:] = [list(route) for route in routes]
+            self._table.parcels_ids[:] = [list(ids) for ids in parcels_ids]
+            if self._dmap is not None:
+                self.bind(self._dmap)
+            return
+        for truck, left, route, ids in zip(self.trucks, lefts, routes,
+                                           parcels_ids):
+            truck.left_capacity = left
+            truck.route = list(route)
+            truck.parcels_id = list(ids)
+
     def parcel_allocations(self) -> Dict[int, List[int]]:
         """Return a dictionary in which each key is the ID of a truck in this
         fleet and its value is a list of the IDs of the parcels packed onto it,
@@ -315,7 +919,8 @@ class Fleet:
 
     def total_distance_travelled(self, dmap: DistanceMap) -> int:
         """Return the total distance travelled by the trucks in this fleet,
-        according to the distances in <dmap>.
+        according to the distances in <dmap>.  If this fleet is bound to
+        <dmap> (see bind), this takes constant time.
 
         Precondition: <dmap> contains all distances required to compute the
                       average distance travelled.
@@ -340,14 +945,12 @@ class Fleet:
         >>> f.total_distance_travelled(m)
         36
         """
+        if dmap is self._dmap:
+            return self._distance[0]
         total = 0
         for truck in self.trucks:
-            if truck.route[0] == truck.route[1]:
-                total = total + 0
-            else:
-                for i in range(0, len(truck.route) - 1):
-                    d = dmap.distance(truck.route[i], truck.route[i+1])
-                    total = total + d
+            if truck.route[0] != truck.route[1]:
+                total = total + dmap.route_distance(truck.route)
         return total
 
     def average_distance_travelled(self, dmap: DistanceMap) -> float:
@@ -380,17 +983,92 @@ class Fleet:
         18.0
         """
         n = 0
+        total = 0
         for truck in self.trucks:
             if truck.route[0] != truck.route[1]:
                 n = n + 1
-        total = self.total_distance_travelled(dmap)
+                if dmap is not self._dmap:
+                    total = total + dmap.route_distance(truck.route)
+        if dmap is self._dmap:
+            total = self._distance[0]
         return total / n
 
+    def stats(self, dmap: DistanceMap) -> Dict[str, Union[int, float]]:
+        """Return the statistics of this fleet, computed in a single pass over
+        its trucks, according to the distances in <dmap>.
+
+        The keys are 'fleet', 'nonempty_trucks', 'unused_space',
+        'avg_fullness', 'total_distance' and 'avg_distance', with the same
+        values as num_trucks, num_nonempty_trucks, total_unused_space,
+        average_fullness, total_distance_travelled and
+        average_distance_travelled.  The averages are 0.0 when there is
+        nothing to average over.  If this fleet is bound to <dmap> (see bind),
+        no routes are measured.
+
+        Precondition: <dmap> contains all distances required to compute the
+                      distance travelled.
+
+        >>> f = Fleet()
+        >>> t1 = Truck(1423, 10, 'Toronto')
+        >>> p1 = Parcel(1, 5, 'Toronto', 'Hamilton')
+        >>> t1.pack(p1)
+        True
+        >>> f.add_truck(t1)
+        >>> f.add_truck(Truck(1333, 10, 'Toronto'))
+        >>> from distance_map import DistanceMap
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> f.stats(m) == {'fleet': 2, 'nonempty_trucks': 1,
+        ...                'unused_space': 5, 'avg_fullness': 25.0,
+        ...                'total_distance': 18, 'avg_distance': 18.0}
+        True
+        """
+        nonempty = 0
+        unused = 0
+        fullness = 0
+        travelled = 0
+        distance = 0
+        if self._table is None:
+            routes = []
+            for truck in self.trucks:
+                total = truck.total_capacity
+                left = truck.left_capacity
+                if total > left:
+                    nonempty = nonempty + 1
+                    unused = unused + left
+                    fullness = fullness + ((total - left) / total) * 100
+                routes.append(truck.route)
+        else:
+            totals = self._table.total_capacities
+            lefts = self._table.left_capacities
+            used = list(map(sub, totals, lefts))
+            nonempty = len(used) - used.count(0)
+            unused = sum(compress(lefts, used))
+            fullness = sum(map(truediv, used, totals)) * 100
+            routes = self._table.routes
+        for route in routes:
+            if route[0] != route[1]:
+                travelled = travelled + 1
+                if dmap is not self._dmap:
+                    distance = distance + dmap.route_distance(route)
+        if dmap is self._dmap:
+            distance = self._distance[0]
+        n = len(self.trucks)
+        return {
+            'fleet': n,
+            'nonempty_trucks': nonempty,
+            'unused_space': unused,
+            'avg_fullness': fullness / n if n else 0.0,
+            'total_distance': distance,
+            'avg_distance': distance / travelled if travelled else 0.0
+        }
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'itertools', 'operator',
                                    'distance_map'],
         'disable': ['E1136'],
         'max-attributes': 15,
@@ -1,8 +1,16 @@
-from typing import List, Dict, Union
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, Union
+from array import array
+from itertools import islice
 import json
-from scheduler import RandomScheduler, GreedyScheduler, Scheduler
-from domain import Parcel, Truck, Fleet
+import os
+from scheduler import RandomScheduler, GreedyScheduler, DistanceScheduler, \
+    LNSScheduler, BinPackingScheduler, Scheduler
+from domain import Parcel, Truck, Fleet, ParcelTable, TruckTable
 from distance_map import DistanceMap
+from cache import cache_path, read_columns, write_columns
+from route_optimizer import EXACT_THRESHOLD, optimize_routes
+from partition import PartitionedScheduler
+from instrument import Profiler, Report
 
 
 class SchedulingExperiment:
@@ -23,13 +31,34 @@ class SchedulingExperiment:
     scheduler:
       The scheduler to use in this experiment.
     parcels:
-      The parcels to schedule in this experiment.
+      The parcels to schedule in this experiment, in a list or, if the
+      experiment is compact, in a ParcelTable.  Empty if the experiment
+      streams its parcels.
+    batch_size:
+      If positive, parcels are not read up front: <run> reads them from the
+      parcel file in batches of this many parcels and schedules each batch
+      as soon as it is read.
     fleet:
       The trucks that parcels are scheduled to in this experiment.
     dmap:
       The distances between cities in this experiment.
+    profiler:
+      The profiler that this experiment and its scheduler report the time
+      spent in each stage, the work done and the peak memory into.
 
     === Private Attributes ===
+    _parcel_file:
+      The path to the file the parcels are read from.
+    _compact:
+      True iff parcels and trucks are stored in tables.
+    _route_budget:
+      The time in seconds to spend improving the route of each truck after
+      scheduling, or None if routes are left in packing order.
+    _route_workers:
+      The number of worker processes that improve routes, or None for one
+      per CPU.
+    _route_exact_threshold:
+      Routes with at most this many stops are replaced by a shortest route.
     _stats:
       A dictionary of statistics. <_stats>'s value is undefined until
       <self>._compute_stats is called, at which point it contains keys and
@@ -47,29 +76,110 @@ class SchedulingExperiment:
     """
     verbose: bool
     scheduler: Scheduler
-    parcels: List[Parcel]
+    parcels: Union[List[Parcel], ParcelTable]
+    batch_size: int
     fleet: Fleet
     dmap: DistanceMap
+    profiler: Profiler
+    _parcel_file: str
+    _compact: bool
+    _route_budget: Optional[float]
+    _route_workers: Optional[int]
+    _route_exact_threshold: int
     _stats: Dict[str, Union[int, float]]
     _unscheduled: List[Parcel]
 
-    def __init__(self, config: Dict[str, Union[str, bool]]) -> None:
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 inputs: Optional[Tuple[Union[List[Parcel], ParcelTable],
+                                        Fleet, DistanceMap]] = None) -> None:
         """Initialize a new experiment with the configuration specified in
         <config>.
 
+        If <inputs> is not None, it is the parcels, fleet and distance map to
+        use, as returned by read_inputs(<config>), and no files are read.
+        The experiment mutates the trucks in the fleet when it runs.  The
+        fleet is bound to the distance map (see Fleet.bind), so the distance
+        it travels is kept up to date as trucks are packed.
+
         Precondition: <config> contains keys and values as specified
-        in Assignment 1.
+        in Assignment 1.  It may also contain the key 'compact'; if its value
+        is True, parcels and trucks are stored in a ParcelTable and a
+        TruckTable instead of as separate objects.  It may also contain the
+        key 'batch_size', the number of parcels per batch when streaming
+        parcels (see <batch_size>), and the key 'cache'; if its value is
+        True, the parsed input files are cached as binary columns and loaded
+        from the cache on later runs (see read_parcels).  Streamed parcels
+        are always read from the text file.  If it contains the key
+        'shortest_paths' with the value True, distances are shortest paths
+        through the map (see read_distance_map).  For the random algorithm,
+        it may contain the key 'seed', the seed for the RandomScheduler.  For
+        the greedy algorithm, it may contain the key 'batch_packing'; if its
+        value is True, parcels are packed in groups by destination (see
+        GreedyScheduler).  The
+        algorithm 'distance' is a DistanceScheduler, configured with the same
+        keys as the greedy algorithm.  The algorithm 'lns' is an
+        LNSScheduler, configured like 'distance' plus the keys 'time_budget',
+        the seconds to spend improving each schedule (1.0 by default), and
+        'seed'.  The algorithms 'ffd' and 'bfd' are a BinPackingScheduler,
+        using first fit or best fit decreasing.  If <config> contains the key
+        'partitions' with a value above 1, the algorithm runs separately on
+        up to that many regions of the map (see PartitionedScheduler), in
+        'partition_workers' worker processes (1 by default), each region
+        seeded from 'seed'.
+
+        If <config> contains the key 'optimize_routes' with the value True,
+        the route of every truck is improved after scheduling (see
+        optimize_routes), for 'route_time_budget' seconds per truck (0.05 by
+        default) in 'route_workers' worker processes (1 by default).  Routes
+        with at most 'route_exact_threshold' stops (EXACT_THRESHOLD by
+        default) are solved exactly.
+
+        If <config> contains the key 'profile' with the value True, the time
+        spent reading, scheduling and computing statistics, and in each phase
+        of the scheduler, is recorded in <self>.profiler along with counts of
+        the work done (see profile).  If it contains the key 'profile_memory'
+        with the value True, the peak memory of each stage is recorded as
+        well.  Stages are always recorded, and printed as they end, when
+        <self>.verbose is True.
         """
-        self.verbose = config['verbose']
+        # Only a true boolean turns on verbose output, not a string such as
+        # 'false'.
+        self.verbose = config['verbose'] is True
+        profile_memory = config.get('profile_memory', False)
+        self.profiler = Profiler(
+            config.get('profile', False) or profile_memory or self.verbose,
+            profile_memory, self.verbose)
+        self._compact = config.get('compact', False)
+        self._parcel_file = config['parcel_file']
+        self.batch_size = config.get('batch_size', 0)
+        self._route_budget = None
+        if config.get('optimize_routes', False):
+            self._route_budget = config.get('route_time_budget', 0.05)
+        self._route_workers = config.get('route_workers', 1)
+        self._route_exact_threshold = config.get('route_exact_threshold',
+                                                 EXACT_THRESHOLD)
+        if inputs is None:
+            with self.profiler.phase('read'):
+                inputs = read_inputs(config)
+        self.parcels, self.fleet, self.dmap = inputs
+        self.fleet.bind(self.dmap)
         if config['algorithm'] == 'random':
-            self.scheduler = RandomScheduler()
+            self.scheduler = RandomScheduler(config.get('seed'))
         if config['algorithm'] == 'greedy':
             self.scheduler = GreedyScheduler(config)
-
-        self.parcels = read_parcels(config['parcel_file'])
-        self.fleet = read_trucks(config['truck_file'],
-                                 config['depot_location'])
-        self.dmap = read_distance_map(config['map_file'])
+        if config['algorithm'] == 'distance':
+            self.scheduler = DistanceScheduler(config, self.dmap)
+        if config['algorithm'] == 'lns':
+            self.scheduler = LNSScheduler(config, self.dmap,
+                                          config.get('time_budget', 1.0),
+                                          config.get('seed'))
+        if config['algorithm'] in ('ffd', 'bfd'):
+            self.scheduler = BinPackingScheduler(config['algorithm'] == 'bfd')
+        if config.get('partitions', 1) > 1:
+            self.scheduler = PartitionedScheduler(
+                self.scheduler, self.dmap, config['partitions'],
+                config.get('partition_workers', 1), config.get('seed'))
+        self.scheduler.profiler = self.profiler
 
         self._stats = {}
         self._unscheduled = []
@@ -86,14 +196,42 @@ class SchedulingExperiment:
         If <self.verbose> is True, print step-by-step details
         regarding the scheduling algorithm as it runs.
         """
-        self._unscheduled = self.scheduler.schedule(self.parcels,
-                                                    self.fleet.trucks)
-
-        self._compute_stats()
+        with self.profiler.phase('schedule'):
+            if self.batch_size > 0:
+                self._unscheduled = []
+                for batch in iter_parcels(self._parcel_file, self.batch_size,
+                                          self._compact):
+                    self._unscheduled.extend(self.scheduler.schedule(
+                        batch, self.fleet.trucks, self.verbose))
+                    self.profiler.count('batches')
+            else:
+                self._unscheduled = self.scheduler.schedule(
+                    self.parcels, self.fleet.trucks, self.verbose)
+        if self._route_budget is not None:
+            with self.profiler.phase('optimize_routes'):
+                optimize_routes(self.fleet, self.dmap, self._route_budget,
+                                self._route_workers,
+                                self._route_exact_threshold)
+
+        with self.profiler.phase('stats'):
+            self._compute_stats()
         if report:
             self._print_report()
         return self._stats
 
+    def profile(self) -> Report:
+        """Return what <self>.profiler has recorded so far (see
+        Profiler.report): the seconds spent in the stages 'read' (unless the
+        inputs were given), 'schedule', 'optimize_routes' (if routes are
+        optimized) and 'stats', and in the phases of the scheduler nested in
+        'schedule', the peak memory of each if it was traced, and the counts
+        of the work done, such as 'parcels_placed' and 'trucks_scanned'.
+
+        The result is empty unless profiling is turned on in the
+        configuration of this experiment.
+        """
+        return self.profiler.report()
+
     def _compute_stats(self) -> None:
         """Compute the statistics for this experiment, and store in
         <self>.stats. Keys and values are as specified in Step 6 of
@@ -101,13 +239,13 @@ class SchedulingExperiment:
 
         Precondition: _run has already been called.
         """
-        unused = self.fleet.num_trucks() - self.fleet.num_nonempty_trucks()
+        stats = self.fleet.stats(self.dmap)
         self._stats = {
-            'fleet': self.fleet.num_trucks(),
-            'unused_trucks': unused,
-            'avg_distance': self.fleet.average_distance_travelled(self.dmap),
-            'avg_fullness': self.fleet.average_fullness(),
-            'unused_space': self.fleet.total_unused_space(),
+            'fleet': stats['fleet'],
+            'unused_trucks': stats['fleet'] - stats['nonempty_trucks'],
+            'avg_distance': stats['avg_distance'],
+            'avg_fullness': stats['avg_fullness'],
+            'unused_space': stats['unused_space'],
             'unscheduled': len(self._unscheduled)
         }
 
@@ -126,62 +264,230 @@ class SchedulingExperiment:
 # ----- Helper functions -----
 
 
-def read_parcels(parcel_file: str) -> List[Parcel]:
-    """Read parcel data from <parcel_file> and return.
+def _malformed(number: int, line: str) -> ValueError:
+    """Return the error for <line>, line <number> of an input file, which is
+    neither blank nor in the form specified in Assignment 1.
+    """
+    return ValueError(f'line {number}: malformed line {line.strip()!r}')
+
+
+def _add_parcels(parcels: Union[List[Parcel], ParcelTable],
+                 lines: Iterable[str], first: int = 1) -> None:
+    """Parse each line of parcel data in <lines>, numbered from <first>, and
+    add the parcel to the end of <parcels>.  Blank lines are skipped.  Raise
+    a ValueError naming the line if any other line is not made of a parcel
+    ID, source, destination and volume.
+
+    >>> parcels = []
+    >>> _add_parcels(parcels, ['1, A, B, 5', '', '2, A, C'], 7)
+    Traceback (most recent call last):
+    ...
+    ValueError: line 9: malformed line '2, A, C'
+    >>> [p.parcel_id for p in parcels]
+    [1]
+    """
+    table = parcels if isinstance(parcels, ParcelTable) else None
+    for number, line in enumerate(lines, first):
+        # Blank and malformed lines both fail to unpack or convert, so they
+        # are only told apart, and checked for, when that happens.
+        try:
+            pid, source, destination, volume = line.split(',')
+            # int() ignores surrounding whitespace, so only names are
+            # stripped.
+            pid = int(pid)
+            volume = int(volume)
+        except ValueError:
+            if line.isspace() or not line:
+                continue
+            raise _malformed(number, line) from None
+        if table is None:
+            parcels.append(Parcel(pid, volume, source.strip(),
+                                  destination.strip()))
+        else:
+            table.add(pid, volume, source.strip(), destination.strip())
+
+
+def iter_parcels(parcel_file: str, batch_size: int = 10000,
+                 compact: bool = False) \
+        -> Iterator[Union[List[Parcel], ParcelTable]]:
+    """Read parcel data from <parcel_file> and yield it in batches of at most
+    <batch_size> parcels, each as a list of parcels or, if <compact> is True,
+    as a ParcelTable.  Only one batch is held in memory at a time.  Lines
+    are parsed as in read_parcels.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data in
+                  the form specified in Assignment 1, and <batch_size> > 0.
+    """
+    first = 1
+    with open(parcel_file, 'r') as file:
+        while True:
+            lines = list(islice(file, batch_size))
+            if not lines:
+                return
+            batch = ParcelTable() if compact else []
+            _add_parcels(batch, lines, first)
+            first = first + len(lines)
+            yield batch
+
+
+def read_parcels(parcel_file: str, compact: bool = False,
+                 cache: bool = False) -> Union[List[Parcel], ParcelTable]:
+    """Read parcel data from <parcel_file> and return it as a list of parcels,
+    or as a ParcelTable if <compact> or <cache> is True.
+
+    If <cache> is True, the parsed columns are loaded from the cache file for
+    the current contents of <parcel_file>, which is written first if it does
+    not exist yet.  The returned table is then backed by the mapped cache
+    file, and no more parcels can be added to it.
+
+    Blank lines are skipped.  Any other line that is not in the form
+    specified in Assignment 1 raises a ValueError naming its line number.
 
     Precondition: <parcel_file> is the path to a file containing parcel data in
                   the form specified in Assignment 1.
     """
-    parcels = []
-    # read and add the parcels to the list.
+    if cache:
+        path = cache_path(parcel_file, 'parcels')
+        if not os.path.exists(path):
+            table = read_parcels(parcel_file, compact=True)
+            write_columns(path, {'cities': table.cities},
+                          [('parcel_ids', table.parcel_ids),
+                           ('volumes', table.volumes),
+                           ('sources', table.sources),
+                           ('destinations', table.destinations)])
+        meta, columns = read_columns(path)
+        table = ParcelTable()
+        for city in meta['cities']:
+            table.city_code(city)
+        table.parcel_ids = columns['parcel_ids']
+        table.volumes = columns['volumes']
+        table.sources = columns['sources']
+        table.destinations = columns['destinations']
+        return table
+    parcels = ParcelTable() if compact else []
     with open(parcel_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split(',')
-            pid = int(tokens[0].strip())
-            source = tokens[1].strip()
-            destination = tokens[2].strip()
-            volume = int(tokens[3].strip())
-            p = Parcel(pid, volume, source, destination)
-            parcels.append(p)
+        _add_parcels(parcels, file)
     return parcels
 
 
-def read_distance_map(distance_map_file: str) -> DistanceMap:
-    """Read distance data from <distance_map_file> and return a DistanceMap
-    that records it.
+def read_distance_map(distance_map_file: str, cache: bool = False,
+                      shortest_paths: bool = False) -> DistanceMap:
+    """Read distance data from <distance_map_file> and return a frozen
+    DistanceMap that records it.
+
+    If <shortest_paths> is True, the map is closed (see DistanceMap.close),
+    so that it holds the shortest distance between every two connected
+    cities, not only the distances listed in the file.
+
+    If <cache> is True, the distance matrix is loaded from the cache file for
+    the current contents of <distance_map_file>, which is written first if it
+    does not exist yet.  Closed maps have a cache file of their own.
+
+    As in read_parcels, blank lines are skipped and a malformed line raises
+    a ValueError naming its line number.
 
     Precondition: <distance_map_file> is the path to a file containing distance
                   data in the form specified in Assignment 1.
     """
     dmap = DistanceMap()
+    if cache:
+        path = cache_path(distance_map_file,
+                          'closure' if shortest_paths else 'map')
+        if not os.path.exists(path):
+            cities, matrix = read_distance_map(
+                distance_map_file, shortest_paths=shortest_paths).matrix()
+            write_columns(path, {'cities': cities}, [('matrix', matrix)])
+        meta, columns = read_columns(path)
+        dmap.load_matrix(meta['cities'], columns['matrix'])
+        return dmap
     with open(distance_map_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split(',')
-            c1 = tokens[0].strip()
-            c2 = tokens[1].strip()
-            distance1 = int(tokens[2].strip())
-            distance2 = int(tokens[3].strip()) if len(tokens) == 4 \
-                else distance1
-            dmap.add_distance(c1, c2, distance1, distance2)
+        for number, line in enumerate(file, 1):
+            if line.isspace() or not line:
+                continue
+            tokens = line.split(',')
+            try:
+                if len(tokens) not in (3, 4):
+                    raise ValueError
+                distance1 = int(tokens[2])
+                distance2 = int(tokens[3]) if len(tokens) == 4 \
+                    else distance1
+            except ValueError:
+                raise _malformed(number, line) from None
+            dmap.add_distance(tokens[0].strip(), tokens[1].strip(),
+                              distance1, distance2)
+    if shortest_paths:
+        dmap.close()
+    else:
+        dmap.freeze()
     return dmap
 
 
-def read_trucks(truck_file: str, depot_location: str) -> Fleet:
+def read_trucks(truck_file: str, depot_location: str,
+                compact: bool = False, cache: bool = False) -> Fleet:
     """Read truck data from <truck_file> and return a Fleet containing these
-    trucks, with each truck starting at the <depot_location>.
+    trucks, with each truck starting at the <depot_location>.  If <compact> or
+    <cache> is True, the trucks are stored in a TruckTable.
+
+    If <cache> is True, the truck IDs and capacities are loaded from the cache
+    file for the current contents of <truck_file>, which is written first if
+    it does not exist yet.
+
+    As in read_parcels, blank lines are skipped and a malformed line raises
+    a ValueError naming its line number.
 
     Precondition: <truck_file> is a path to a file containing truck data in the
                   form specified in Assignment 1.
     """
+    if cache:
+        path = cache_path(truck_file, 'trucks')
+        if not os.path.exists(path):
+            trucks = read_trucks(truck_file, depot_location).trucks
+            write_columns(path, {}, [
+                ('truck_ids', array('q', [t.truck_id for t in trucks])),
+                ('capacities', array('q', [t.total_capacity
+                                           for t in trucks]))])
+        _, columns = read_columns(path)
+        table = TruckTable()
+        for tid, capacity in zip(columns['truck_ids'],
+                                 columns['capacities']):
+            table.add(tid, capacity, depot_location)
+        return Fleet(table)
+    table = TruckTable() if compact else None
     f = Fleet()
     with open(truck_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split(',')
-            tid = int(tokens[0])
-            capacity = int(tokens[1])
-            t = Truck(tid, capacity, depot_location)
-            f.add_truck(t)
-    return f
+        for number, line in enumerate(file, 1):
+            try:
+                tid, capacity = line.split(',')
+                tid = int(tid)
+                capacity = int(capacity)
+            except ValueError:
+                if line.isspace() or not line:
+                    continue
+                raise _malformed(number, line) from None
+            if compact:
+                table.add(tid, capacity, depot_location)
+            else:
+                f.add_truck(Truck(tid, capacity, depot_location))
+    return Fleet(table) if compact else f
+
+
+def read_inputs(config: Dict[str, Union[str, bool]]) \
+        -> Tuple[Union[List[Parcel], ParcelTable], Fleet, DistanceMap]:
+    """Read the parcels, trucks and distances for an experiment with the
+    configuration <config>, as described in SchedulingExperiment.__init__.
+    The parcels are an empty list if the experiment streams its parcels.
+    """
+    compact = config.get('compact', False)
+    cache = config.get('cache', False)
+    if config.get('batch_size', 0) > 0:
+        parcels = []
+    else:
+        parcels = read_parcels(config['parcel_file'], compact, cache)
+    fleet = read_trucks(config['truck_file'], config['depot_location'],
+                        compact, cache)
+    dmap = read_distance_map(config['map_file'], cache,
+                             config.get('shortest_paths', False))
+    return parcels, fleet, dmap
 
 
 def simple_check(config_file: str) -> None:
@@ -204,11 +510,13 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'allowed-io': ['read_parcels', 'read_distance_map', 'read_trucks',
-                       '_print_report', 'simple_check'],
+        'allowed-io': ['read_parcels', 'iter_parcels', 'read_distance_map',
+                       'read_trucks', '_print_report', 'simple_check'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'json', 'scheduler', 'domain',
-                                   'distance_map'],
+                                   'array', 'itertools', 'json', 'os',
+                                   'scheduler', 'domain', 'distance_map',
+                                   'cache', 'route_optimizer', 'partition',
+                                   'instrument'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
@@ -1,6 +1,22 @@
-from typing import TextIO, Dict, Union
+from typing import TextIO, Dict, List, Optional, Tuple, Union
+import argparse
 import json
-from experiment import SchedulingExperiment
+import os
+import statistics
+from multiprocessing import Pool
+from distance_map import DistanceMap
+from domain import Fleet, Parcel, ParcelTable
+from experiment import SchedulingExperiment, read_inputs
+from instrument import Report, write_csv, write_json
+
+# The parsed inputs shared by every experiment run in this process, under the
+# key 'inputs', and a snapshot of the fleet before scheduling, under the key
+# 'snapshot'.  Set by _share_inputs in the parent process and in each worker
+# process; workers created by fork share the parent's copy of the inputs.
+_SHARED = {}
+
+# The keys of an algorithm configuration, which label each row of a profile.
+_CONFIG_KEYS = ('algorithm', 'parcel_priority', 'parcel_order', 'truck_order')
 
 
 def print_table_title(file: TextIO) -> None:
@@ -30,17 +46,53 @@ def print_table_row(config: Dict[str, Union[str, bool]],
                f'{stats["unscheduled"]}\n')
 
 
-def compare_algorithms(config_file: str) -> None:
+def _share_inputs(inputs: Tuple[Union[List[Parcel], ParcelTable], Fleet,
+                                 DistanceMap]) -> None:
+    """Make <inputs> the parsed inputs used by _run_configuration in this
+    process.
+    """
+    _SHARED['inputs'] = inputs
+    _SHARED['snapshot'] = inputs[1].snapshot()
+
+
+def _run_configuration(config: Dict[str, Union[str, bool]]) \
+        -> Tuple[Dict[str, Union[int, float]], Report]:
+    """Run an experiment with <config> on the shared parsed inputs, after
+    resetting the shared fleet to its state before scheduling, and return
+    its statistics and profile.
+    """
+    inputs = _SHARED['inputs']
+    inputs[1].restore(_SHARED['snapshot'])
+    expt = SchedulingExperiment(config, inputs)
+    return expt.run(report=False), expt.profile()
+
+
+def compare_algorithms(config_file: str, workers: Optional[int] = 1,
+                       results_file: str = 'data/results.csv') -> None:
     """Compare all algorithms on a single problem.
 
-    Run the random algorithm and every configuration of the greedy
-    algorithm on the scheduling problem defined in <config_file>.
+    Run the random algorithm, every configuration of the greedy algorithm,
+    and the first-fit and best-fit decreasing algorithms on the scheduling
+    problem defined in <config_file>.
+
+    The input files are read once and shared by all the experiments, even
+    if the configuration streams parcels in batches.  If <workers> is not 1,
+    the experiments run in a pool of that many worker processes (or one per
+    CPU, if <workers> is None).  The rows of the results table are in the
+    same order either way.
+
+    The results table is written to <results_file>.  If the configuration
+    turns on profiling (see SchedulingExperiment), the profile of every
+    experiment is also written to 'profile.json' and 'profile.csv' in the
+    same directory, one row per algorithm configuration.
 
     Precondition: <config_file> a path to a json file with keys and values
     as in the dictionary format defined in Assignment 1.
     """
     with open(config_file, 'r') as file:
-        basic_config = json.load(file)
+        # Streamed parcels cannot be shared, so they are all read up front,
+        # and no experiment streams them again.
+        basic_config = dict(json.load(file), batch_size=0)
 
     # We will use the keys 'parcel_file', 'fleet_file' and 'map_file' from
     # the dict <basic_config>.
@@ -87,35 +139,150 @@ def compare_algorithms(config_file: str) -> None:
         {'algorithm': 'greedy',
          'parcel_priority': 'destination',
          'parcel_order': 'non-increasing',
-         'truck_order': 'non-increasing'}
+         'truck_order': 'non-increasing'},
+        # --- Bin packing: first fit and best fit decreasing
+        {'algorithm': 'ffd',
+         'parcel_priority': 'volume',
+         'parcel_order': 'non-increasing',
+         'truck_order': 'NA'},
+        {'algorithm': 'bfd',
+         'parcel_priority': 'volume',
+         'parcel_order': 'non-increasing',
+         'truck_order': 'non-decreasing'}
     ]
 
-    with open('data/results.csv', 'w') as file:
+    # Start with the basic configuration <config>, and add the algorithm
+    # details from each item in our list of configurations.
+    configs = []
+    for item in algorithm_configurations:
+        config = basic_config.copy()
+        config.update(item)
+        configs.append(config)
+
+    _share_inputs(read_inputs(basic_config))
+    if workers == 1:
+        results = [_run_configuration(config) for config in configs]
+    else:
+        with Pool(workers, _share_inputs, (_SHARED['inputs'],)) as pool:
+            results = pool.map(_run_configuration, configs, chunksize=1)
+
+    with open(results_file, 'w') as file:
         print_table_title(file)
-        for item in algorithm_configurations:
-            # Start with the basic configuration <config>, and add the
-            # algorithm details from this item in our list of configurations.
-            config = basic_config.copy()
-            config.update(item)
-            # Run an experiment on this configuration and print the results
-            # to our csv file.
-            expt = SchedulingExperiment(config)
-            results = expt.run(report=False)
-            print_table_row(config, results, file)
+        for config, (stats, _) in zip(configs, results):
+            print_table_row(config, stats, file)
+    if any(profile for _, profile in results):
+        rows = [dict({key: config[key] for key in _CONFIG_KEYS}, **profile)
+                for config, (_, profile) in zip(configs, results)]
+        directory = os.path.dirname(results_file)
+        write_json(os.path.join(directory, 'profile.json'), rows)
+        write_csv(os.path.join(directory, 'profile.csv'), rows)
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    """Return the mean, standard deviation, and 5th, 50th and 95th
+    percentiles of <values>.  Percentiles interpolate linearly between the
+    closest ranks.
+
+    Precondition: <values> is not empty.
+
+    >>> _summarize([4, 1, 3, 2]) == {'mean': 2.5, 'stdev': 1.2909944487358056,
+    ...                              'p5': 1.15, 'p50': 2.5, 'p95': 3.85}
+    True
+    """
+    values = sorted(values)
+    summary = {'mean': statistics.fmean(values),
+               'stdev': statistics.stdev(values) if len(values) > 1 else 0.0}
+    for q in (5, 50, 95):
+        position = (len(values) - 1) * q / 100
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        summary[f'p{q}'] = values[low] + \
+            (values[high] - values[low]) * (position - low)
+    return summary
+
+
+def monte_carlo_random(config_file: str, replicates: int, base_seed: int = 0,
+                       workers: Optional[int] = 1,
+                       summary_file: Optional[str] = None,
+                       results_file: str = 'data/results.csv') \
+        -> Dict[str, Dict[str, float]]:
+    """Run <replicates> independent experiments with the random algorithm on
+    the scheduling problem defined in <config_file>, and return a summary of
+    each statistic: its mean, standard deviation and percentiles (see
+    _summarize).  The summary is also written to <summary_file>, or to
+    'random-summary.csv' in the same directory as <results_file> if
+    <summary_file> is None.
+
+    The input files are read once and shared by all the replicates, which
+    run in a pool of <workers> processes as in compare_algorithms.
+    Replicate i uses the seed '<base_seed>-<i>', so the same <base_seed>
+    always gives the same results.
+
+    Precondition: <config_file> a path to a json file with keys and values
+    as in the dictionary format defined in Assignment 1, and <replicates> > 0.
+    """
+    with open(config_file, 'r') as file:
+        # As in compare_algorithms, the parcels are read up front.
+        basic_config = dict(json.load(file), batch_size=0)
+    configs = [dict(basic_config, algorithm='random', seed=f'{base_seed}-{i}')
+               for i in range(replicates)]
+    _share_inputs(read_inputs(basic_config))
+    if workers == 1:
+        results = [_run_configuration(config) for config in configs]
+    else:
+        with Pool(workers, _share_inputs, (_SHARED['inputs'],)) as pool:
+            results = pool.map(_run_configuration, configs)
+    results = [stats for stats, _ in results]
+
+    summary = {stat: _summarize([stats[stat] for stats in results])
+               for stat in results[0]}
+    if summary_file is None:
+        summary_file = os.path.join(os.path.dirname(results_file),
+                                    'random-summary.csv')
+    with open(summary_file, 'w') as file:
+        file.write(f'Stat ({replicates} replicates),Mean,Stdev,P5,P50,P95\n')
+        for stat, s in summary.items():
+            file.write(f'{stat},{s["mean"]:.2f},{s["stdev"]:.2f},'
+                       f'{s["p5"]:.2f},{s["p50"]:.2f},{s["p95"]:.2f}\n')
+    return summary
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['compare_algorithms'],
+        'allowed-io': ['compare_algorithms', 'monte_carlo_random'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'json', 'experiment'],
+                                   'argparse', 'json', 'os', 'statistics',
+                                   'multiprocessing', 'distance_map',
+                                   'domain', 'experiment', 'instrument'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
     # ------------------------------------------------------------------------
     # The following code can be used to explore how the different scheduling
     # algorithms compare on one example configuration.  It creates a report
-    # in file 'data/results.csv'.
+    # in file 'data/results.csv', or the file given by --results-file.
     # ------------------------------------------------------------------------
-    compare_algorithms('data/demo.json')
+    parser = argparse.ArgumentParser(
+        description='Compare the scheduling algorithms on one problem.')
+    parser.add_argument('config_file', nargs='?', default='data/demo.json')
+    parser.add_argument('--results-file', default='data/results.csv',
+                        help='where to write the results table')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes (0 for one per CPU)')
+    parser.add_argument('--random-replicates', type=int, default=0,
+                        help='also run this many seeded replicates of the '
+                             'random algorithm and summarize them')
+    parser.add_argument('--summary-file', default=None,
+                        help='where to write the summary of the random '
+                             'replicates (random-summary.csv next to the '
+                             'results table by default)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base seed for the random replicates')
+    args = parser.parse_args()
+    compare_algorithms(args.config_file, args.workers or None,
+                       args.results_file)
+    if args.random_replicates > 0:
+        monte_carlo_random(args.config_file, args.random_replicates,
+                           args.seed, args.workers or None,
+                           args.summary_file, args.results_file)
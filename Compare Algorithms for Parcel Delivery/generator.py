@@ -1,57 +1,184 @@
-from random import randint, choice
+from typing import Iterator, List, Optional, Tuple
+from itertools import accumulate, islice
+from math import gcd, hypot
+from random import Random
+import argparse
+
+# The cities used when no number of cities is given.
+CITIES = ['Belleville', 'Guelph', 'Hamilton', 'Toronto', 'London', 'Ottawa']
+
+# The number of lines formatted and written to a file at a time.
+_CHUNK = 100000
+
+# The largest number of IDs drawn as a random sample (see _distinct_ids).
+_SAMPLE_LIMIT = 1000000
+
+
+def _distinct_ids(rng: Random, pool: int, n: int) -> Iterator[int]:
+    """Yield <n> distinct IDs from range(<pool>), in random order.
+
+    Up to _SAMPLE_LIMIT IDs are a uniform random sample.  More IDs than that
+    are not kept in memory: they are a * i + b modulo <pool> for i in
+    range(<n>), with a random multiplier a that is coprime to <pool> and a
+    random offset b, so that no ID repeats.
+
+    Precondition: <n> <= <pool>
+    """
+    if n <= _SAMPLE_LIMIT:
+        yield from rng.sample(range(pool), n)
+        return
+    a = rng.randrange(1, pool)
+    while gcd(a, pool) != 1:
+        a = rng.randrange(1, pool)
+    b = rng.randrange(pool)
+    for i in range(n):
+        yield (a * i + b) % pool
+
+
+def _write_chunks(filename: str, chunks: Iterator[str]) -> None:
+    """Write each string in <chunks> to the file <filename>, in one write
+    each.
+    """
+    with open(filename, 'w', buffering=1 << 20) as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+
+def _join_lines(lines: Iterator[str]) -> Iterator[str]:
+    """Yield the strings in <lines> joined _CHUNK at a time.
+    """
+    while True:
+        chunk = ''.join(islice(lines, _CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parcel_chunks(rng: Random, cities: List[str], depot: str,
+                   weights: List[float], ids: Iterator[int],
+                   volumes: Tuple[int, int]) -> Iterator[str]:
+    """Yield the lines of parcel data for the IDs in <ids>, _CHUNK lines at a
+    time.  Each parcel has a random source among <cities>, a destination
+    drawn with <weights> among the <cities> other than the source and the
+    depot (unless the source is the depot), and a volume in the range
+    <volumes>.
+
+    Sources, destinations and volumes are drawn for a whole chunk at once,
+    then the few destinations that are not allowed are drawn again.
+    """
+    cum_weights = list(accumulate(weights))
+    volume_range = range(volumes[0], volumes[1] + 1)
+    while True:
+        chunk = list(islice(ids, _CHUNK))
+        if not chunk:
+            return
+        k = len(chunk)
+        sources = rng.choices(cities, k=k)
+        destinations = rng.choices(cities, cum_weights=cum_weights, k=k)
+        for i in [i for i in range(k)
+                  if destinations[i] == sources[i] or
+                  (destinations[i] == depot and sources[i] != depot)]:
+            source = sources[i]
+            destination = source
+            while destination == source or (destination == depot and
+                                            source != depot):
+                destination = rng.choices(cities, cum_weights=cum_weights)[0]
+            destinations[i] = destination
+        sizes = rng.choices(volume_range, k=k)
+        yield ''.join(map('{}, {}, {}, {}\n'.format, chunk, sources,
+                          destinations, sizes))
+
+
+def generate_map(map_filename: str, cities: List[str],
+                 seed: Optional[int] = None, scale: int = 500) -> None:
+    """Write a map data file with the distance between every two of <cities>,
+    to the file <map_filename>.
+
+    Each city is placed at a random point in a square of side <scale>, and
+    the distance between two cities is the rounded distance between their
+    points, but at least 1.
+    """
+    rng = Random(seed)
+    points = [(rng.random() * scale, rng.random() * scale) for _ in cities]
+
+    def lines() -> Iterator[str]:
+        for i, (x1, y1) in enumerate(points):
+            for j in range(i + 1, len(cities)):
+                x2, y2 = points[j]
+                dist = max(1, round(hypot(x1 - x2, y1 - y2)))
+                yield f'{cities[i]}, {cities[j]}, {dist}\n'
+
+    _write_chunks(map_filename, _join_lines(lines()))
 
 
 def generate(parcel_filename: str = 'data/demo-parcel-data.txt',
-             truck_filename: str = 'data/demo-truck-data.txt') -> None:
+             truck_filename: str = 'data/demo-truck-data.txt',
+             num_parcels: int = 15, num_trucks: int = 5,
+             num_cities: Optional[int] = None,
+             parcel_volumes: Tuple[int, int] = (5, 25),
+             truck_volumes: Tuple[int, int] = (20, 50),
+             seed: Optional[int] = None, depot: str = 'Toronto',
+             map_filename: Optional[str] = None,
+             hot_skew: float = 0.0) -> None:
     """Generate random truck and parcel data, and save to the files
     <parcel_filename> and <truck_filename> respectively. File format is as
     defined in Assignment 1.
+
+    There are <num_parcels> parcels, with distinct IDs drawn from a range a
+    third larger, and volumes drawn uniformly from <parcel_volumes>, and
+    <num_trucks> trucks, with distinct IDs drawn from a range twice as large,
+    and volumes drawn uniformly from <truck_volumes>.  Parcels travel between
+    the cities in CITIES or, if <num_cities> is not None, between <depot> and
+    <num_cities> - 1 cities named 'City1', 'City2', and so on.  A parcel
+    never goes to its own source, or to <depot> from another city.
+
+    If <hot_skew> is positive, destinations are skewed towards a few hot
+    cities: the city of rank r, in a random order, is picked with weight
+    1 / r ** <hot_skew>.  If <map_filename> is not None, a map data file for
+    the cities is written to it (see generate_map).  If <seed> is not None,
+    the same arguments always generate the same files.
+
+    Precondition: there are at least three cities.
     """
-    # Set constants controlling parcel data
-    num_ids_to_pick_from = 20
-    num_ids = 15
-    cities = ['Belleville', 'Guelph', 'Hamilton', 'Toronto', 'London', 'Ottawa']
-    min_volume = 5
-    max_volume = 25
-
-    depot = 'Toronto'
-
-    # Generate some random parcels
-    ids = list(range(num_ids_to_pick_from))
-    with open(parcel_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            source = choice(cities)
-            temp = cities.copy()
-            temp.remove(source)
-            if source != depot:
-                temp.remove(depot)
-            destination = choice(temp)
-            volume = randint(min_volume, max_volume)
-            file.write(f'{id_}, {source}, {destination}, {volume}\n')
-
-    # Set constants controlling truck data
-    num_ids_to_pick_from = 10
-    num_ids = 5
-    min_volume = 20
-    max_volume = 50
-
-    # Generate some random trucks
-    ids = list(range(num_ids_to_pick_from))
-    with open(truck_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            volume = randint(min_volume, max_volume)
-            file.write(f'{id_}, {volume}\n')
+    rng = Random(seed)
+    if num_cities is None:
+        cities = list(CITIES)
+    else:
+        cities = [depot] + [f'City{i}' for i in range(1, num_cities)]
+    ranks = list(range(1, len(cities) + 1))
+    rng.shuffle(ranks)
+    weights = [1 / r ** hot_skew for r in ranks]
+
+    parcel_ids = _distinct_ids(rng, max(num_parcels * 4 // 3, num_parcels),
+                               num_parcels)
+    _write_chunks(parcel_filename,
+                  _parcel_chunks(rng, cities, depot, weights, parcel_ids,
+                                 parcel_volumes))
+
+    truck_ids = _distinct_ids(rng, 2 * num_trucks, num_trucks)
+    truck_range = range(truck_volumes[0], truck_volumes[1] + 1)
+    _write_chunks(truck_filename, _join_lines(
+        f'{id_}, {rng.choice(truck_range)}\n' for id_ in truck_ids))
+
+    if map_filename is not None:
+        generate_map(map_filename, cities, seed)
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config='.pylintrc')
-    generate()
+    parser = argparse.ArgumentParser(
+        description='Generate random parcel, truck and map data.')
+    parser.add_argument('--parcels', type=int, default=15)
+    parser.add_argument('--trucks', type=int, default=5)
+    parser.add_argument('--cities', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--hot-skew', type=float, default=0.0,
+                        help='skew of destinations towards hot cities')
+    parser.add_argument('--parcel-file', default='data/demo-parcel-data.txt')
+    parser.add_argument('--truck-file', default='data/demo-truck-data.txt')
+    parser.add_argument('--map-file', default=None)
+    args = parser.parse_args()
+    generate(args.parcel_file, args.truck_file, args.parcels, args.trucks,
+             args.cities, seed=args.seed, map_filename=args.map_file,
+             hot_skew=args.hot_skew)
@@ -0,0 +1,377 @@
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Tuple, \
+    TypeVar, Union
+import argparse
+import asyncio
+import json
+import statistics
+from concurrent.futures import Executor, ThreadPoolExecutor
+from time import perf_counter
+from domain import Parcel, Truck
+from experiment import SchedulingExperiment, _add_parcels
+from scheduler import Scheduler
+
+# A parcel waiting to be scheduled, with the time it arrived.
+Arrival = Tuple[Parcel, float]
+
+# The number of characters of whole lines tail_file reads at a time.
+_READ_HINT = 1 << 16
+
+# The result of work awaited beside the consumer (see _beside).
+T = TypeVar('T')
+
+
+def _parse(line: str, number: int = 1) -> Optional[Parcel]:
+    """Return the parcel described by <line>, in the format of a parcel data
+    file, or None if <line> is blank.  Raise a ValueError naming line
+    <number> if <line> is malformed.
+    """
+    parcels = []
+    _add_parcels(parcels, [line], number)
+    return parcels[0] if parcels else None
+
+
+async def tail_file(path: str, follow: bool = False,
+                    poll: float = 0.1) -> AsyncIterator[Parcel]:
+    """Yield the parcels in the parcel data file at <path>.
+
+    If <follow> is True, keep watching the end of the file every <poll>
+    seconds and yield the parcels appended to it, forever.
+
+    The file is opened and read in a thread, _READ_HINT characters of whole
+    lines at a time, so a slow disk does not block the event loop.  As in
+    read_parcels, blank lines are skipped and a malformed line raises a
+    ValueError naming its line number.
+    """
+    file = await asyncio.to_thread(open, path, 'r')
+    with file:
+        pending = ''
+        number = 0
+        while True:
+            lines = await asyncio.to_thread(file.readlines, _READ_HINT)
+            if not lines:
+                if not follow:
+                    return
+                await asyncio.sleep(poll)
+            for line in lines:
+                if line.endswith('\n') or not follow:
+                    number = number + 1
+                    parcel = _parse(pending + line, number)
+                    pending = ''
+                    if parcel is not None:
+                        yield parcel
+                else:
+                    pending = pending + line
+
+
+async def serve_socket(host: str, port: int, connections: int = 1,
+                       queue_size: int = 1000,
+                       rejected: Optional[List[bytes]] = None) \
+        -> AsyncIterator[Parcel]:
+    """Listen on <host> and <port>, and yield the parcels sent by clients,
+    one line of parcel data at a time, until <connections> clients have
+    connected and disconnected.
+
+    A line that is not valid UTF-8 parcel data is skipped and, if <rejected>
+    is not None, appended to it.  A client that resets its connection counts
+    as disconnected.
+
+    At most <queue_size> received parcels wait to be yielded.  When that many
+    are waiting, clients are not read from, so they are slowed down by TCP
+    flow control.
+    """
+    received = asyncio.Queue(queue_size)
+
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        try:
+            async for line in reader:
+                try:
+                    parcel = _parse(line.decode('utf-8'))
+                except ValueError:
+                    if rejected is not None:
+                        rejected.append(line)
+                    continue
+                if parcel is not None:
+                    await received.put(parcel)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            await received.put(None)
+
+    server = await asyncio.start_server(handle, host, port)
+    finished = 0
+    async with server:
+        while finished < connections:
+            parcel = await received.get()
+            if parcel is None:
+                finished = finished + 1
+            else:
+                yield parcel
+
+
+async def paced(parcels: AsyncIterator[Parcel],
+                rate: float) -> AsyncIterator[Parcel]:
+    """Yield the parcels from <parcels> no faster than a steady rate of
+    <rate> parcels per second.
+    """
+    start = perf_counter()
+    i = 0
+    async for parcel in parcels:
+        ahead = start + i / rate - perf_counter()
+        if ahead > 0.001:
+            await asyncio.sleep(ahead)
+        i = i + 1
+        yield parcel
+
+
+class IngestPipeline:
+    """A pipeline that takes parcels from asynchronous sources and schedules
+    them in batches.
+
+    Parcels from the sources go into a bounded queue.  When the queue is
+    full, the sources wait, so a slow scheduler slows down the sources
+    instead of letting parcels pile up.  Parcels are taken off the queue in
+    batches of up to <batch_size> parcels, or whatever has arrived within
+    <window> seconds of the first parcel of the batch, and each batch is
+    scheduled in an executor, so that the sources keep running meanwhile.
+    Batches are scheduled one at a time, in the order they were taken.
+
+    === Private Attributes ===
+    _scheduler:
+      The scheduler for each batch.
+    _trucks:
+      The trucks that parcels are scheduled onto.
+    _queue:
+      The parcels waiting to be scheduled, with their arrival times, ended
+      by None once every source is exhausted.
+    _batch_size:
+      The largest number of parcels in a batch.
+    _window:
+      The longest time, in seconds, to wait to fill a batch.
+    _executor:
+      The executor that runs the scheduler, or None for a thread of its own.
+    _latencies:
+      The time, in seconds, from arrival to being scheduled of every parcel.
+    _unscheduled:
+      The parcels that did not fit on any truck.
+    _batches:
+      The number of batches scheduled.
+    _max_queued:
+      The most parcels seen waiting in the queue when a batch was taken.
+    """
+    _scheduler: Scheduler
+    _trucks: List[Truck]
+    _queue: asyncio.Queue
+    _batch_size: int
+    _window: float
+    _executor: Optional[Executor]
+    _latencies: List[float]
+    _unscheduled: List[Parcel]
+    _batches: int
+    _max_queued: int
+
+    def __init__(self, scheduler: Scheduler, trucks: List[Truck],
+                 queue_size: int = 10000, batch_size: int = 1000,
+                 window: float = 0.05,
+                 executor: Optional[Executor] = None) -> None:
+        """Initialize a pipeline that schedules parcels onto <trucks> with
+        <scheduler>, through a queue of at most <queue_size> parcels, in
+        batches of at most <batch_size> parcels or <window> seconds, in
+        <executor>.
+        """
+        self._scheduler = scheduler
+        self._trucks = trucks
+        self._queue = asyncio.Queue(queue_size)
+        self._batch_size = batch_size
+        self._window = window
+        self._executor = executor
+        self._latencies = []
+        self._unscheduled = []
+        self._batches = 0
+        self._max_queued = 0
+
+    async def _feed(self, source: AsyncIterator[Parcel]) -> int:
+        """Put every parcel from <source> on the queue, and return how many
+        there were.
+        """
+        count = 0
+        async for parcel in source:
+            await self._queue.put((parcel, perf_counter()))
+            count = count + 1
+        return count
+
+    async def _next_batch(self) -> Tuple[List[Arrival], bool]:
+        """Take the next batch off the queue.  Return it, and whether the end
+        of the queue was reached.
+        """
+        loop = asyncio.get_running_loop()
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+        self._max_queued = max(self._max_queued, self._queue.qsize() + 1)
+        batch = [item]
+        deadline = loop.time() + self._window
+        while len(batch) < self._batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _consume(self) -> None:
+        """Schedule batches from the queue until its end.
+        """
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch, done = await self._next_batch()
+            if not batch:
+                continue
+            parcels = [parcel for parcel, _ in batch]
+            left = await loop.run_in_executor(
+                self._executor, self._scheduler.schedule, parcels,
+                self._trucks)
+            now = perf_counter()
+            self._latencies.extend(now - arrived for _, arrived in batch)
+            self._unscheduled.extend(left)
+            self._batches = self._batches + 1
+
+    async def _beside(self, consumer: asyncio.Task,
+                      work: Awaitable[T]) -> T:
+        """Await <work> while <consumer> runs, and return its result.
+
+        If <consumer> fails first, cancel <work> and raise the exception
+        that <consumer> failed with, instead of waiting for <work>, which may
+        never finish once nothing takes parcels off the queue.
+        """
+        task = asyncio.ensure_future(work)
+        await asyncio.wait({consumer, task},
+                           return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            consumer.result()
+        return task.result()
+
+    async def run(self, *sources: AsyncIterator[Parcel]) \
+            -> Dict[str, Union[int, float]]:
+        """Schedule every parcel from <sources> and return statistics on the
+        run: the numbers of parcels, unscheduled parcels and batches, the
+        largest number of parcels waiting in the queue, the time taken in
+        seconds, the throughput in parcels per second, and the 50th, 95th
+        and 99th percentiles of the latency from arrival to being scheduled,
+        in seconds.  Each run starts with an empty queue, and its statistics
+        cover that run only.
+
+        If the scheduler raises an exception, stop reading <sources> and
+        raise it.
+        """
+        self._queue = asyncio.Queue(self._queue.maxsize)
+        self._latencies = []
+        self._unscheduled = []
+        self._batches = 0
+        self._max_queued = 0
+        own_executor = None
+        if self._executor is None:
+            own_executor = ThreadPoolExecutor(1)
+            self._executor = own_executor
+        start = perf_counter()
+        consumer = asyncio.create_task(self._consume())
+        feeds = [asyncio.create_task(self._feed(source))
+                 for source in sources]
+        try:
+            counts = await self._beside(consumer, asyncio.gather(*feeds))
+            await self._beside(consumer, self._queue.put(None))
+            await consumer
+        finally:
+            for task in [consumer] + feeds:
+                task.cancel()
+            if own_executor is not None:
+                own_executor.shutdown()
+                self._executor = None
+        seconds = perf_counter() - start
+        stats = {'parcels': sum(counts),
+                 'unscheduled': len(self._unscheduled),
+                 'batches': self._batches,
+                 'max_queued': self._max_queued,
+                 'seconds': seconds,
+                 'throughput': sum(counts) / seconds if seconds else 0.0}
+        latencies = self._latencies or [0.0]
+        if len(latencies) == 1:
+            latencies = latencies * 2
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        for q in (50, 95, 99):
+            stats[f'latency_p{q}'] = cuts[q - 1]
+        return stats
+
+    def unscheduled(self) -> List[Parcel]:
+        """Return the parcels that did not fit on any truck so far.
+        """
+        return list(self._unscheduled)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['tail_file'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'argparse', 'asyncio', 'json',
+                                   'statistics', 'concurrent.futures', 'time',
+                                   'domain', 'experiment', 'scheduler'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    # ------------------------------------------------------------------------
+    # Load-test a scheduler: feed it the parcels of an experiment at a given
+    # arrival rate, or the parcels sent to a local socket, and print the
+    # statistics of the run.
+    # ------------------------------------------------------------------------
+    parser = argparse.ArgumentParser(
+        description='Feed parcels to a scheduler as they arrive.')
+    parser.add_argument('config_file', nargs='?', default='data/demo.json')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='parcels per second read from the parcel file '
+                             '(0 for as fast as possible)')
+    parser.add_argument('--follow', action='store_true',
+                        help='keep reading parcels appended to the file')
+    parser.add_argument('--port', type=int, default=0,
+                        help='read parcels from this local TCP port instead')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='number of clients to serve on the port')
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--window', type=float, default=0.05,
+                        help='seconds to wait to fill a batch')
+    args = parser.parse_args()
+    with open(args.config_file, 'r') as config_file:
+        config = json.load(config_file)
+    # A positive batch size makes the experiment skip reading the parcels.
+    experiment = SchedulingExperiment(dict(config, batch_size=1))
+    pipeline = IngestPipeline(experiment.scheduler, experiment.fleet.trucks,
+                              args.queue_size, args.batch_size, args.window)
+    rejected = []
+    if args.port:
+        feed = serve_socket('127.0.0.1', args.port, args.connections,
+                            args.queue_size, rejected)
+    elif args.rate > 0:
+        feed = paced(tail_file(config['parcel_file'], args.follow),
+                     args.rate)
+    else:
+        feed = tail_file(config['parcel_file'], args.follow)
+    stats = asyncio.run(pipeline.run(feed))
+    stats['rejected_lines'] = len(rejected)
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,218 @@
+from typing import ContextManager, Dict, Iterator, List, Union
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+import csv
+import json
+import tracemalloc
+
+# The statistics of a run, as returned by Profiler.report: the seconds spent
+# in and the peak bytes allocated during each phase, and every counter.
+Report = Dict[str, Union[int, float]]
+
+# The context manager returned for every phase of a disabled profiler.
+_NULL = nullcontext()
+
+
+class Profiler:
+    """A recorder of the time spent in each phase of a run, of counts of the
+    work done, and optionally of peak memory.
+
+    Phases are named, and nest: a phase entered while another one is open is
+    recorded under both names joined by a dot, such as 'schedule.order'.
+    Entering a phase again adds to its time.  A disabled profiler records
+    nothing, and costs one method call per phase or count, so code can
+    report into one unconditionally, as long as it does so outside of its
+    inner loops.
+
+    When memory is traced, tracemalloc runs while any phase is open, and the
+    peak memory allocated since the outermost phase began is recorded for
+    each phase.  Tracing slows Python code down several times, so timings
+    taken with it are not comparable to timings taken without it.
+
+    === Public Attributes ===
+    enabled:
+      True iff this profiler records anything.
+
+    === Private Attributes ===
+    _trace_memory:
+      True iff peak memory is recorded.
+    _echo:
+      True iff each phase and count is printed as it is recorded.
+    _stack:
+      The full names of the open phases, innermost last.
+    _seconds:
+      The total number of seconds spent in each phase, by full name.
+    _peaks:
+      The peak number of bytes allocated during each phase, by full name.
+    _counters:
+      The value of each counter, by name.
+    _tracing:
+      True iff this profiler started tracemalloc, and stops it when the
+      outermost phase ends.
+    """
+    enabled: bool
+    _trace_memory: bool
+    _echo: bool
+    _stack: List[str]
+    _seconds: Dict[str, float]
+    _peaks: Dict[str, int]
+    _counters: Dict[str, int]
+    _tracing: bool
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False,
+                 echo: bool = False) -> None:
+        """Initialize a profiler that records nothing yet, and nothing at all
+        unless <enabled>.  It also records peak memory if <trace_memory>,
+        and prints every phase and count as it is recorded if <echo>.
+
+        >>> profiler = Profiler()
+        >>> with profiler.phase('schedule'):
+        ...     with profiler.phase('order'):
+        ...         profiler.count('parcels', 3)
+        >>> sorted(profiler.report())
+        ['parcels', 'schedule.order_seconds', 'schedule_seconds']
+        >>> off = Profiler(False)
+        >>> with off.phase('schedule'):
+        ...     off.count('parcels', 3)
+        >>> off.report()
+        {}
+        """
+        self.enabled = enabled
+        self._trace_memory = trace_memory
+        self._echo = echo
+        self._stack = []
+        self._seconds = {}
+        self._peaks = {}
+        self._counters = {}
+        self._tracing = False
+
+    def phase(self, name: str) -> ContextManager[None]:
+        """Return a context manager that records the time spent in it, and
+        the peak memory allocated during it, as the phase <name> nested in
+        the open phases.
+        """
+        if not self.enabled:
+            return _NULL
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        """Record the phase <name> around the body of a with statement.
+        """
+        full_name = f'{self._stack[-1]}.{name}' if self._stack else name
+        if self._trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            self._take_peak()
+        self._stack.append(full_name)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            if self._trace_memory:
+                self._take_peak()
+            self._stack.pop()
+            self._seconds[full_name] = \
+                self._seconds.get(full_name, 0.0) + seconds
+            if self._tracing and not self._stack:
+                tracemalloc.stop()
+                self._tracing = False
+            if self._echo:
+                print(f'{full_name}: {seconds:.6f}s')
+
+    def _take_peak(self) -> None:
+        """Record the peak memory traced since the last call as a peak of
+        every open phase, and start measuring a new peak.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for name in self._stack:
+            self._peaks[name] = max(self._peaks.get(name, 0), peak)
+        tracemalloc.reset_peak()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add <n> to the counter <name>.
+        """
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + n
+            if self._echo:
+                print(f'{name}: +{n}')
+
+    def report(self) -> Report:
+        """Return what this profiler has recorded: the key '<phase>_seconds'
+        for the time spent in each phase, '<phase>_peak_bytes' for the peak
+        memory of each phase if memory is traced, and the name of each
+        counter for its value.
+        """
+        result = {}
+        for name, seconds in self._seconds.items():
+            result[f'{name}_seconds'] = seconds
+            if name in self._peaks:
+                result[f'{name}_peak_bytes'] = self._peaks[name]
+        result.update(self._counters)
+        return result
+
+    def reset(self) -> None:
+        """Forget everything this profiler has recorded.
+
+        Precondition: no phase is open.
+        """
+        self._seconds = {}
+        self._peaks = {}
+        self._counters = {}
+
+
+# A profiler that records nothing, used by default.
+DISABLED = Profiler(False)
+
+
+def profiler_for(profiler: Profiler, verbose: bool) -> Profiler:
+    """Return <profiler> or, if it is disabled and <verbose> is True, a new
+    profiler that prints every phase and count as it is recorded.
+
+    >>> profiler_for(DISABLED, False) is DISABLED
+    True
+    >>> profiler_for(DISABLED, True).enabled
+    True
+    """
+    if verbose and not profiler.enabled:
+        return Profiler(echo=True)
+    return profiler
+
+
+def write_json(path: str, rows: List[Report]) -> None:
+    """Write <rows> to the file <path>, as a JSON list of objects.
+    """
+    with open(path, 'w') as file:
+        json.dump(rows, file, indent=2)
+        file.write('\n')
+
+
+def write_csv(path: str, rows: List[Report]) -> None:
+    """Write <rows> to the file <path>, as a CSV table with one column for
+    every key in any row, in order of first appearance.  Missing values are
+    left empty.
+    """
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['Profiler._phase', 'Profiler.count', 'write_json',
+                       'write_csv'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'contextlib', 'time', 'csv', 'json',
+                                   'tracemalloc'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
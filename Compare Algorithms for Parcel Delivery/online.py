@@ -0,0 +1,134 @@
+from typing import Iterable, List, Optional
+from domain import Parcel, Truck, Fleet
+from truck_index import TruckIndex
+
+
+class OnlineScheduler:
+    """A scheduler for parcels that arrive one at a time.
+
+    Each parcel is scheduled as soon as it is submitted, onto the truck that
+    GreedyScheduler would pick for it: a truck whose last stop is the
+    parcel's destination if one has room, otherwise the truck with the least
+    (or the most) room that can hold it.  The trucks stay indexed between
+    submissions, so each one takes O(log n) time, plus the time to move one
+    entry in a sorted list, for n trucks.  A parcel that fits on no truck
+    goes to the backlog.
+
+    === Public Attributes ===
+    fleet:
+      The trucks that parcels are scheduled onto.  It always includes every
+      parcel scheduled so far.
+
+    === Private Attributes ===
+    _index:
+      The index over the trucks of <fleet>.
+    _backlog:
+      The parcels that did not fit on any truck, in the order they were
+      submitted.
+    _closed:
+      True iff no more parcels can be submitted.
+    """
+    fleet: Fleet
+    _index: TruckIndex
+    _backlog: List[Parcel]
+    _closed: bool
+
+    def __init__(self, fleet: Fleet, largest_first: bool = False) -> None:
+        """Initialize a scheduler for parcels onto the trucks in <fleet>,
+        preferring trucks with more room if <largest_first>, and with less
+        room otherwise.
+
+        The trucks in <fleet> may already hold parcels.  No trucks may be
+        added to <fleet> afterwards.
+        """
+        self.fleet = fleet
+        self._index = TruckIndex(fleet.trucks, largest_first)
+        self._backlog = []
+        self._closed = False
+
+    def submit(self, parcel: Parcel) -> Optional[Truck]:
+        """Schedule <parcel> and return the truck it was packed onto, or None
+        if it did not fit on any truck and went to the backlog.
+
+        Raise a ValueError if this scheduler is closed.
+
+        >>> f = Fleet()
+        >>> f.add_truck(Truck(1, 10, 'Toronto'))
+        >>> f.add_truck(Truck(2, 5, 'Toronto'))
+        >>> s = OnlineScheduler(f)
+        >>> s.submit(Parcel(1, 4, 'Toronto', 'London')).truck_id
+        2
+        >>> s.submit(Parcel(2, 8, 'Toronto', 'Guelph')).truck_id
+        1
+        >>> s.submit(Parcel(3, 3, 'Toronto', 'Ottawa')) is None
+        True
+        >>> [p.parcel_id for p in s.backlog()]
+        [3]
+        """
+        if self._closed:
+            raise ValueError('cannot submit parcels to a closed scheduler')
+        truck = self._index.best_truck(parcel)
+        if truck is None:
+            self._backlog.append(parcel)
+        else:
+            self._index.pack(truck, parcel)
+        return truck
+
+    def submit_many(self, parcels: Iterable[Parcel]) -> List[Parcel]:
+        """Schedule each of <parcels> in order, and return the ones that went
+        to the backlog.
+
+        Raise a ValueError if this scheduler is closed.
+
+        >>> f = Fleet()
+        >>> f.add_truck(Truck(1, 10, 'Toronto'))
+        >>> s = OnlineScheduler(f)
+        >>> left = s.submit_many([Parcel(1, 6, 'Toronto', 'London'),
+        ...                       Parcel(2, 6, 'Toronto', 'London')])
+        >>> [p.parcel_id for p in left]
+        [2]
+        >>> f.parcel_allocations()
+        {1: [1]}
+        """
+        start = len(self._backlog)
+        for parcel in parcels:
+            self.submit(parcel)
+        return self._backlog[start:]
+
+    def backlog(self) -> List[Parcel]:
+        """Return the parcels that did not fit on any truck so far, in the
+        order they were submitted.
+        """
+        return list(self._backlog)
+
+    def is_closed(self) -> bool:
+        """Return True iff this scheduler has been closed.
+        """
+        return self._closed
+
+    def close(self) -> List[Parcel]:
+        """Stop accepting parcels, and return the backlog: the parcels that
+        were never scheduled.
+
+        >>> f = Fleet()
+        >>> f.add_truck(Truck(1, 10, 'Toronto'))
+        >>> s = OnlineScheduler(f)
+        >>> s.close()
+        []
+        >>> s.is_closed()
+        True
+        """
+        self._closed = True
+        return self.backlog()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'domain', 'truck_index'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,264 @@
+from typing import Dict, List, Optional, Tuple, Union
+from heapq import heapify, heapreplace
+from multiprocessing import Pool
+from distance_map import DistanceMap
+from domain import Parcel, Truck
+from instrument import DISABLED, profiler_for
+from scheduler import Scheduler
+
+# The result of scheduling one region: the route, left capacity and parcel IDs
+# of each of its trucks, and the positions of its unscheduled parcels in the
+# region's list of parcels.
+RegionResult = Tuple[List[Tuple[List[str], int, List[int]]], List[int]]
+
+
+def _gap(dmap: DistanceMap, city1: str, city2: str) -> int:
+    """Return the distance there and back between <city1> and <city2>, or a
+    very large number if either way is missing from <dmap>.
+    """
+    if city1 == city2:
+        return 0
+    there = dmap.distance(city1, city2)
+    back = dmap.distance(city2, city1)
+    if there < 0 or back < 0:
+        return 2 ** 40
+    return there + back
+
+
+def cluster_destinations(volumes: Dict[str, int], dmap: DistanceMap,
+                         k: int, rounds: int = 5) -> List[List[str]]:
+    """Split the cities in <volumes>, which maps each destination to the
+    volume of parcels going there, into at most <k> regions of nearby cities.
+
+    The centres of the regions are seeded farthest-first, starting from the
+    city with the most volume, then improved for up to <rounds> rounds of
+    k-medoids: every city joins the region of its closest centre, and every
+    region's centre moves to the city with the least volume-weighted
+    distance to the rest of the region.
+
+    >>> m = DistanceMap()
+    >>> m.add_distance('A', 'B', 1)
+    >>> m.add_distance('A', 'C', 50)
+    >>> m.add_distance('A', 'D', 50)
+    >>> m.add_distance('B', 'C', 50)
+    >>> m.add_distance('B', 'D', 50)
+    >>> m.add_distance('C', 'D', 1)
+    >>> regions = cluster_destinations({'A': 5, 'B': 1, 'C': 1, 'D': 1}, m, 2)
+    >>> sorted(sorted(region) for region in regions)
+    [['A', 'B'], ['C', 'D']]
+    """
+    cities = sorted(volumes, key=lambda c: (-volumes[c], c))
+    if not cities:
+        return []
+    centres = [cities[0]]
+    nearest = {c: _gap(dmap, c, cities[0]) for c in cities}
+    while len(centres) < min(k, len(cities)):
+        far = max(cities, key=nearest.__getitem__)
+        if nearest[far] == 0:
+            break
+        centres.append(far)
+        for c in cities:
+            nearest[c] = min(nearest[c], _gap(dmap, c, far))
+    regions = []
+    for _ in range(rounds):
+        regions = [[] for _ in centres]
+        for c in cities:
+            closest = min(range(len(centres)),
+                          key=lambda i: _gap(dmap, c, centres[i]))
+            regions[closest].append(c)
+        moved = [min(region, key=lambda m: sum(volumes[c] * _gap(dmap, m, c)
+                                               for c in region))
+                 for region in regions]
+        if moved == centres:
+            break
+        centres = moved
+    return [region for region in regions if region]
+
+
+def share_trucks(trucks: List[Truck], volumes: List[int]) -> List[List[Truck]]:
+    """Return one list of trucks for each region whose parcels have the total
+    volume in <volumes>, so that each region's share of the left capacity is
+    as close as possible to its share of the volume.
+
+    Trucks are handed out from the one with the most left capacity to the one
+    with the least, each to the region furthest below its share.  Within a
+    region, trucks keep the order they have in <trucks>.
+
+    >>> trucks = [Truck(i, c, 'T') for i, c in enumerate([10, 30, 20, 40])]
+    >>> [[t.truck_id for t in ts] for ts in share_trucks(trucks, [30, 70])]
+    [[1], [0, 2, 3]]
+    """
+    total_volume = sum(volumes)
+    total_capacity = sum(t.left_capacity for t in trucks)
+    # (minus the capacity a region is short of its share, region)
+    heap = [(-total_capacity * v / max(total_volume, 1), r)
+            for r, v in enumerate(volumes)]
+    heapify(heap)
+    shares = [[] for _ in volumes]
+    order = sorted(range(len(trucks)), key=lambda i: -trucks[i].left_capacity)
+    for i in order:
+        short, r = heap[0]
+        shares[r].append(i)
+        heapreplace(heap, (short + trucks[i].left_capacity, r))
+    return [[trucks[i] for i in sorted(share)] for share in shares]
+
+
+def _schedule_region(job: Tuple[Scheduler, str, List[Parcel], List[Truck]]) \
+        -> RegionResult:
+    """Schedule the parcels onto the trucks in <job> with the scheduler in
+    <job>, reseeded with the seed in <job>, and return the resulting state of
+    the trucks and the positions of the unscheduled parcels.
+    """
+    scheduler, seed, parcels, trucks = job
+    scheduler.reseed(seed)
+    left = scheduler.schedule(parcels, trucks)
+    position = {id(p): i for i, p in enumerate(parcels)}
+    return ([(t.route, t.left_capacity, t.parcels_id) for t in trucks],
+            [position[id(p)] for p in left])
+
+
+class PartitionedScheduler(Scheduler):
+    """A scheduler that splits a problem into regions and schedules each
+    region separately with another scheduler, possibly in parallel.
+
+    The destinations of the parcels are clustered into regions of nearby
+    cities (see cluster_destinations), and the trucks are shared between the
+    regions in proportion to the volume of their parcels (see share_trucks).
+    Each region is then scheduled on its own, in a worker process if there
+    are several workers.  The parcels left over in any region are finally
+    scheduled onto all the trucks, so that space left in one region can
+    take parcels from another.
+
+    Before each region, and before the leftovers, the scheduler is reseeded
+    from the seed of this scheduler and the region (see Scheduler.reseed), so
+    a scheduler that makes random choices makes the same ones whether the
+    regions are scheduled here or in worker processes, in any number.
+
+    The regions scheduled in this process, and the leftovers, report into
+    <self>.profiler through the scheduler used for them; regions scheduled in
+    worker processes are only timed as a whole.
+
+    === Private Attributes ===
+    _scheduler: The scheduler used for each region and for the leftovers.
+    _dmap: The distances used to cluster destinations.
+    _regions: The largest number of regions.
+    _workers: The number of worker processes, or None for one per CPU.
+    _seed: The seed that the seed of each region is derived from, or None for
+      fresh random choices in every region.
+    """
+    _scheduler: Scheduler
+    _dmap: DistanceMap
+    _regions: int
+    _workers: Optional[int]
+    _seed: Optional[Union[int, str]]
+
+    def __init__(self, scheduler: Scheduler, dmap: DistanceMap, regions: int,
+                 workers: Optional[int] = 1,
+                 seed: Optional[Union[int, str]] = None) -> None:
+        """Initialize a scheduler that splits problems into at most
+        <regions> regions by the distances in <dmap>, and schedules them
+        with <scheduler>, reseeded from <seed>, in <workers> worker
+        processes.
+        """
+        self._scheduler = scheduler
+        self._dmap = dmap
+        self._regions = regions
+        self._workers = workers
+        self._seed = seed
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> region by
+        region.
+
+        >>> from scheduler import GreedyScheduler
+        >>> m = DistanceMap()
+        >>> m.add_distance('A', 'B', 1)
+        >>> m.add_distance('A', 'C', 50)
+        >>> m.add_distance('B', 'C', 50)
+        >>> config = {'parcel_priority': 'volume',
+        ...           'parcel_order': 'non-increasing',
+        ...           'truck_order': 'non-decreasing'}
+        >>> s = PartitionedScheduler(GreedyScheduler(config), m, 2)
+        >>> trucks = [Truck(1, 10, 'A'), Truck(2, 10, 'A')]
+        >>> s.schedule([Parcel(1, 6, 'A', 'B'), Parcel(2, 6, 'A', 'C'),
+        ...             Parcel(3, 4, 'A', 'B')], trucks)
+        []
+        >>> [t.route for t in trucks]
+        [['A', 'B', 'A'], ['A', 'C', 'A']]
+        """
+        profiler = profiler_for(self.profiler, verbose)
+        volumes = {}
+        for p in parcels:
+            volumes[p.destination] = volumes.get(p.destination, 0) + p.volume
+        with profiler.phase('cluster'):
+            regions = cluster_destinations(volumes, self._dmap, self._regions)
+        region_of = {c: r for r, cities in enumerate(regions) for c in cities}
+        shares = share_trucks(trucks, [sum(volumes[c] for c in cities)
+                                       for cities in regions])
+        profiler.count('regions', len(regions))
+        region_parcels = [[] for _ in regions]
+        for p in parcels:
+            region_parcels[region_of[p.destination]].append(
+                Parcel(p.parcel_id, p.volume, p.source, p.destination))
+        jobs = [(self._scheduler, self._region_seed(r), region_parcels[r],
+                 [_copy_truck(t) for t in shares[r]])
+                for r in range(len(regions))]
+        self._scheduler.profiler = \
+            profiler if self._workers == 1 else DISABLED
+        with profiler.phase('regions'):
+            if self._workers == 1:
+                results = [_schedule_region(job) for job in jobs]
+            else:
+                with Pool(self._workers) as pool:
+                    results = pool.map(_schedule_region, jobs, chunksize=1)
+        leftovers = []
+        originals = {}
+        for p in parcels:
+            originals.setdefault(p.parcel_id, p)
+        for r, (states, left) in enumerate(results):
+            for truck, (route, capacity, ids) in zip(shares[r], states):
+                truck.route = route
+                truck.left_capacity = capacity
+                truck.parcels_id = ids
+            leftovers.extend(originals[region_parcels[r][i].parcel_id]
+                             for i in left)
+        if not leftovers:
+            return []
+        self._scheduler.profiler = profiler
+        self._scheduler.reseed(self._region_seed('leftovers'))
+        with profiler.phase('leftovers'):
+            return self._scheduler.schedule(leftovers, trucks)
+
+    def _region_seed(self, region: Union[int, str]) -> Optional[str]:
+        """Return the seed for <region>, or None if this scheduler has no
+        seed.
+        """
+        if self._seed is None:
+            return None
+        return f'{self._seed}-{region}'
+
+
+def _copy_truck(truck: Truck) -> Truck:
+    """Return a Truck object with the same ID, capacities, route and parcels
+    as <truck>, which may be a row of a TruckTable.
+    """
+    copy = Truck(truck.truck_id, truck.total_capacity, truck.route[0])
+    copy.left_capacity = truck.left_capacity
+    copy.route = list(truck.route)
+    copy.parcels_id = list(truck.parcels_id)
+    return copy
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'heapq', 'multiprocessing',
+                                   'distance_map', 'domain', 'instrument',
+                                   'scheduler'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
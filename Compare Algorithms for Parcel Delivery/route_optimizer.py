@@ -0,0 +1,337 @@
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from array import array
+from multiprocessing import Pool
+from time import perf_counter
+from distance_map import DistanceMap
+from domain import Fleet
+
+# The distance map used by _improve_in_worker in this process, under the key
+# 'dmap', and the memo of exact tours for that map, under the key 'memo'.  Set
+# by _share_map in each worker process.
+_SHARED = {}
+
+# Routes that visit at most this many cities other than the depot are solved
+# exactly by held_karp.  Its running time grows as 2 ** n * n ** 2, so 12
+# cities take a fraction of a second and every city above that doubles it.
+EXACT_THRESHOLD = 12
+
+# A key for a memo of exact tours: the depot and the set of other cities.
+TourKey = Tuple[str, FrozenSet[str]]
+
+# Larger than the length of any tour.
+_INFINITY = 2 ** 62
+
+
+def _tour_length(tour: List[int], dist: List[List[int]]) -> int:
+    """Return the length of <tour>, a list of indices into <dist>, which
+    starts and ends at index 0.
+    """
+    return sum(dist[a][b] for a, b in zip(tour, tour[1:]))
+
+
+def _nearest_neighbour(n: int, dist: List[List[int]]) -> List[int]:
+    """Return a tour that starts at index 0, repeatedly visits the nearest
+    of the <n> indices of <dist> not visited yet, and returns to index 0.
+    """
+    tour = [0]
+    left = set(range(1, n))
+    while left:
+        here = dist[tour[-1]]
+        nearest = min(left, key=here.__getitem__)
+        tour.append(nearest)
+        left.remove(nearest)
+    tour.append(0)
+    return tour
+
+
+def _two_opt(tour: List[int], dist: List[List[int]], length: int,
+             deadline: float) -> Tuple[List[int], int]:
+    """Improve <tour>, of length <length>, by reversing segments until no
+    reversal makes it shorter or the time <deadline> passes.  Return the
+    improved tour and its length.
+
+    Reversing the segment from index i to index j changes the two edges at
+    its ends, and, since distances may differ in each direction, the
+    direction of every edge inside it.  For each i, the lengths of the
+    segment forwards and backwards are kept as running sums while j grows,
+    so each move is measured in constant time and a pass takes O(n ** 2)
+    time for n stops.
+    """
+    improved = True
+    while improved and perf_counter() < deadline:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            before = tour[i - 1]
+            first = tour[i]
+            forward = backward = 0
+            for j in range(i + 1, len(tour) - 1):
+                forward = forward + dist[tour[j - 1]][tour[j]]
+                backward = backward + dist[tour[j]][tour[j - 1]]
+                last = tour[j]
+                after = tour[j + 1]
+                change = dist[before][last] + dist[first][after] - \
+                    dist[before][first] - dist[last][after] + \
+                    backward - forward
+                if change < 0:
+                    tour = tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+                    length = length + change
+                    improved = True
+                    break
+            if perf_counter() >= deadline:
+                break
+    return tour, length
+
+
+def _or_opt(tour: List[int], dist: List[List[int]], length: int,
+            deadline: float) -> Tuple[List[int], int]:
+    """Improve <tour>, of length <length>, by moving segments of one to three
+    stops to another place in the tour, until no move makes it shorter or the
+    time <deadline> passes.  Return the improved tour and its length.
+
+    Moving a segment removes the edges into and out of it and the edge
+    between the stops it is put between, and adds three edges in their
+    place, so each move is measured in constant time.  Each segment is moved
+    to its best place, if that makes the tour shorter, and the pass goes on
+    from the next segment, so a pass takes O(n ** 2) time for n stops.
+    """
+    improved = True
+    while improved and perf_counter() < deadline:
+        improved = False
+        for size in (1, 2, 3):
+            for i in range(1, len(tour) - size):
+                before = tour[i - 1]
+                first = tour[i]
+                last = tour[i + size - 1]
+                after = tour[i + size]
+                gain = dist[before][first] + dist[last][after] - \
+                    dist[before][after]
+                best = 0
+                best_k = -1
+                for k in range(len(tour) - 1):
+                    if i - 1 <= k < i + size:
+                        continue
+                    a = tour[k]
+                    b = tour[k + 1]
+                    change = dist[a][first] + dist[last][b] - dist[a][b] - \
+                        gain
+                    if change < best:
+                        best = change
+                        best_k = k
+                if best_k >= 0:
+                    segment = tour[i:i + size]
+                    if best_k < i:
+                        tour = tour[:best_k + 1] + segment + \
+                            tour[best_k + 1:i] + tour[i + size:]
+                    else:
+                        tour = tour[:i] + tour[i + size:best_k + 1] + \
+                            segment + tour[best_k + 1:]
+                    length = length + best
+                    improved = True
+                if perf_counter() >= deadline:
+                    break
+            if perf_counter() >= deadline:
+                break
+    return tour, length
+
+
+def held_karp(dist: List[List[int]]) -> Tuple[List[int], int]:
+    """Return a shortest tour that starts at index 0, visits every other
+    index of the square matrix <dist> once and returns to index 0, and its
+    length.
+
+    The dynamic program keeps, for each set of visited indices (a bitmask)
+    and each last index, the length of the shortest path from index 0, in a
+    flat array.
+
+    Precondition: no entry of <dist> is negative.
+
+    >>> held_karp([[0, 1, 9], [9, 0, 1], [1, 9, 0]])
+    ([0, 1, 2, 0], 3)
+    >>> held_karp([[0, 9, 1], [1, 0, 9], [9, 1, 0]])
+    ([0, 2, 1, 0], 3)
+    """
+    n = len(dist) - 1
+    if n == 0:
+        return [0, 0], 0
+    full = 1 << n
+    cost = array('q', [_INFINITY]) * (full * n)
+    parent = array('b', [-1]) * (full * n)
+    for j in range(n):
+        cost[(1 << j) * n + j] = dist[0][j + 1]
+    for mask in range(1, full):
+        row = mask * n
+        for j in range(n):
+            length = cost[row + j]
+            if length == _INFINITY:
+                continue
+            here = dist[j + 1]
+            for k in range(n):
+                if mask >> k & 1:
+                    continue
+                i = (mask | 1 << k) * n + k
+                if length + here[k + 1] < cost[i]:
+                    cost[i] = length + here[k + 1]
+                    parent[i] = j
+    row = (full - 1) * n
+    best, last = min((cost[row + j] + dist[j + 1][0], j) for j in range(n))
+    tour = [0]
+    mask = full - 1
+    while last != -1:
+        tour.append(last + 1)
+        last, mask = parent[mask * n + last], mask & ~(1 << last)
+    tour.append(0)
+    tour[1:-1] = tour[-2:0:-1]
+    return tour, best
+
+
+def improve_route(route: List[str], dmap: DistanceMap,
+                  time_budget: float = 0.05,
+                  exact_threshold: int = EXACT_THRESHOLD,
+                  memo: Optional[Dict[TourKey, List[str]]] = None) \
+        -> List[str]:
+    """Return a route that starts and ends at the depot <route>[0] and visits
+    every other city in <route> once, and that is no longer than <route>
+    according to <dmap>.
+
+    If <route> visits at most <exact_threshold> cities other than the depot,
+    the route is a shortest one, found by held_karp.  If <memo> is not None,
+    such routes are looked up in and added to <memo>, which must only hold
+    routes computed with <dmap>.  The memo keeps copies of its routes, and
+    each lookup returns a new list, so no two trucks share a route.
+    Otherwise, the route is built by nearest-neighbour construction, then
+    improved by 2-opt and Or-opt moves until no move helps or <time_budget>
+    seconds have passed.  If the result is not shorter than <route>, <route>
+    is returned.
+
+    If <dmap> is missing the distance between any two cities in <route>,
+    either way, <route> is returned as it is: another order could use the
+    missing leg, which no route can take.
+
+    >>> m = DistanceMap()
+    >>> m.add_distance('T', 'A', 1)
+    >>> m.add_distance('T', 'B', 5)
+    >>> m.add_distance('T', 'C', 1, 5)
+    >>> m.add_distance('A', 'B', 1)
+    >>> m.add_distance('A', 'C', 5)
+    >>> m.add_distance('B', 'C', 1)
+    >>> improve_route(['T', 'B', 'A', 'C', 'T'], m)
+    ['T', 'C', 'B', 'A', 'T']
+    >>> improve_route(['T', 'B', 'A', 'C', 'T'], m, exact_threshold=0)
+    ['T', 'C', 'B', 'A', 'T']
+    >>> m.add_distance('T', 'D', 1)
+    >>> improve_route(['T', 'B', 'A', 'C', 'D', 'T'], m)
+    ['T', 'B', 'A', 'C', 'D', 'T']
+    """
+    deadline = perf_counter() + time_budget
+    depot = route[0]
+    cities = [depot] + list(dict.fromkeys(c for c in route if c != depot))
+    n = len(cities)
+    key = (depot, frozenset(cities[1:]))
+    if n <= 2:
+        best = cities + [depot]
+    elif memo is not None and key in memo:
+        best = list(memo[key])
+    else:
+        dist = [[dmap.distance(a, b) if a != b else 0 for b in cities]
+                for a in cities]
+        if any(d < 0 for row in dist for d in row):
+            return route
+        if n - 1 <= exact_threshold:
+            best = [cities[i] for i in held_karp(dist)[0]]
+            if memo is not None:
+                memo[key] = list(best)
+        else:
+            tour = _nearest_neighbour(n, dist)
+            length = _tour_length(tour, dist)
+            while perf_counter() < deadline:
+                tour, new_length = _two_opt(tour, dist, length, deadline)
+                tour, new_length = _or_opt(tour, dist, new_length, deadline)
+                if new_length >= length:
+                    break
+                length = new_length
+            best = [cities[i] for i in tour]
+    if dmap.route_distance(best) < dmap.route_distance(route):
+        return best
+    return route
+
+
+def _share_map(dmap: DistanceMap) -> None:
+    """Make <dmap> the distance map used by _improve_in_worker in this
+    process, with an empty memo of exact tours.
+    """
+    _SHARED['dmap'] = dmap
+    _SHARED['memo'] = {}
+
+
+def _improve_in_worker(job: Tuple[List[str], float, int]) -> List[str]:
+    """Return improve_route on the route, time budget and exact threshold in
+    <job>, with the shared distance map and memo.
+    """
+    route, time_budget, exact_threshold = job
+    return improve_route(route, _SHARED['dmap'], time_budget,
+                         exact_threshold, _SHARED['memo'])
+
+
+def optimize_routes(fleet: Fleet, dmap: DistanceMap,
+                    time_budget: float = 0.05,
+                    workers: Optional[int] = 1,
+                    exact_threshold: int = EXACT_THRESHOLD) -> int:
+    """Replace the route of every truck in <fleet> that visits more than one
+    city with the result of improve_route, given <time_budget> seconds per
+    truck and <exact_threshold>, and return the total distance saved
+    according to <dmap>.
+
+    Exact routes are memoized by depot and set of cities, so trucks that
+    visit the same cities reuse one solution, each in a list of its own.
+
+    If <workers> is not 1, the routes are improved in a pool of that many
+    worker processes (or one per CPU, if <workers> is None).
+
+    A truck whose cities are missing a distance in <dmap> keeps its route
+    (see improve_route).
+
+    >>> from domain import Parcel, Truck
+    >>> m = DistanceMap()
+    >>> m.add_distance('T', 'A', 1)
+    >>> m.add_distance('T', 'B', 5, 1)
+    >>> m.add_distance('A', 'B', 1)
+    >>> f = Fleet()
+    >>> t = Truck(1, 10, 'T')
+    >>> f.add_truck(t)
+    >>> t.pack(Parcel(1, 1, 'T', 'B'))
+    True
+    >>> t.pack(Parcel(2, 1, 'T', 'A'))
+    True
+    >>> optimize_routes(f, m)
+    4
+    >>> t.route
+    ['T', 'A', 'B', 'T']
+    """
+    trucks = [t for t in fleet.trucks if len(t.route) > 3]
+    jobs = [(t.route, time_budget, exact_threshold) for t in trucks]
+    if workers == 1:
+        memo = {}
+        routes = [improve_route(route, dmap, budget, threshold, memo)
+                  for route, budget, threshold in jobs]
+    else:
+        with Pool(workers, _share_map, (dmap,)) as pool:
+            routes = pool.map(_improve_in_worker, jobs, chunksize=8)
+    saved = 0
+    for truck, route in zip(trucks, routes):
+        saved = saved + dmap.route_distance(truck.route) - \
+            dmap.route_distance(route)
+        truck.route = route
+    return saved
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'multiprocessing', 'time',
+                                   'distance_map', 'domain'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
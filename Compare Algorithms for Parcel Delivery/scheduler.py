@@ -1,7 +1,19 @@
-from typing import List, Callable, Dict, Union
-from random import shuffle, choice
+from typing import List, Dict, Iterator, Optional, Tuple, Union
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate, chain, groupby
+from operator import add, attrgetter, sub
+from random import Random
+from time import perf_counter
 from container import PriorityQueue
-from domain import Parcel, Truck
+from distance_map import DistanceMap
+from domain import Parcel, Truck, ParcelTable
+from instrument import DISABLED, Profiler, profiler_for
+from truck_index import FirstFitTree, TruckIndex, fitting
+
+# The number of trucks RandomScheduler draws for a parcel before it checks
+# every truck instead.
+_RANDOM_DRAWS = 8
 
 
 class Scheduler:
@@ -9,7 +21,13 @@ class Scheduler:
     what route each truck will take.
 
     This is an abstract class.  Only child classes should be instantiated.
+
+    === Public Attributes ===
+    profiler:
+      The profiler that this scheduler reports the time spent in each phase
+      of scheduling and the work done into.  It is disabled unless set.
     """
+    profiler: Profiler = DISABLED
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
@@ -29,90 +47,178 @@ class Scheduler:
         the scheduling algorithm as it runs.  This is *only* for debugging
         purposes for your benefit, so the content and format of this
         information is your choice; we will not test your code with <verbose>
-        set to True.
+        set to True.  Each phase and count is printed as it is recorded,
+        through <self>.profiler if it is enabled (see profiler_for).
         """
         raise NotImplementedError
 
+    def reseed(self, seed: Optional[Union[int, str]]) -> None:
+        """Make the random choices of this scheduler start again from <seed>,
+        as if it had just been created with <seed>.  Schedulers that make no
+        random choices ignore <seed>.
+        """
+
 
 class RandomScheduler(Scheduler):
     """A random scheduler, randomly decides what parcels go onto which trucks,
     and what route each truck will take. For each parcel, it will schedule it
     onto a randomly chosen truck (from among those trucks that have capacity to
     add that parcel).
+
+    Rather than listing the trucks with room for every parcel, it draws a
+    truck uniformly at random, and draws again if the truck has no room, up
+    to _RANDOM_DRAWS times.  Each accepted draw is uniform over the trucks
+    with room, so the choice has the same distribution as picking among
+    them.  Only the parcels for which every draw fails are checked against
+    every truck still in the running.  Trucks too full for even the smallest
+    parcel are dropped from the draws as they are found.
+
+    === Private Attributes ===
+    _random: The source of random numbers for this scheduler.
     """
+    _random: Random
+
+    def __init__(self, seed: Optional[Union[int, str]] = None) -> None:
+        """Initialize the RandomScheduler.  If <seed> is not None, two
+        schedulers with the same <seed> make the same random choices.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> p = Parcel(1, 5, 'Toronto', 'London')
+        >>> _ = RandomScheduler(7).schedule([p], [t1, t2])
+        >>> t3 = Truck(1, 10, 'Toronto')
+        >>> t4 = Truck(2, 10, 'Toronto')
+        >>> _ = RandomScheduler(7).schedule([p], [t3, t4])
+        >>> t1.parcels_id == t3.parcels_id
+        True
+        """
+        self._random = Random(seed)
+
+    def reseed(self, seed: Optional[Union[int, str]]) -> None:
+        """Make the random choices of this scheduler start again from <seed>.
+        """
+        self._random.seed(seed)
+
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
         """Randomly schedule the given <parcels> onto the given <trucks>, that
         is, decide which parcels will go on which trucks, as well as the route
         each truck will take.
+
+        >>> t = Truck(1, 10, 'Toronto')
+        >>> ps = [Parcel(1, 6, 'Toronto', 'London'),
+        ...       Parcel(2, 6, 'Toronto', 'Guelph')]
+        >>> left = RandomScheduler(0).schedule(ps, [t])
+        >>> len(left), len(t.parcels_id), [p.parcel_id for p in ps]
+        (1, 1, [1, 2])
         """
-        parcels2 = parcels
-        shuffle(parcels2)
+        profiler = profiler_for(self.profiler, verbose)
+        with profiler.phase('shuffle'):
+            parcels2 = list(parcels)
+            self._random.shuffle(parcels2)
         unscheduled = []
-        for parcel in parcels2:
-            available_trucks = []
-            for truck in trucks:
-                if truck.left_capacity >= parcel.volume:
-                    available_trucks.append(truck)
-            if available_trucks:
-                t = choice(available_trucks)
-                t.pack(parcel)
+        with profiler.phase('select'):
+            if parcels2 and trucks:
+                draws, scanned = self._select(parcels2, trucks, unscheduled)
             else:
-                unscheduled.append(parcel)
+                draws, scanned = 0, 0
+                unscheduled.extend(parcels2)
+        _count_placed(profiler, len(parcels2), unscheduled)
+        profiler.count('random_draws', draws)
+        profiler.count('trucks_scanned', scanned)
         return unscheduled
 
+    def _select(self, parcels: List[Parcel], trucks: List[Truck],
+                unscheduled: List[Parcel]) -> Tuple[int, int]:
+        """Pack each of <parcels>, in order, onto a truck drawn at random from
+        among the <trucks> with room for it, and append the parcels that fit
+        on no truck to <unscheduled>.  Return the number of trucks drawn and
+        the number checked by a full scan.
+
+        Precondition: <parcels> and <trucks> are not empty.
+        """
+        randrange = self._random.randrange
+        left = array('q', [truck.left_capacity for truck in trucks])
+        # The indices of the trucks that may still take a parcel, and an
+        # upper bound on their room.
+        live = array('q', range(len(trucks)))
+        room = max(left)
+        smallest = min(parcel.volume for parcel in parcels)
+        draws = scanned = 0
+        for parcel in parcels:
+            volume = parcel.volume
+            chosen = -1
+            if volume <= room:
+                for _ in range(_RANDOM_DRAWS):
+                    j = randrange(len(live))
+                    i = live[j]
+                    draws = draws + 1
+                    if left[i] >= volume:
+                        chosen = i
+                        break
+                    if left[i] < smallest:
+                        live[j] = live[-1]
+                        live.pop()
+                        if not live:
+                            room = 0
+                            break
+                if chosen < 0 and volume <= room:
+                    scanned = scanned + len(live)
+                    room = max(left[i] for i in live)
+                    fits = [i for i in live if left[i] >= volume]
+                    if fits:
+                        chosen = fits[randrange(len(fits))]
+            if chosen < 0:
+                unscheduled.append(parcel)
+            else:
+                trucks[chosen].pack(parcel)
+                left[chosen] = left[chosen] - volume
+        return draws, scanned
+
 
 class GreedyScheduler(Scheduler):
     """A strategic scheduler, it processes parcels one at a time, picking a
     truck for each, but it tries to pick the “best” truck it can for each
     parcel.
 
+    In batch packing mode, parcels are taken in groups instead: each run of
+    parcels with the same destination in priority order.  The best truck for
+    the first parcel of a group takes the longest run of the group that fits
+    in it, found by binary search on the running totals of the group's
+    volumes, and packs it in bulk, with one update of its route.  The rest
+    of the group goes the same way to the next best truck.  This takes far
+    fewer index updates when parcels are ordered by destination, but a
+    parcel that does not fit ends a truck's share of the group even if
+    later, smaller parcels would fit, so the schedule may differ from the
+    one made one parcel at a time.
+
     === Private Attributes ===
     _priority_q: A queue of Parcels that operates in FIFO-priority order.
-    _truck_priority: A function that compares two Trucks by their priority.
+    _parcel_priority: The parcel attribute that parcels are ordered by,
+      either 'volume' or 'destination'.
+    _parcel_reverse: True iff parcels are ordered in non-increasing order.
+    _largest_first: True iff trucks with more available space are preferred,
+      False iff trucks with less available space are preferred.
+    _batch: True iff parcels are packed in groups by destination.
     """
     _priority_q: PriorityQueue
-    _truck_priority: Callable[[Truck, Truck], bool]
+    _parcel_priority: str
+    _parcel_reverse: bool
+    _largest_first: bool
+    _batch: bool
 
     def __init__(self, config: Dict[str, Union[str, bool]]) -> None:
         """Initialize the GreedyScheduler with the four different parcel
         priority and the two truck priority. (See the priority functions below)
+        Parcels are packed in groups if <config> contains the key
+        'batch_packing' with the value True.
         """
-        if config['parcel_priority'] == 'volume':
-            if config['parcel_order'] == 'non-decreasing' and \
-                    config['truck_order'] == 'non-decreasing':
-                self._priority_q = PriorityQueue(_smaller_v)
-                self._truck_priority = _smaller_space
-            if config['parcel_order'] == 'non-decreasing' and \
-                    config['truck_order'] == 'non-increasing':
-                self._priority_q = PriorityQueue(_smaller_v)
-                self._truck_priority = _larger_space
-            if config['parcel_order'] == 'non-increasing' and \
-                    config['truck_order'] == 'non-increasing':
-                self._priority_q = PriorityQueue(_larger_v)
-                self._truck_priority = _larger_space
-            if config['parcel_order'] == 'non-increasing' and \
-                    config['truck_order'] == 'non-decreasing':
-                self._priority_q = PriorityQueue(_larger_v)
-                self._truck_priority = _smaller_space
-
-        elif config['parcel_priority'] == 'destination':
-            if config['parcel_order'] == 'non-decreasing' and \
-                    config['truck_order'] == 'non-decreasing':
-                self._priority_q = PriorityQueue(_smaller_d)
-                self._truck_priority = _smaller_space
-            if config['parcel_order'] == 'non-decreasing' and \
-                    config['truck_order'] == 'non-increasing':
-                self._priority_q = PriorityQueue(_smaller_d)
-                self._truck_priority = _larger_space
-            if config['parcel_order'] == 'non-increasing' and \
-                    config['truck_order'] == 'non-increasing':
-                self._priority_q = PriorityQueue(_larger_d)
-                self._truck_priority = _larger_space
-            if config['parcel_order'] == 'non-increasing' and \
-                    config['truck_order'] == 'non-decreasing':
-                self._priority_q = PriorityQueue(_larger_d)
-                self._truck_priority = _smaller_space
+        order = (config['parcel_priority'], config['parcel_order'])
+        self._priority_q = PriorityQueue(*_PARCEL_PRIORITY[order])
+        self._parcel_priority = config['parcel_priority']
+        self._parcel_reverse = config['parcel_order'] == 'non-increasing'
+        self._largest_first = config['truck_order'] == 'non-increasing'
+        self._batch = config.get('batch_packing', False)
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
@@ -131,39 +237,547 @@ class GreedyScheduler(Scheduler):
         # >>> gs.schedule(p,t) == [p1, p3]
         # True
         """
+        profiler = profiler_for(self.profiler, verbose)
         unscheduled = []
-        for parcel in parcels:
-            self._priority_q.add(parcel)
-        while not self._priority_q.is_empty():
-            p = self._priority_q.remove()
-            available_trucks = []
-            for truck in trucks:
-                if truck.left_capacity >= p.volume:
-                    available_trucks.append(truck)
-            if not available_trucks:
-                unscheduled.append(p)
+        with profiler.phase('order'):
+            ordered = self._in_priority_order(parcels, profiler)
+        with profiler.phase('index'):
+            index = TruckIndex(trucks, self._largest_first)
+        with profiler.phase('select'):
+            if self._batch:
+                lookups = _pack_groups(ordered, index, unscheduled, profiler)
             else:
-                self._schedule_helper(p, available_trucks)
+                for p in ordered:
+                    truck = index.best_truck(p)
+                    if truck is None:
+                        unscheduled.append(p)
+                    else:
+                        index.pack(truck, p)
+                lookups = len(parcels)
+        _count_placed(profiler, len(parcels), unscheduled)
+        profiler.count('index_lookups', lookups)
         return unscheduled
 
-    def _schedule_helper(self, p: Parcel, available_trucks: [Truck]) -> None:
-        """Strategically schedule the given <parcels> onto the given <trucks>,
-        that is, decide which parcels will go on which trucks, as well as the
-        route each truck will take.
+    def _in_priority_order(self, parcels: Union[List[Parcel], ParcelTable],
+                           profiler: Profiler = DISABLED) -> Iterator[Parcel]:
+        """Return an iterator over the parcels in <parcels> in priority order,
+        and count the work of ordering them in <profiler>.
+
+        A ParcelTable is sorted on its volume or destination column directly;
+        any other sequence of parcels goes through <self>._priority_q.  The
+        parcels are sorted, or added to the queue, before this returns; they
+        are removed from the queue as the iterator advances.
+        """
+        if isinstance(parcels, ParcelTable):
+            rows = parcels.argsort(self._parcel_priority, self._parcel_reverse)
+            return map(parcels.__getitem__, rows)
+        self._priority_q.add_all(parcels)
+        # Every parcel is added to the queue, ranked by one key call, then
+        # removed from it.
+        profiler.count('queue_operations', 2 * len(parcels))
+        profiler.count('key_calls', len(parcels))
+        return self._drain_queue()
+
+    def _drain_queue(self) -> Iterator[Parcel]:
+        """Remove and yield the parcels in <self>._priority_q, in order.
+        """
+        while not self._priority_q.is_empty():
+            yield self._priority_q.remove()
+
+
+class DistanceScheduler(GreedyScheduler):
+    """A greedy scheduler that takes distances into account.  It processes
+    parcels in the same priority order as GreedyScheduler, but it picks the
+    truck whose route gets the least longer by adding the parcel's
+    destination at the best place in the route, and inserts the destination
+    there.
+
+    A truck that already visits the destination costs nothing.  Ties are
+    broken by available space, as in GreedyScheduler, then by the order of
+    the trucks.
+
+    Only the trucks with room for a parcel are looked at, kept sorted by
+    left capacity in the tie-break order of TruckIndex.  Of the empty trucks
+    of a depot, which all add the same distance, only the first is looked
+    at.  The other trucks are scanned in tie-break order until one reaches
+    the least distance that the parcel's destination could add to any
+    route, since no later truck can beat it.  For maps without shortcuts
+    through other cities that bound is 0, so the scan usually stops at the
+    first truck that already visits the destination.  A parcel that no such
+    truck can take is still compared against every truck with room, so
+    scheduling can take up to O(n * m) time for n parcels and m trucks,
+    although it takes a few trucks per parcel on typical data.
+
+    === Private Attributes ===
+    _dmap: The distances between cities.
+    """
+    _dmap: DistanceMap
+
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 dmap: DistanceMap) -> None:
+        """Initialize the DistanceScheduler with the parcel and truck
+        priorities in <config>, as for GreedyScheduler, and the distances in
+        <dmap>.
+        """
+        GreedyScheduler.__init__(self, config)
+        self._dmap = dmap
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks>, choosing
+        for each parcel the truck and the place in its route that add the
+        least distance.
+
+        Precondition: <self>._dmap contains the distance between every two
+        cities in the routes of <trucks> and the destinations of <parcels>.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 5)
+        >>> m.add_distance('Toronto', 'London', 9)
+        >>> m.add_distance('Hamilton', 'London', 4)
+        >>> config = {'parcel_priority': 'volume',
+        ...           'parcel_order': 'non-increasing',
+        ...           'truck_order': 'non-decreasing'}
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> p1 = Parcel(1, 5, 'Toronto', 'London')
+        >>> p2 = Parcel(2, 4, 'Toronto', 'Hamilton')
+        >>> DistanceScheduler(config, m).schedule([p1, p2], [t1, t2])
+        []
+        >>> t1.route
+        ['Toronto', 'Hamilton', 'London', 'Toronto']
+        """
+        profiler = profiler_for(self.profiler, verbose)
+        with profiler.phase('order'):
+            ordered = self._in_priority_order(parcels, profiler)
+        largest_first = self._largest_first
+        sign = -1 if largest_first else 1
+        with profiler.phase('index'):
+            legs = [self._legs(t.route) for t in trucks]
+            cities = list({c for t in trucks for c in t.route} |
+                          {p.destination for p in parcels})
+            # The entry (left capacity, rank) of every truck, as in
+            # TruckIndex, in sorted lists: one for the trucks that leave
+            # their depot, and one for the empty trucks of each depot.
+            keys = [(t.left_capacity, sign * i) for i, t in enumerate(trucks)]
+            loaded = []
+            empty = {}
+            for key, truck in zip(keys, trucks):
+                if len(truck.route) == 2:
+                    empty.setdefault(truck.route[0], []).append(key)
+                else:
+                    loaded.append(key)
+            loaded.sort()
+            for entries in empty.values():
+                entries.sort()
+        # The cheapest insertion of each destination into each route, as
+        # (added distance, position).  Cleared when the route changes.
+        insertions = [{} for _ in trucks]
+        # The least distance that adding each destination to any route can
+        # add.  Computing it for every destination takes O(k ** 3) time for k
+        # cities, so it is skipped unless scanning every truck for every
+        # parcel would take longer.
+        bounds = {}
+        bounded = len(cities) ** 3 <= len(parcels) * len(trucks)
+        evaluated = scanned = 0
+        unscheduled = []
+        with profiler.phase('select'):
+            for p in ordered:
+                dest = p.destination
+                if bounded and dest not in bounds:
+                    bounds[dest] = self._least_insertion(dest, cities)
+                bound = bounds.get(dest)
+                # Empty trucks from one depot all add the same distance, so
+                # only the first of them in tie-break order can be the best.
+                firsts = [next(fitting(entries, p.volume, largest_first), -1)
+                          for entries in empty.values()]
+                best = None
+                for i in chain([i for i in firsts if i >= 0],
+                               fitting(loaded, p.volume, largest_first)):
+                    route = trucks[i].route
+                    scanned = scanned + 1
+                    found = insertions[i].get(dest)
+                    if found is None:
+                        found = self._cheapest_insertion(route, legs[i], dest)
+                        insertions[i][dest] = found
+                        evaluated = evaluated + 1
+                    key = (found[0], keys[i][0] * sign, i)
+                    if best is None or key < best:
+                        best = key
+                    # The trucks that leave their depot come last, in
+                    # tie-break order, so the first of them to reach <bound>
+                    # beats the rest.
+                    if bound is not None and found[0] <= bound and \
+                            len(route) > 2:
+                        break
+                if best is None:
+                    unscheduled.append(p)
+                    continue
+                i = best[2]
+                route = trucks[i].route
+                position = insertions[i][dest][1]
+                length = len(route)
+                entries = loaded if length > 2 else empty[route[0]]
+                del entries[bisect_left(entries, keys[i])]
+                trucks[i].pack(p, position)
+                keys[i] = (trucks[i].left_capacity, keys[i][1])
+                insort(loaded if len(route) > 2 else empty[route[0]], keys[i])
+                if len(route) != length:
+                    legs[i][position - 1:position] = [
+                        self._distance(route[position - 1], dest),
+                        self._distance(dest, route[position + 1])]
+                    insertions[i].clear()
+        _count_placed(profiler, len(parcels), unscheduled)
+        profiler.count('trucks_scanned', scanned)
+        profiler.count('insertions_evaluated', evaluated)
+        return unscheduled
+
+    def _least_insertion(self, city: str, cities: List[str]) -> int:
+        """Return a lower bound on the distance added to a route through
+        <cities> by adding <city> to it.
+
+        The bound is the least distance added by inserting <city> between
+        any two of <cities>, or 0, for a route that already visits it.  It
+        takes O(n ** 2) time for n <cities>.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 5)
+        >>> m.add_distance('Toronto', 'London', 12)
+        >>> m.add_distance('Hamilton', 'London', 4)
+        >>> config = {'parcel_priority': 'volume',
+        ...           'parcel_order': 'non-increasing',
+        ...           'truck_order': 'non-decreasing'}
+        >>> s = DistanceScheduler(config, m)
+        >>> s._least_insertion('Hamilton', ['Toronto', 'Hamilton', 'London'])
+        -3
+        >>> s._least_insertion('London', ['Toronto', 'Hamilton', 'London'])
+        0
+        """
+        others = [c for c in cities if c != city]
+        out = [self._distance(city, b) for b in others]
+        least = 0
+        for a in others:
+            skipped = map(sub, out, map(self._distance, [a] * len(others),
+                                        others))
+            least = min(least, self._distance(a, city) + min(skipped))
+        return least
+
+    def _distance(self, city1: str, city2: str) -> int:
+        """Return the distance from <city1> to <city2>, which is 0 if they
+        are the same city.
+        """
+        if city1 == city2:
+            return 0
+        return self._dmap.distance(city1, city2)
+
+    def _legs(self, route: List[str]) -> List[int]:
+        """Return the distance of each hop in <route>, in order.
+        """
+        return list(map(self._distance, route, route[1:]))
+
+    def _cheapest_insertion(self, route: List[str], legs: List[int],
+                            city: str) -> Tuple[int, int]:
+        """Return the least distance added to <route> by inserting <city>
+        into it, and the index to insert it at.  <legs> are the distances of
+        the hops in <route>.
+
+        The added distance of every place is computed at once, from the
+        distances into and out of <city>.
         """
-        trucks_by_dest = []
-        for truck in available_trucks:
-            if truck.route[-2] == p.destination:
-                trucks_by_dest.append(truck)
-        truck_queue = PriorityQueue(self._truck_priority)
-        if not trucks_by_dest:
-            for t in available_trucks:
-                truck_queue.add(t)
-        else:
-            for t in trucks_by_dest:
-                truck_queue.add(t)
-        t = truck_queue.remove()
-        t.pack(p)
+        if city in route[1:-1]:
+            return 0, route.index(city, 1) + 1
+        into = map(self._distance, route[:-1], [city] * len(legs))
+        out = map(self._distance, [city] * len(legs), route[1:])
+        added = list(map(sub, map(add, into, out), legs))
+        i = min(range(len(added)), key=added.__getitem__)
+        return added[i], i + 1
+
+
+class LNSScheduler(DistanceScheduler):
+    """An anytime scheduler that improves a schedule by large neighbourhood
+    search.  It starts from the schedule of DistanceScheduler.  Then, until
+    its time budget runs out, it repeatedly takes every parcel off a few
+    random trucks (destroy) and puts them back, together with the parcels
+    left unscheduled, wherever they add the least distance (repair).
+
+    A schedule is better if it leaves less volume unscheduled or, for equal
+    volume, if the trucks travel less in total.  A change is only kept if it
+    does not make the schedule worse, so the trucks always hold the best
+    schedule found so far, and the search can stop at any time.  Each change
+    is evaluated incrementally, from the left capacity, route and route
+    length of the trucks it touches.
+
+    Parcels that were on the trucks before <schedule> was called are never
+    moved.
+
+    === Private Attributes ===
+    _time_budget: The number of seconds to spend improving each schedule.
+    _max_rounds: The largest number of destroy and repair rounds, or None for
+      no limit other than the time budget.
+    _random: The source of random numbers for choosing trucks to destroy.
+    """
+    _time_budget: float
+    _max_rounds: Optional[int]
+    _random: Random
+
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 dmap: DistanceMap, time_budget: float = 1.0,
+                 seed: Optional[Union[int, str]] = None,
+                 max_rounds: Optional[int] = None) -> None:
+        """Initialize the LNSScheduler with the parcel and truck priorities
+        in <config>, as for GreedyScheduler, the distances in <dmap>, and a
+        budget of <time_budget> seconds and at most <max_rounds> rounds per
+        call to schedule.  If <seed> is not None, two schedulers with the
+        same <seed> make the same random choices.
+        """
+        DistanceScheduler.__init__(self, config, dmap)
+        self._time_budget = time_budget
+        self._max_rounds = max_rounds
+        self._random = Random(seed)
+
+    def reseed(self, seed: Optional[Union[int, str]]) -> None:
+        """Make the random choices of this scheduler start again from <seed>.
+        """
+        self._random.seed(seed)
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> with
+        DistanceScheduler, then improve the schedule by large neighbourhood
+        search until the time budget or the number of rounds runs out.
+
+        Precondition: <self>._dmap contains the distance between every two
+        cities in the routes of <trucks> and the destinations of <parcels>.
+
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 5)
+        >>> m.add_distance('Toronto', 'London', 9)
+        >>> m.add_distance('Hamilton', 'London', 4)
+        >>> config = {'parcel_priority': 'volume',
+        ...           'parcel_order': 'non-decreasing',
+        ...           'truck_order': 'non-decreasing'}
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> parcels = [Parcel(1, 4, 'Toronto', 'London'),
+        ...            Parcel(2, 5, 'Toronto', 'Hamilton'),
+        ...            Parcel(3, 6, 'Toronto', 'London')]
+        >>> s = LNSScheduler(config, m, seed=1, max_rounds=20)
+        >>> s.schedule(parcels, [t1, t2])
+        []
+        >>> m.route_distance(t1.route) + m.route_distance(t2.route)
+        28
+        >>> sorted([sorted(t1.parcels_id), sorted(t2.parcels_id)])
+        [[1, 3], [2]]
+        """
+        profiler = profiler_for(self.profiler, verbose)
+        deadline = perf_counter() + self._time_budget
+        base = [(list(t.route), t.left_capacity, list(t.parcels_id))
+                for t in trucks]
+        with profiler.phase('initial'):
+            pool = DistanceScheduler.schedule(self, parcels, trucks)
+        by_id = {p.parcel_id: p for p in parcels}
+        routes = [list(t.route) for t in trucks]
+        legs = [self._legs(route) for route in routes]
+        left = [t.left_capacity for t in trucks]
+        loads = [[by_id[i] for i in t.parcels_id[len(ids):]]
+                 for t, (_, _, ids) in zip(trucks, base)]
+        # The cheapest insertion of each destination into each route, as
+        # (added distance, position).  Cleared when the route changes.
+        insertions = [{} for _ in trucks]
+        sign = -1 if self._largest_first else 1
+        cost = (sum(p.volume for p in pool), sum(map(sum, legs)))
+        rounds = 0
+        accepted = 0
+        repaired = 0
+        with profiler.phase('improve'):
+            while perf_counter() < deadline and \
+                    (self._max_rounds is None or rounds < self._max_rounds):
+                rounds = rounds + 1
+                loaded = [i for i, load in enumerate(loads) if load]
+                if not loaded:
+                    break
+                saved = {}
+                removed = []
+                length = cost[1]
+                for i in self._random.sample(loaded, min(2, len(loaded))):
+                    saved[i] = (routes[i], legs[i], left[i], loads[i])
+                    removed.extend(loads[i])
+                    length = length - sum(legs[i])
+                    routes[i] = list(base[i][0])
+                    legs[i] = self._legs(routes[i])
+                    left[i] = base[i][1]
+                    loads[i] = []
+                    insertions[i].clear()
+                    length = length + sum(legs[i])
+                new_pool = []
+                repaired = repaired + len(removed) + len(pool)
+                for p in sorted(removed + pool, key=_neg_volume_key):
+                    dest = p.destination
+                    best = None
+                    for i, capacity in enumerate(left):
+                        if capacity < p.volume:
+                            continue
+                        found = insertions[i].get(dest)
+                        if found is None:
+                            found = self._cheapest_insertion(
+                                routes[i], legs[i], dest)
+                            insertions[i][dest] = found
+                        key = (found[0], sign * capacity, i)
+                        if best is None or key < best:
+                            best = key
+                    if best is None:
+                        new_pool.append(p)
+                        continue
+                    i = best[2]
+                    if i not in saved:
+                        saved[i] = (routes[i], legs[i], left[i], loads[i])
+                        routes[i] = list(routes[i])
+                        legs[i] = list(legs[i])
+                        loads[i] = list(loads[i])
+                    route = routes[i]
+                    position = insertions[i][dest][1]
+                    left[i] = left[i] - p.volume
+                    loads[i].append(p)
+                    if dest != route[position - 1] and dest != route[position]:
+                        route.insert(position, dest)
+                        legs[i][position - 1:position] = [
+                            self._distance(route[position - 1], dest),
+                            self._distance(dest, route[position + 1])]
+                        length = length + best[0]
+                        insertions[i].clear()
+                new_cost = (sum(p.volume for p in new_pool), length)
+                if new_cost <= cost:
+                    accepted = accepted + 1
+                    cost = new_cost
+                    pool = new_pool
+                    for i in saved:
+                        trucks[i].route = list(routes[i])
+                        trucks[i].left_capacity = left[i]
+                        trucks[i].parcels_id = base[i][2] + \
+                            [p.parcel_id for p in loads[i]]
+                else:
+                    for i, (route, hops, capacity, load) in saved.items():
+                        routes[i], legs[i], left[i], loads[i] = \
+                            route, hops, capacity, load
+                        insertions[i].clear()
+        profiler.count('rounds', rounds)
+        profiler.count('rounds_accepted', accepted)
+        profiler.count('trucks_scanned', repaired * len(trucks))
+        return pool
+
+
+class BinPackingScheduler(Scheduler):
+    """A scheduler that treats trucks as bins and parcels as items, and packs
+    them with the first-fit decreasing or best-fit decreasing heuristic.
+
+    Parcels are processed from the largest volume to the smallest.  With
+    first fit, each parcel goes onto the first truck in the list of trucks
+    that can hold it; with best fit, onto the truck with the least left
+    capacity that can hold it, ties going to the first such truck.  Routes
+    are not considered.
+
+    === Private Attributes ===
+    _best_fit: True iff this scheduler uses best fit instead of first fit.
+    """
+    _best_fit: bool
+
+    def __init__(self, best_fit: bool = False) -> None:
+        """Initialize a first-fit decreasing scheduler or, if <best_fit>, a
+        best-fit decreasing scheduler.
+        """
+        self._best_fit = best_fit
+
+    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> by first fit
+        or best fit decreasing, in O(n log n) time for n parcels and trucks.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 6, 'Toronto')
+        >>> parcels = [Parcel(1, 4, 'Toronto', 'London'),
+        ...            Parcel(2, 5, 'Toronto', 'Guelph')]
+        >>> BinPackingScheduler().schedule(parcels, [t1, t2])
+        []
+        >>> t1.parcels_id, t2.parcels_id
+        ([2, 1], [])
+        >>> t3 = Truck(3, 10, 'Toronto')
+        >>> t4 = Truck(4, 6, 'Toronto')
+        >>> BinPackingScheduler(True).schedule(parcels, [t3, t4])
+        []
+        >>> t3.parcels_id, t4.parcels_id
+        ([1], [2])
+        """
+        profiler = profiler_for(self.profiler, verbose)
+        with profiler.phase('order'):
+            if isinstance(parcels, ParcelTable):
+                ordered = map(parcels.__getitem__,
+                              parcels.argsort('volume', True))
+            else:
+                ordered = sorted(parcels, key=_neg_volume_key)
+        unscheduled = []
+        with profiler.phase('index'):
+            if self._best_fit:
+                index = TruckIndex(trucks, by_destination=False)
+                find = index.best_truck
+            else:
+                index = FirstFitTree(trucks)
+                find = index.first_fit
+        with profiler.phase('select'):
+            for p in ordered:
+                truck = find(p)
+                if truck is None:
+                    unscheduled.append(p)
+                else:
+                    index.pack(truck, p)
+        _count_placed(profiler, len(parcels), unscheduled)
+        profiler.count('index_lookups', len(parcels))
+        return unscheduled
+
+
+def _pack_groups(ordered: Iterator[Parcel], index: TruckIndex,
+                 unscheduled: List[Parcel], profiler: Profiler) -> int:
+    """Pack the parcels in <ordered> onto the trucks in <index> in groups,
+    as GreedyScheduler does in batch packing mode, and append the parcels
+    that fit on no truck to <unscheduled>.  Count the groups in <profiler>,
+    and return the number of lookups in <index>.
+
+    >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 10, 'Toronto')]
+    >>> parcels = [Parcel(i, 4, 'Toronto', 'London') for i in range(5)]
+    >>> left = []
+    >>> _pack_groups(iter(parcels), TruckIndex(trucks), left, DISABLED)
+    3
+    >>> [t.parcels_id for t in trucks], [p.parcel_id for p in left]
+    ([[0, 1], [2, 3]], [4])
+    """
+    lookups = 0
+    groups = 0
+    for _, run in groupby(ordered, attrgetter('destination')):
+        group = list(run)
+        groups = groups + 1
+        # totals[i] is the volume of the first i parcels of the group.
+        totals = list(accumulate((p.volume for p in group), initial=0))
+        start = 0
+        while start < len(group):
+            truck = index.best_truck(group[start])
+            lookups = lookups + 1
+            if truck is None:
+                unscheduled.append(group[start])
+                start = start + 1
+                continue
+            end = bisect_right(totals, totals[start] + truck.left_capacity)
+            index.pack_many(truck, group[start:end - 1])
+            start = end - 1
+    profiler.count('groups', groups)
+    return lookups
+
+
+def _count_placed(profiler: Profiler, n: int,
+                  unscheduled: List[Parcel]) -> None:
+    """Count in <profiler> the parcels placed and left unscheduled, out of
+    <n> parcels of which <unscheduled> were left.
+    """
+    profiler.count('parcels_placed', n - len(unscheduled))
+    profiler.count('parcels_unscheduled', len(unscheduled))
 
 
 # Functions for the four kinds of parcel priority, and two truck priority.
@@ -216,6 +830,54 @@ def _smaller_space(a: Truck, b: Truck) -> bool:
     return a.left_capacity < b.left_capacity
 
 
+# Rank functions agreeing with the priority functions above, used by
+# PriorityQueue to compare plain values instead of calling the functions.
+def _volume_key(p: Parcel) -> int:
+    """
+    Return the rank of Parcel <p> when smaller volumes come first.
+    """
+    return p.volume
+
+
+def _neg_volume_key(p: Parcel) -> int:
+    """
+    Return the rank of Parcel <p> when larger volumes come first.
+    """
+    return -p.volume
+
+
+def _destination_key(p: Parcel) -> str:
+    """
+    Return the rank of Parcel <p> when smaller destinations come first.
+    """
+    return p.destination
+
+
+def _neg_destination_key(p: Parcel) -> Tuple[int, ...]:
+    """
+    Return the rank of Parcel <p> when larger destinations come first.
+
+    The rank is the negated code points of the destination followed by a
+    sentinel that sorts after every negated code point, so that a longer
+    name sorts before any of its prefixes.
+
+    >>> p1 = Parcel(1, 5, 'York', 'Hamilton')
+    >>> p2 = Parcel(2, 5, 'York', 'Ham')
+    >>> _neg_destination_key(p1) < _neg_destination_key(p2)
+    True
+    """
+    return tuple(-ord(c) for c in p.destination) + (1,)
+
+
+# The (priority function, rank function) pair for each parcel order.
+_PARCEL_PRIORITY = {
+    ('volume', 'non-decreasing'): (_smaller_v, _volume_key),
+    ('volume', 'non-increasing'): (_larger_v, _neg_volume_key),
+    ('destination', 'non-decreasing'): (_smaller_d, _destination_key),
+    ('destination', 'non-increasing'): (_larger_d, _neg_destination_key),
+}
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -224,7 +886,10 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': ['compare_algorithms'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'random', 'container', 'domain'],
+                                   'array', 'bisect', 'itertools',
+                                   'operator', 'random', 'time', 'container',
+                                   'distance_map', 'domain', 'instrument',
+                                   'truck_index'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
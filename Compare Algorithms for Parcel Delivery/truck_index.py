@@ -0,0 +1,333 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from bisect import bisect_left, insort
+from domain import Parcel, Truck
+
+
+class TruckIndex:
+    """An index over a list of trucks for finding the best truck for a parcel.
+
+    Trucks are kept in lists sorted by their left capacity: one list for all
+    trucks, and one list for each city that is currently the last stop (before
+    returning to the depot) of some truck.  Finding the best truck with
+    enough capacity for a parcel is a binary search, and packing a parcel
+    through the index moves the truck to its new place in the lists.
+
+    The best truck is the one with the least (or, if <largest_first>, the
+    most) left capacity among the trucks that can hold the parcel, preferring
+    trucks whose last stop is the parcel's destination if <by_destination>.
+    Ties are broken in favour of the truck that comes first in the list of
+    trucks.
+
+    === Private Attributes ===
+    _trucks:
+      The indexed trucks, in their original order.
+    _largest_first:
+      True iff trucks with more left capacity are preferred.
+    _by_destination:
+      True iff trucks whose last stop is a parcel's destination are preferred
+      for that parcel.
+    _entries:
+      The entry (left capacity, rank) of every truck, sorted.  The rank of
+      the truck at position i in <_trucks> is i, or -i if <_largest_first>.
+    _by_dest:
+      For each city, the sorted entries of the trucks whose last stop is that
+      city.
+    _keys:
+      The current entry of each truck, by position in <_trucks>.
+    _positions:
+      The position in <_trucks> of each truck, by truck ID.
+
+    === Representation Invariants ===
+    - <_entries> and every list in <_by_dest> are sorted.
+    - every truck is in <_entries> and in <_by_dest>[truck.route[-2]], with
+      the entry stored in <_keys>.
+    """
+    _trucks: List[Truck]
+    _largest_first: bool
+    _by_destination: bool
+    _entries: List[Tuple[int, int]]
+    _by_dest: Dict[str, List[Tuple[int, int]]]
+    _keys: List[Tuple[int, int]]
+    _positions: Dict[int, int]
+
+    def __init__(self, trucks: List[Truck], largest_first: bool = False,
+                 by_destination: bool = True) -> None:
+        """Initialize an index over <trucks>.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 20, 'Toronto')
+        >>> index = TruckIndex([t1, t2])
+        >>> len(index)
+        2
+        """
+        self._trucks = list(trucks)
+        self._largest_first = largest_first
+        self._by_destination = by_destination
+        self._keys = []
+        self._positions = {}
+        self._by_dest = {}
+        sign = -1 if largest_first else 1
+        for i, truck in enumerate(self._trucks):
+            key = (truck.left_capacity, sign * i)
+            self._keys.append(key)
+            self._positions[truck.truck_id] = i
+            self._by_dest.setdefault(truck.route[-2], []).append(key)
+        self._entries = sorted(self._keys)
+        for entries in self._by_dest.values():
+            entries.sort()
+
+    def __len__(self) -> int:
+        """Return the number of trucks in this index.
+        """
+        return len(self._trucks)
+
+    def _best_in(self, entries: List[Tuple[int, int]],
+                 volume: int) -> Optional[Truck]:
+        """Return the best truck among the sorted <entries> that has at least
+        <volume> left capacity, or None if there is no such truck.
+        """
+        if not entries:
+            return None
+        if self._largest_first:
+            capacity, rank = entries[-1]
+            if capacity < volume:
+                return None
+            return self._trucks[-rank]
+        i = bisect_left(entries, (volume, -1))
+        if i == len(entries):
+            return None
+        return self._trucks[entries[i][1]]
+
+    def best_truck(self, parcel: Parcel) -> Optional[Truck]:
+        """Return the best truck for <parcel>, or None if no truck has enough
+        capacity left for it.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 20, 'Toronto')
+        >>> t3 = Truck(3, 30, 'Toronto')
+        >>> index = TruckIndex([t1, t2, t3])
+        >>> index.best_truck(Parcel(1, 15, 'Toronto', 'London')).truck_id
+        2
+        >>> index.pack(t3, Parcel(2, 5, 'Toronto', 'London'))
+        True
+        >>> index.best_truck(Parcel(3, 15, 'Toronto', 'London')).truck_id
+        3
+        >>> index.best_truck(Parcel(4, 50, 'Toronto', 'London')) is None
+        True
+        """
+        volume = parcel.volume
+        truck = None
+        if self._by_destination:
+            entries = self._by_dest.get(parcel.destination)
+            truck = self._best_in(entries, volume) if entries else None
+        if truck is None:
+            truck = self._best_in(self._entries, volume)
+        return truck
+
+    def pack(self, truck: Truck, parcel: Parcel) -> bool:
+        """Pack <parcel> onto <truck> and move <truck> to its new place in
+        the index.  Return the result of <truck>.pack(<parcel>).
+
+        Precondition: <truck> is in this index.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> index = TruckIndex([t1])
+        >>> index.pack(t1, Parcel(1, 4, 'Toronto', 'London'))
+        True
+        >>> t1.left_capacity
+        6
+        >>> index.best_truck(Parcel(2, 7, 'Toronto', 'London')) is None
+        True
+        """
+        i = self._positions[truck.truck_id]
+        old_dest = truck.route[-2]
+        result = truck.pack(parcel)
+        if result:
+            self._move(i, old_dest)
+        return result
+
+    def pack_many(self, truck: Truck, parcels: List[Parcel]) -> bool:
+        """Pack all of <parcels> onto <truck> at once and move <truck> to its
+        new place in the index once.  Return the result of
+        <truck>.pack_many(<parcels>).
+
+        Precondition: <truck> is in this index.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> index = TruckIndex([t1, t2])
+        >>> index.pack_many(t1, [Parcel(1, 4, 'Toronto', 'London'),
+        ...                      Parcel(2, 3, 'Toronto', 'London')])
+        True
+        >>> index.best_truck(Parcel(3, 3, 'Toronto', 'London')).truck_id
+        1
+        >>> index.best_truck(Parcel(4, 3, 'Toronto', 'Guelph')).truck_id
+        1
+        """
+        i = self._positions[truck.truck_id]
+        old_dest = truck.route[-2]
+        result = truck.pack_many(parcels)
+        if result:
+            self._move(i, old_dest)
+        return result
+
+    def _move(self, i: int, old_dest: str) -> None:
+        """Move the truck at position <i> in <self>._trucks, whose last stop
+        was <old_dest>, to its place in the lists for its current left
+        capacity and last stop.
+        """
+        truck = self._trucks[i]
+        key = self._keys[i]
+        _discard(self._entries, key)
+        _discard(self._by_dest[old_dest], key)
+        key = (truck.left_capacity, key[1])
+        self._keys[i] = key
+        insort(self._entries, key)
+        insort(self._by_dest.setdefault(truck.route[-2], []), key)
+
+
+class FirstFitTree:
+    """An index over a list of trucks for finding the first truck in the list
+    with enough left capacity for a parcel.
+
+    The index is a segment tree: a complete binary tree stored in a list,
+    whose leaves are the left capacities of the trucks, in order, and whose
+    other nodes hold the largest left capacity below them.  Finding the first
+    truck that fits goes down from the root, and packing a parcel updates the
+    path back up, both in O(log n) time.
+
+    === Private Attributes ===
+    _trucks:
+      The indexed trucks, in their original order.
+    _size:
+      The number of leaves, a power of two no less than len(<_trucks>).
+    _tree:
+      The nodes of the tree.  The root is at index 1, the children of node i
+      are at 2 * i and 2 * i + 1, and the leaf of the truck at position i in
+      <_trucks> is at <_size> + i.  Leaves without a truck hold -1.
+    _positions:
+      The position in <_trucks> of each truck, by truck ID.
+
+    === Representation Invariants ===
+    - every node that is not a leaf holds the larger value of its children.
+    """
+    _trucks: List[Truck]
+    _size: int
+    _tree: List[int]
+    _positions: Dict[int, int]
+
+    def __init__(self, trucks: List[Truck]) -> None:
+        """Initialize an index over <trucks>.
+
+        >>> tree = FirstFitTree([Truck(1, 10, 'Toronto')])
+        >>> len(tree)
+        1
+        """
+        self._trucks = list(trucks)
+        self._size = 1
+        while self._size < len(self._trucks):
+            self._size = self._size * 2
+        self._tree = [-1] * (2 * self._size)
+        self._positions = {}
+        for i, truck in enumerate(self._trucks):
+            self._tree[self._size + i] = truck.left_capacity
+            self._positions[truck.truck_id] = i
+        for i in range(self._size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    def __len__(self) -> int:
+        """Return the number of trucks in this index.
+        """
+        return len(self._trucks)
+
+    def first_fit(self, parcel: Parcel) -> Optional[Truck]:
+        """Return the first truck with enough left capacity for <parcel>, or
+        None if there is no such truck.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 20, 'Toronto')
+        >>> tree = FirstFitTree([t1, t2])
+        >>> tree.first_fit(Parcel(1, 15, 'Toronto', 'London')).truck_id
+        2
+        >>> tree.first_fit(Parcel(2, 5, 'Toronto', 'London')).truck_id
+        1
+        >>> tree.first_fit(Parcel(3, 25, 'Toronto', 'London')) is None
+        True
+        """
+        tree = self._tree
+        volume = parcel.volume
+        if tree[1] < volume:
+            return None
+        i = 1
+        while i < self._size:
+            i = 2 * i if tree[2 * i] >= volume else 2 * i + 1
+        return self._trucks[i - self._size]
+
+    def pack(self, truck: Truck, parcel: Parcel) -> bool:
+        """Pack <parcel> onto <truck> and update its left capacity in the
+        index.  Return the result of <truck>.pack(<parcel>).
+
+        Precondition: <truck> is in this index.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> tree = FirstFitTree([t1])
+        >>> tree.pack(t1, Parcel(1, 4, 'Toronto', 'London'))
+        True
+        >>> tree.first_fit(Parcel(2, 7, 'Toronto', 'London')) is None
+        True
+        """
+        result = truck.pack(parcel)
+        if result:
+            tree = self._tree
+            i = self._size + self._positions[truck.truck_id]
+            tree[i] = truck.left_capacity
+            i = i // 2
+            while i >= 1:
+                tree[i] = max(tree[2 * i], tree[2 * i + 1])
+                i = i // 2
+        return result
+
+
+def fitting(entries: List[Tuple[int, int]], volume: int,
+            largest_first: bool = False) -> Iterator[int]:
+    """Yield the position of every truck with at least <volume> left
+    capacity among the sorted <entries>, which are (left capacity, rank)
+    as in TruckIndex, best first: in the order that TruckIndex prefers them.
+
+    <entries> must not change while the positions are being yielded.
+
+    >>> entries = [(10, 0), (20, 2), (30, 1)]
+    >>> list(fitting(entries, 15))
+    [2, 1]
+    >>> list(fitting([(10, 0), (20, -2), (30, -1)], 15, True))
+    [1, 2]
+    """
+    if largest_first:
+        for k in range(len(entries) - 1, -1, -1):
+            capacity, rank = entries[k]
+            if capacity < volume:
+                return
+            yield -rank
+    else:
+        for k in range(bisect_left(entries, (volume, -1)), len(entries)):
+            yield entries[k][1]
+
+
+def _discard(entries: List[Tuple[int, int]], key: Tuple[int, int]) -> None:
+    """Remove <key> from the sorted list <entries>.
+
+    Precondition: <key> is in <entries>.
+    """
+    del entries[bisect_left(entries, key)]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'bisect', 'domain'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()